@@ -0,0 +1,95 @@
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import aiohttp
+
+from benchmarks.harness import MOCK_PORT, SERVER_COMMANDS, bench_env, mock_command, running, summarize
+
+# --- Sync (gunicorn + Flask) vs Async (uvicorn + ASGI) Throughput ---
+# Starts the mock upstream, one sync and one async server pointed at it, and
+# drives /weather with unique city names so that every request misses the
+# caches and has to wait on both upstream calls.
+#
+#     python -m benchmarks.async_vs_sync --requests 2000 --concurrency 200
+
+SYNC_PORT = 8901
+ASYNC_PORT = 8902
+
+
+async def drive(base_url, total, concurrency):
+    """
+    Sends `total` /weather requests with at most `concurrency` in flight.
+    """
+    run = uuid.uuid4().hex[:8]
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(f"bench-{run}-{i}")
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async def worker():
+            nonlocal errors
+            while True:
+                try:
+                    city = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                started = time.perf_counter()
+                try:
+                    async with session.get(base_url + "/weather", params={"city": city}) as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    result = summarize(latencies, elapsed)
+    result["errors"] = errors
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sync and async serving throughput.")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=8, help="gthread threads per sync worker")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    commands = [
+        mock_command(MOCK_PORT, args.latency_ms),
+        SERVER_COMMANDS["sync"](SYNC_PORT, args.workers, args.threads),
+        SERVER_COMMANDS["async"](ASYNC_PORT, args.workers, args.threads),
+    ]
+    urls = [f"http://127.0.0.1:{port}/" for port in (MOCK_PORT, SYNC_PORT, ASYNC_PORT)]
+    with bench_env() as env, running(*commands, env=env, ready_urls=urls):
+        results = {
+            "config": vars(args),
+            "sync": asyncio.run(drive(f"http://127.0.0.1:{SYNC_PORT}", args.requests, args.concurrency)),
+            "async": asyncio.run(drive(f"http://127.0.0.1:{ASYNC_PORT}", args.requests, args.concurrency)),
+        }
+
+    print(f"{'mode':<6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for mode in ("sync", "async"):
+        r = results[mode]
+        print(f"{mode:<6} {r['throughput_rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {r['errors']:>7}")
+    if args.json:
+        with open(args.json, "w") as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import argparse
+import json
+import time
+
+from benchmarks.mock_upstream import fake_current, fake_location, fake_series
+from forecast_series import DAILY_VARIABLES, HOURLY_VARIABLES
+from json_codec import JSONCodec
+from weather_core import Location, Weather
+
+# --- JSON Codec Cost ---
+# Times the JSON work of a request with each installed library: parsing the
+# upstream replies WeatherPy receives, shaped like real Open-Meteo ones (units
+# and metadata included, not just the fields read), and encoding the responses
+# it sends. The "baseline" column is the path before json_codec: a full
+# json.loads (what response.json() did) and json.dumps(...).encode(); "auto"
+# is the default setting.
+#
+#     python -m benchmarks.codec_cost
+#     python -m benchmarks.codec_cost --cities 1000 --chunk 100 --days 16
+
+LIBRARIES = ("stdlib", "orjson", "msgspec", "auto")   # WEATHERPY_JSON settings
+
+
+def geocode_reply(name):
+    result = dict(fake_location(name), id=2988507, elevation=42.0, feature_code="PPLC", country_code="FR",
+                  admin1_id=3012874, admin2_id=2968815, timezone="Europe/Paris", country_id=3017382,
+                  admin2="Paris", postcodes=["75001", "75002", "75003", "75004", "75005", "75006"])
+    return {"results": [result], "generationtime_ms": 0.87}
+
+
+def forecast_reply(latitude, longitude, extra):
+    reply = {"latitude": latitude, "longitude": longitude, "generationtime_ms": 0.04, "utc_offset_seconds": 0,
+             "timezone": "GMT", "timezone_abbreviation": "GMT", "elevation": 38.0}
+    reply.update(extra)
+    return reply
+
+
+def current_reply(latitude, longitude):
+    units = {"time": "iso8601", "interval": "seconds", "temperature_2m": "°C", "relative_humidity_2m": "%",
+             "weather_code": "wmo code", "wind_speed_10m": "m/s"}
+    return forecast_reply(latitude, longitude, {"current_units": units, "current": fake_current(latitude, longitude)})
+
+
+def series_reply(days):
+    series = fake_series(48.85, 2.35, HOURLY_VARIABLES, DAILY_VARIABLES, days)
+    units = {"hourly_units": dict.fromkeys(("time",) + tuple(HOURLY_VARIABLES), "unit"),
+             "daily_units": dict.fromkeys(("time",) + tuple(DAILY_VARIABLES), "unit")}
+    return forecast_reply(48.85, 2.35, dict(series, **units))
+
+
+def weather_dict(name):
+    location = fake_location(name)
+    weather = Weather.from_current(Location(location["name"], location["latitude"], location["longitude"]),
+                                   fake_current(location["latitude"], location["longitude"]))
+    return weather.as_dict()
+
+
+# --- Cases ---
+# Each case is (kind, label, data, baseline function, JSONCodec method, part of
+# a /weather miss); a /weather miss parses one geocoding and one forecast reply
+# and encodes one response.
+
+def cases(cities, chunk, days):
+    geocode = json.dumps(geocode_reply("paris")).encode("utf-8")
+    current = json.dumps(current_reply(48.85, 2.35)).encode("utf-8")
+    batch = json.dumps([current_reply(i * 0.1, i * 0.2) for i in range(chunk)]).encode("utf-8")
+    series = json.dumps(series_reply(days)).encode("utf-8")
+    weather = weather_dict("paris")
+    results = {"results": [{"query": f"city {i}", "weather": weather_dict(f"city {i}")} for i in range(cities)]}
+
+    def old_batch(data):
+        payload = json.loads(data)
+        return [item.get('current', {}) for item in payload]
+
+    return [
+        ("decode", f"geocode reply ({len(geocode)} B)", geocode,
+         lambda data: json.loads(data).get('results'), "decode_locations", True),
+        ("decode", f"current reply ({len(current)} B)", current,
+         lambda data: json.loads(data).get('current', {}), "decode_current", True),
+        ("decode", f"{chunk}-location reply ({len(batch) // 1000} kB)", batch, old_batch, "decode_current_many", False),
+        ("decode", f"{days}-day series ({len(series) // 1000} kB)", series, json.loads, "decode_series", False),
+        ("encode", "/weather response", weather, lambda value: json.dumps(value).encode("utf-8"), "dumps", True),
+        ("encode", f"/weather/batch, {cities} cities", results,
+         lambda value: json.dumps(value).encode("utf-8"), "dumps", False),
+    ]
+
+
+def per_call(function, data, budget):
+    """
+    Microseconds per call, best of three runs of about `budget` seconds each.
+    """
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            function(data)
+        elapsed = time.perf_counter() - started
+        if elapsed >= budget / 10:
+            break
+        number *= 4
+    number = max(1, int(number * budget / elapsed))
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(number):
+            function(data)
+        best = min(best, (time.perf_counter() - started) / number)
+    return best * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time JSON decoding and encoding per request for each library.")
+    parser.add_argument("--cities", type=int, default=1000, help="cities in the batch response")
+    parser.add_argument("--chunk", type=int, default=100, help="locations per multi-location upstream reply")
+    parser.add_argument("--days", type=int, default=16, help="days of hourly and daily series")
+    parser.add_argument("--budget", type=float, default=0.2, help="seconds per measurement")
+    args = parser.parse_args()
+
+    codecs = {}
+    for library in LIBRARIES:
+        try:
+            codecs[library] = JSONCodec(library)
+        except ImportError:
+            pass
+    columns = ["baseline"] + [f"{library}{' (typed)' if codec.get_stats()['typed_decoding'] else ''}"
+                              for library, codec in codecs.items()]
+    print(f"{'microseconds per call':<36}" + "".join(f"{column:>18}" for column in columns))
+    totals = [0.0] * len(columns)
+    for kind, label, data, baseline, method, in_miss in cases(args.cities, args.chunk, args.days):
+        timings = [per_call(baseline, data, args.budget)]
+        timings += [per_call(getattr(codec, method), data, args.budget) for codec in codecs.values()]
+        if in_miss:
+            totals = [total + timing for total, timing in zip(totals, timings)]
+        print(f"{kind + ' ' + label:<36}" + "".join(f"{timing:>18.1f}" for timing in timings))
+    print(f"{'/weather miss total':<36}" + "".join(f"{total:>18.1f}" for total in totals))
+
+
+if __name__ == "__main__":
+    main()
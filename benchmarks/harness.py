@@ -0,0 +1,134 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+
+# --- Shared Benchmark Plumbing ---
+# Starting the mock upstream and the servers under test, waiting for them, and
+# summarising latencies.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MOCK_PORT = 8900
+
+SERVER_COMMANDS = {
+    "sync": lambda port, workers, threads: [
+        sys.executable, "-m", "gunicorn", "-k", "gthread", "-w", str(workers),
+        "--threads", str(threads), "-b", f"127.0.0.1:{port}", "weather_webApp:app"],
+    "async": lambda port, workers, threads: [
+        sys.executable, "-m", "uvicorn", "weather_asgi:app", "--port", str(port),
+        "--workers", str(workers), "--log-level", "warning"],
+    # Production profile: worker class, count and threads are autotuned.
+    "serve": lambda port, workers, threads: [sys.executable, "serve.py", "--bind", f"127.0.0.1:{port}"],
+}
+
+
+def start(cmd, env):
+    return subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(url, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1.0).read()
+            return
+        except urllib.error.HTTPError:
+            return  # any HTTP answer means the server is up
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def get_json(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5.0) as response:
+            return json.load(response)
+    except (OSError, ValueError):
+        return None
+
+
+@contextmanager
+def bench_env(mock_port=MOCK_PORT, **extra):
+    """
+    Environment pointing the app at the mock upstream with a private geocache.
+    Every file the servers write (history, prefetch state, snapshot, traces)
+    goes to the same temporary directory, not the checkout they run in; the
+    directory is removed on exit, so stop the servers first. The mock has no
+    rate limit, so the upstream governor is off unless a benchmark passes
+    WEATHERPY_UPSTREAM_RATE.
+    """
+    with tempfile.TemporaryDirectory(prefix="weatherpy-bench-") as tmp:
+        env = dict(os.environ,
+                   WEATHERPY_GEOCODING_URL=f"http://127.0.0.1:{mock_port}/v1/search",
+                   WEATHERPY_FORECAST_URL=f"http://127.0.0.1:{mock_port}/v1/forecast",
+                   WEATHERPY_STATE_DIR=tmp,
+                   WEATHERPY_GEOCACHE_DB=os.path.join(tmp, "geocache.sqlite3"),
+                   WEATHERPY_GOVERNOR_DB=os.path.join(tmp, "governor.sqlite3"),
+                   WEATHERPY_PIDFILE=os.path.join(tmp, "gunicorn.pid"),
+                   WEATHERPY_HISTORY_DIR=os.path.join(tmp, "history"),
+                   WEATHERPY_PREFETCH_STATE=os.path.join(tmp, "prefetch.json"),
+                   WEATHERPY_SNAPSHOT=os.path.join(tmp, "snapshot"),
+                   WEATHERPY_TRACE_FILE=os.path.join(tmp, "traces.jsonl"),
+                   WEATHERPY_UPSTREAM_RATE="0")
+        env.update({key: str(value) for key, value in extra.items()})
+        yield env
+
+
+def mock_command(port=MOCK_PORT, latency_ms=50.0, error_rate=0.0, payload_bytes=0, jitter_ms=0.0):
+    return [sys.executable, "-m", "benchmarks.mock_upstream", "--port", str(port),
+            "--latency-ms", str(latency_ms), "--jitter-ms", str(jitter_ms),
+            "--error-rate", str(error_rate), "--payload-bytes", str(payload_bytes)]
+
+
+@contextmanager
+def running(*commands, env, ready_urls):
+    """
+    Starts the given commands, waits until every URL answers, and stops
+    them all on exit.
+    """
+    processes = [start(cmd, env) for cmd in commands]
+    try:
+        for url in ready_urls:
+            wait_ready(url)
+        yield processes
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed):
+    """
+    Throughput and latency percentiles (milliseconds) for a list of seconds.
+    """
+    latencies = sorted(latencies)
+    return {
+        "completed": len(latencies),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
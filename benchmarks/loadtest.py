@@ -0,0 +1,218 @@
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import sys
+import time
+import uuid
+
+import aiohttp
+
+from benchmarks.harness import (MOCK_PORT, SERVER_COMMANDS, bench_env, get_json, git_revision,
+                                mock_command, running, summarize)
+
+# --- Load Test ---
+# Drives a WeatherPy server at fixed request rates (open loop: requests are
+# sent on schedule whether or not earlier ones have finished, and latency is
+# measured from the scheduled send time), then reports throughput, latency
+# percentiles, upstream call counts from the mock and cache hit ratios from
+# the server's /stats. Results are written as JSON so runs can be compared
+# across releases.
+#
+#     python -m benchmarks.loadtest --server sync --scenario weather --rates 50 100 200
+#     python -m benchmarks.loadtest --target http://127.0.0.1:5000 --rates 20
+#     python -m benchmarks.loadtest ... --json new.json --compare baseline.json
+
+SERVER_PORT = 8910
+
+
+class Scenario:
+    """
+    Produces request paths. Cities are drawn from a fixed pool with a Zipf-like
+    skew, so popular cities repeat (and hit the caches) like real traffic.
+    """
+
+    def __init__(self, name, cities=500, skew=1.1, batch_size=50):
+        self.name = name
+        self.batch_size = batch_size
+        run = uuid.uuid4().hex[:6]
+        self.pool = [f"load-{run}-{i}" for i in range(cities)]
+        self.cum_weights = list(itertools.accumulate(1.0 / (i + 1) ** skew for i in range(cities)))
+        self.unique = itertools.count()
+        self.run = run
+
+    def pick(self, k=1):
+        return random.choices(self.pool, cum_weights=self.cum_weights, k=k)
+
+    def next_request(self):
+        if self.name == "weather":
+            return "/weather", {"city": self.pick()[0]}
+        if self.name == "weather-unique":
+            return "/weather", {"city": f"unique-{self.run}-{next(self.unique)}"}
+        if self.name == "batch":
+            return "/weather/batch", {"cities": ",".join(self.pick(self.batch_size))}
+        if self.name == "suggest":
+            city = self.pick()[0]
+            return "/suggest", {"q": city[:random.randint(2, len(city))]}
+        raise ValueError(f"Unknown scenario {self.name!r}")
+
+
+SCENARIOS = ("weather", "weather-unique", "batch", "suggest")
+
+
+async def run_step(base_url, scenario, rate, duration, timeout):
+    """
+    Sends requests at `rate` per second for `duration` seconds.
+    """
+    total = max(1, int(rate * duration))
+    latencies = []
+    statuses = {}
+    errors = 0
+    loop = asyncio.get_running_loop()
+
+    connector = aiohttp.TCPConnector(limit=0)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        async def one(scheduled, path, params):
+            nonlocal errors
+            try:
+                async with session.get(base_url + path, params=params) as response:
+                    await response.read()
+                    statuses[response.status] = statuses.get(response.status, 0) + 1
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                errors += 1
+                return
+            latencies.append(loop.time() - scheduled)
+
+        tasks = []
+        started = loop.time()
+        for i in range(total):
+            scheduled = started + i / rate
+            delay = scheduled - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            path, params = scenario.next_request()
+            tasks.append(asyncio.create_task(one(scheduled, path, params)))
+        await asyncio.gather(*tasks)
+        elapsed = loop.time() - started
+
+    result = summarize(latencies, elapsed)
+    result.update({"target_rps": rate, "sent": total, "errors": errors,
+                   "status_counts": {str(code): count for code, count in sorted(statuses.items())}})
+    return result
+
+
+def hit_ratio(before, after, section):
+    """
+    Hit ratio of a cache section between two /stats snapshots.
+    """
+    if not before or not after or section not in after:
+        return None
+    b, a = before.get(section, {}), after[section]
+    hits = a.get("hits", 0) - b.get("hits", 0) + a.get("stale", 0) - b.get("stale", 0)
+    misses = a.get("misses", 0) - b.get("misses", 0)
+    return round(hits / (hits + misses), 4) if hits + misses else None
+
+
+def run_all(args, base_url, mock_url):
+    steps = []
+    for rate in args.rates:
+        scenario = Scenario(args.scenario, cities=args.cities, skew=args.skew, batch_size=args.batch_size)
+        if mock_url:
+            get_json(mock_url + "/__reset")
+        stats_before = get_json(base_url + "/stats")
+        result = asyncio.run(run_step(base_url, scenario, rate, args.duration, args.timeout))
+        stats_after = get_json(base_url + "/stats")
+
+        upstream = get_json(mock_url + "/__stats") if mock_url else None
+        if upstream is not None:
+            calls = sum(upstream.values())
+            result["upstream_calls"] = upstream
+            result["upstream_calls_per_request"] = round(calls / result["sent"], 4)
+        result["cache_hit_ratio"] = {
+            "geocode": hit_ratio(stats_before, stats_after, "geocode_cache"),
+            "forecast": hit_ratio(stats_before, stats_after, "forecast_cache"),
+        }
+        steps.append(result)
+        print(f"{rate:>7} rps -> {result['throughput_rps']:>7} rps  p50 {result['p50_ms']:>7} ms  "
+              f"p95 {result['p95_ms']:>7} ms  p99 {result['p99_ms']:>7} ms  errors {result['errors']}",
+              file=sys.stderr)
+    return steps
+
+
+def compare(baseline, current, tolerance):
+    """
+    Returns human-readable regressions between two result files, matched by rate.
+    """
+    problems = []
+    old_steps = {step["target_rps"]: step for step in baseline.get("steps", [])}
+    for step in current["steps"]:
+        old = old_steps.get(step["target_rps"])
+        if old is None:
+            continue
+        if step["p99_ms"] > old["p99_ms"] * (1 + tolerance):
+            problems.append(f"{step['target_rps']} rps: p99 {old['p99_ms']} -> {step['p99_ms']} ms")
+        if step["throughput_rps"] < old["throughput_rps"] * (1 - tolerance):
+            problems.append(f"{step['target_rps']} rps: throughput {old['throughput_rps']} -> {step['throughput_rps']}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fixed-rate load test for the WeatherPy servers.")
+    parser.add_argument("--server", choices=sorted(SERVER_COMMANDS), default="sync",
+                        help="server to start against the mock upstream")
+    parser.add_argument("--target", help="URL of an already running server (skips starting one)")
+    parser.add_argument("--mock-url", help="mock upstream URL when using --target")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="weather")
+    parser.add_argument("--rates", type=float, nargs="+", default=[25, 50, 100])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per rate step")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--cities", type=int, default=500, help="size of the city pool")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of city popularity")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="mock upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--payload-bytes", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline JSON file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    report = {
+        "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "revision": git_revision()},
+        "config": vars(args),
+    }
+    if args.target:
+        report["steps"] = run_all(args, args.target.rstrip("/"), args.mock_url)
+    else:
+        base_url = f"http://127.0.0.1:{SERVER_PORT}"
+        mock_url = f"http://127.0.0.1:{MOCK_PORT}"
+        commands = [
+            mock_command(MOCK_PORT, args.latency_ms, args.error_rate, args.payload_bytes, args.jitter_ms),
+            SERVER_COMMANDS[args.server](SERVER_PORT, args.workers, args.threads),
+        ]
+        with bench_env() as env, running(*commands, env=env, ready_urls=[mock_url + "/", base_url + "/"]):
+            report["steps"] = run_all(args, base_url, mock_url)
+
+    output = json.dumps(report, indent=2)
+    if args.json:
+        with open(args.json, "w") as handle:
+            handle.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as handle:
+            problems = compare(json.load(handle), report, args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}", file=sys.stderr)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import zlib
+from urllib.parse import parse_qs
+
+# --- Local Open-Meteo Stand-in ---
+# A tiny ASGI app that mimics the geocoding and forecast endpoints with a
+# configurable delay, error rate and payload size, so benchmarks never touch
+# the real API. Per-endpoint call counts are served on /__stats.
+#
+#     python -m benchmarks.mock_upstream --port 8900 --latency-ms 50 \
+#         --jitter-ms 10 --error-rate 0.01 --payload-bytes 2048
+#
+# Point the app at it with:
+#     WEATHERPY_GEOCODING_URL=http://127.0.0.1:8900/v1/search
+#     WEATHERPY_FORECAST_URL=http://127.0.0.1:8900/v1/forecast
+
+
+def fake_location(name):
+    """
+    Deterministic coordinates for a name, spread over the globe so that
+    different names land in different forecast grid cells.
+    """
+    h = zlib.crc32(name.casefold().encode("utf-8"))
+    latitude = round((h % 120000) / 1000.0 - 60.0, 4)
+    longitude = round(((h // 120000) % 360000) / 1000.0 - 180.0, 4)
+    return {
+        "name": name.title(),
+        "latitude": latitude,
+        "longitude": longitude,
+        "country": "Mockland",
+        "admin1": "Bench",
+        "population": h % 5000000,
+    }
+
+
+def fake_current(latitude, longitude):
+    """
+    Conditions for the current 15-minute slot; they change from slot to slot.
+    """
+    slot = int(time.time()) // 900 * 900
+    h = zlib.crc32(f"{latitude:.2f},{longitude:.2f},{slot}".encode("ascii"))
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M", time.gmtime(slot)),
+        "interval": 900,
+        "temperature_2m": round((h % 500) / 10.0 - 10.0, 1),
+        "relative_humidity_2m": h % 100,
+        "weather_code": (0, 1, 2, 3, 45, 61, 71, 95)[h % 8],
+        "wind_speed_10m": round((h % 200) / 10.0, 1),
+    }
+
+
+SERIES_START = 1704067200  # 2024-01-01T00:00Z
+
+
+def fake_value(name, step, base):
+    """
+    A plausible value for a variable at hour `step`: daily cycles for
+    temperature, humidity and wind, occasional precipitation.
+    """
+    cycle = math.sin(2 * math.pi * ((step % 24) - 9) / 24)
+    if name.startswith("temperature"):
+        return round(base % 30 - 5 + 6 * cycle, 1)
+    if name.startswith("relative_humidity"):
+        return int(60 - 25 * cycle + base % 10)
+    if name.startswith("wind_speed"):
+        return round(2 + (base + step) % 8 + cycle, 1)
+    if name.startswith("precipitation"):
+        return round(((base + step * 7) % 13) / 10.0, 1) if (base + step) % 5 == 0 else 0.0
+    if name == "weather_code":
+        return (0, 1, 2, 3, 45, 61, 71, 95)[(base + step // 6) % 8]
+    return round((base + step) % 100 / 10.0, 1)
+
+
+def fake_series(latitude, longitude, hourly, daily, days):
+    """
+    Hourly and daily blocks shaped like an Open-Meteo `timeformat=unixtime` response.
+    """
+    base = zlib.crc32(f"{latitude:.2f},{longitude:.2f}".encode("ascii")) % 1000
+    payload = {"utc_offset_seconds": 0, "timezone": "GMT"}
+    if hourly:
+        steps = range(days * 24)
+        block = {"time": [SERIES_START + 3600 * step for step in steps]}
+        for name in hourly:
+            block[name] = [fake_value(name, step, base) for step in steps]
+        payload["hourly"] = block
+    if daily:
+        block = {"time": [SERIES_START + 86400 * day for day in range(days)]}
+        for name in daily:
+            if name.endswith("_max"):
+                block[name] = [max(fake_value(name[:-4], day * 24 + h, base) for h in range(24)) for day in range(days)]
+            elif name.endswith("_min"):
+                block[name] = [min(fake_value(name[:-4], day * 24 + h, base) for h in range(24)) for day in range(days)]
+            elif name.endswith("_sum"):
+                block[name] = [round(sum(fake_value(name[:-4], day * 24 + h, base) for h in range(24)), 1)
+                               for day in range(days)]
+            else:
+                block[name] = [fake_value(name, day * 24 + 12, base) for day in range(days)]
+        payload["daily"] = block
+    return payload
+
+
+class MockUpstream:
+    """
+    ASGI app serving /v1/search and /v1/forecast, plus /__stats and /__reset.
+    """
+
+    def __init__(self, latency=0.05, error_rate=0.0, payload_bytes=0, jitter=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        # Extra bytes per location, standing in for the hourly/daily arrays
+        # a real response would carry.
+        self.padding = "x" * payload_bytes
+        self.counts = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                await send({"type": message["type"] + ".complete"})
+                if message["type"] == "lifespan.shutdown":
+                    return
+        path = scope["path"]
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+
+        if path == "/__stats":
+            return await self.respond(send, 200, self.counts)
+        if path == "/__reset":
+            self.counts = {}
+            return await self.respond(send, 200, {})
+
+        self.counts[path] = self.counts.get(path, 0) + 1
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            return await self.respond(send, 503, {"error": True, "reason": "mock failure"})
+
+        if path == "/v1/search":
+            name = (query.get("name") or [""])[0]
+            if not name or name.casefold().startswith("nowhere"):
+                return await self.respond(send, 200, {"generationtime_ms": 0.1})
+            return await self.respond(send, 200, {"results": [fake_location(name)]})
+        if path == "/v1/forecast":
+            return await self.respond(send, 200, self.forecast(query))
+        return await self.respond(send, 404, {"error": True, "reason": "not found"})
+
+    def forecast(self, query):
+        latitudes = (query.get("latitude") or ["0"])[0].split(",")
+        longitudes = (query.get("longitude") or ["0"])[0].split(",")
+        hourly = [name for name in (query.get("hourly") or [""])[0].split(",") if name]
+        daily = [name for name in (query.get("daily") or [""])[0].split(",") if name]
+        days = int((query.get("forecast_days") or ["7"])[0])
+        payloads = []
+        for lat, lon in zip(latitudes, longitudes):
+            lat, lon = float(lat), float(lon)
+            payload = {"latitude": lat, "longitude": lon}
+            if "hourly" in query or "daily" in query:
+                payload.update(fake_series(lat, lon, hourly, daily, days))
+            else:
+                payload["current"] = fake_current(lat, lon)
+            if self.padding:
+                payload["padding"] = self.padding
+            payloads.append(payload)
+        # Like Open-Meteo: a single object for one location, a list for several.
+        return payloads[0] if len(payloads) == 1 else payloads
+
+    async def respond(self, send, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode("latin-1"))],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Open-Meteo APIs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="extra random latency, 0..N ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered 503")
+    parser.add_argument("--payload-bytes", type=int, default=0, help="padding added per forecast location")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    app = MockUpstream(latency=args.latency_ms / 1000.0, error_rate=args.error_rate,
+                       payload_bytes=args.payload_bytes, jitter=args.jitter_ms / 1000.0)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", backlog=4096)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from cache_backends import MemoryBackend, SQLiteBackend, TieredBackend
+from forecast_cache import RETAIN, cache_key, key_string, next_update
+from snapshot import Snapshotter, describe
+from weather_core import CURRENT_VARIABLES
+
+# --- Snapshot Restore Time ---
+# Fills a geocode and a forecast cache with synthetic entries (half each),
+# saves them as a snapshot, then times restoring that file into empty caches,
+# the way a freshly started worker does. Entries look like real ones: trimmed
+# geocoding results and `current` blocks keyed by grid cell.
+#
+#     python -m benchmarks.snapshot_restore --entries 100000
+#     python -m benchmarks.snapshot_restore --entries 100000 --sqlite   # geocode cache with an SQLite tier
+
+
+def make_caches(size, sqlite_path=None):
+    geocode = MemoryBackend(size)
+    if sqlite_path:
+        geocode = TieredBackend(geocode, SQLiteBackend(sqlite_path, "geocode_entries"))
+    return {"geocode": (geocode, 0), "forecast": (MemoryBackend(size), RETAIN)}
+
+
+def fill(caches, entries, seed=1):
+    rng = random.Random(seed)
+    now = time.time()
+    half = entries // 2
+    geocode = []
+    for i in range(half):
+        location = {"name": f"City {i}", "admin1": f"Region {i % 500}", "country": f"Country {i % 200}",
+                    "latitude": round(rng.uniform(-60, 70), 5), "longitude": round(rng.uniform(-180, 180), 5),
+                    "population": rng.randrange(1000, 10_000_000)}
+        geocode.append((f"city {i}", location, now + 30 * 24 * 3600))
+    forecast = []
+    expires = next_update(now)
+    observed = time.strftime("%Y-%m-%dT%H:%M", time.gmtime(expires - 900))
+    for i in range(entries - half):
+        key = cache_key(-89.9 + (i // 3600) * 0.1, -179.9 + (i % 3600) * 0.1, CURRENT_VARIABLES)
+        current = {"time": observed, "interval": 900, "temperature_2m": round(rng.uniform(-30, 40), 1),
+                   "relative_humidity_2m": rng.randrange(0, 101), "weather_code": rng.choice((0, 1, 2, 3, 61, 80)),
+                   "wind_speed_10m": round(rng.uniform(0, 20), 1)}
+        forecast.append((key_string(key), current, expires))
+    caches["geocode"][0].set_many(geocode)
+    caches["forecast"][0].set_many(forecast, RETAIN)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time restoring a cache snapshot into empty caches.")
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sqlite", action="store_true", help="give the geocode cache an SQLite tier")
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds; exit 1 if the median is slower")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "snapshot")
+        source = make_caches(args.entries)
+        fill(source, args.entries)
+        started = time.perf_counter()
+        saved = Snapshotter(path, caches=source).save()
+        save_seconds = time.perf_counter() - started
+        size = os.path.getsize(path)
+        with open(path, "rb") as handle:
+            info = describe(handle.read())
+
+        timings = []
+        for run in range(args.repeat):
+            sqlite_path = os.path.join(tmp, f"geocache-{run}.sqlite3") if args.sqlite else None
+            target = make_caches(args.entries, sqlite_path)
+            snapshotter = Snapshotter(path, caches=target)
+            started = time.perf_counter()
+            restored = snapshotter.load()
+            timings.append(time.perf_counter() - started)
+            if restored != saved:
+                sys.exit(f"restored {restored} of {saved} entries")
+
+    median = statistics.median(timings)
+    counts = ", ".join(f"{name} {section['entries']}" for name, section in info["caches"].items())
+    print(f"entries       {saved} ({counts})")
+    print(f"snapshot      {size / 1e6:.1f} MB, {size / saved:.0f} bytes/entry, saved in {save_seconds:.2f}s")
+    print(f"restore       median {median * 1000:.0f} ms, best {min(timings) * 1000:.0f} ms "
+          f"over {args.repeat} runs ({saved / median / 1e3:.0f}k entries/s)")
+    if median > args.budget:
+        print(f"slower than the {args.budget:.2f}s budget", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+import importlib
+import os
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from json_codec import codec
+
+# --- Cache Storage Backends ---
+# The geocode and forecast caches keep their entries, a value plus the time
+# it expires, in a backend:
+#
+#   MemoryBackend  in-process LRU; values are stored as-is
+#   SQLiteBackend  a file shared by the workers on one host
+#   RedisBackend   a Redis-protocol server shared by every node
+#   TieredBackend  an L1 (memory) in front of an L2 (SQLite or Redis)
+#
+# Backends keep an entry for `retain` seconds past its expiry, so callers can
+# still serve it stale. Shared backends store values as a compact binary
+# envelope (see encode()). With WEATHERPY_CACHE_URL=redis://host:6379/0
+# both caches put a Redis L2 behind their in-process L1, so a city looked up
+# on one node is a hit on all the others.
+
+CACHE_URL = os.environ.get("WEATHERPY_CACHE_URL", "")
+CACHE_PREFIX = os.environ.get("WEATHERPY_CACHE_PREFIX", "weatherpy:")
+CACHE_TIMEOUT = float(os.environ.get("WEATHERPY_CACHE_TIMEOUT", 0.25))   # seconds per Redis call
+SQLITE_BATCH = 500            # keys per SELECT ... IN (...)
+
+# Envelope: float64 expiry, one tag byte, payload. Tag "j" is compact JSON;
+# other tags name value types that provide to_bytes()/from_bytes(), imported
+# on first use so a node can decode values it has not produced itself.
+ENVELOPE = struct.Struct("<dc")
+JSON_TAG = b"j"
+VALUE_TYPES = {b"s": ("forecast_series", "ForecastSeries")}
+
+
+def encode(value, expires):
+    """
+    Serializes an entry for a shared backend.
+    """
+    tag = getattr(type(value), "CACHE_TAG", None)
+    if tag is None:
+        return ENVELOPE.pack(expires, JSON_TAG) + codec.dumps(value)
+    return ENVELOPE.pack(expires, tag) + value.to_bytes()
+
+
+def decode(blob):
+    """
+    Returns the (value, expires) entry held in an encoded blob.
+    """
+    expires, tag = ENVELOPE.unpack_from(blob)
+    payload = memoryview(blob)[ENVELOPE.size:]
+    if tag == JSON_TAG:
+        return codec.loads(bytes(payload)), expires
+    module, name = VALUE_TYPES[tag]
+    return getattr(importlib.import_module(module), name).from_bytes(payload), expires
+
+
+def decode_or_none(blob, stats):
+    """
+    decode() for the shared backends: a corrupt or unknown blob counts as
+    an error in `stats` and reads as a miss (None) instead of raising.
+    """
+    try:
+        return decode(blob)
+    except (struct.error, ValueError, KeyError, TypeError, AttributeError, IndexError):
+        stats["errors"] += 1
+        return None
+
+
+class MemoryBackend:
+    """
+    Bounded in-process LRU of (value, expires, keep_until) entries.
+    """
+    blocking = False   # calls never wait on I/O, so event loops may make them directly
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.time()
+        results = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    results.append(None)
+                elif entry[2] <= now:
+                    del self._entries[key]
+                    results.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    results.append(entry[:2])
+        return results
+
+    def set_many(self, items, retain=0):
+        with self._lock:
+            for key, value, expires in items:
+                self._entries[key] = (value, expires, expires + retain)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def items(self):
+        now = time.time()
+        with self._lock:
+            entries = list(self._entries.items())
+        for key, (value, expires, keep_until) in entries:
+            if keep_until > now:
+                yield key, value, expires
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[2] <= now]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_stats(self):
+        return {"entries": len(self._entries)}
+
+
+class SQLiteBackend:
+    """
+    Entries in an SQLite table, shared by every process on the host.
+    Errors, including unreadable entries, are treated as misses: this tier
+    is best effort.
+    """
+    blocking = True
+
+    def __init__(self, db_path, table):
+        self.db_path = db_path
+        self.table = table
+        self._local = threading.local()
+        self.stats = {"errors": 0}
+
+    def _connect(self):
+        # sqlite3 connections must not be shared between threads.
+        # A connection inherited across fork() (preloading servers) is not
+        # reused either. Raises sqlite3.Error, which callers count as a
+        # miss; a connection is only kept once the table is known to exist,
+        # so a locked or unwritable file is retried on the next call.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                " key TEXT PRIMARY KEY, value BLOB NOT NULL, keep_until REAL NOT NULL)"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get_many(self, keys):
+        now = time.time()
+        found = {}
+        try:
+            for start in range(0, len(keys), SQLITE_BATCH):
+                batch = keys[start:start + SQLITE_BATCH]
+                rows = self._connect().execute(
+                    f"SELECT key, value FROM {self.table} WHERE keep_until > ? AND key IN"
+                    f" ({','.join('?' * len(batch))})", (now, *batch)).fetchall()
+                found.update(rows)
+        except sqlite3.Error:
+            self.stats["errors"] += 1
+        return [decode_or_none(found[key], self.stats) if key in found else None for key in keys]
+
+    def set_many(self, items, retain=0):
+        rows = [(key, encode(value, expires), expires + retain) for key, value, expires in items]
+        conn = None
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN")
+            conn.executemany(f"INSERT OR REPLACE INTO {self.table} (key, value, keep_until) VALUES (?, ?, ?)",
+                             rows)
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            self.stats["errors"] += 1
+            if conn is not None and conn.in_transaction:
+                conn.execute("ROLLBACK")
+
+    def delete(self, key):
+        try:
+            self._connect().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+        except sqlite3.Error:
+            self.stats["errors"] += 1
+
+    def items(self):
+        try:
+            rows = self._connect().execute(
+                f"SELECT key, value FROM {self.table} WHERE keep_until > ?", (time.time(),)).fetchall()
+        except sqlite3.Error:
+            self.stats["errors"] += 1
+            rows = []
+        for key, blob in rows:
+            entry = decode_or_none(blob, self.stats)
+            if entry is not None:
+                yield key, entry[0], entry[1]
+
+    def purge_expired(self):
+        try:
+            self._connect().execute(f"DELETE FROM {self.table} WHERE keep_until <= ?", (time.time(),))
+        except sqlite3.Error:
+            self.stats["errors"] += 1
+
+    def get_stats(self):
+        return dict(self.stats)
+
+
+class RedisBackend:
+    """
+    Entries in a Redis-protocol server (Redis, Valkey, KeyDB, ...), shared by
+    every node. Multi-key reads are one MGET and writes are pipelined. Keys
+    expire on the server once their retention ends. Connection errors and
+    timeouts are treated as misses so a Redis outage only costs hit ratio.
+    """
+    blocking = True
+
+    def __init__(self, url=CACHE_URL, namespace="", client=None, timeout=CACHE_TIMEOUT):
+        import redis  # optional: only needed with WEATHERPY_CACHE_URL=redis://...
+
+        if client is None:
+            client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self.errors = (redis.RedisError, OSError)
+        self.client = client
+        self.prefix = f"{CACHE_PREFIX}{namespace}:"
+        self.stats = {"errors": 0, "round_trips": 0}
+
+    def get_many(self, keys):
+        if not keys:
+            return []
+        self.stats["round_trips"] += 1
+        try:
+            blobs = self.client.mget([self.prefix + key for key in keys])
+        except self.errors:
+            self.stats["errors"] += 1
+            return [None] * len(keys)
+        return [decode_or_none(blob, self.stats) if blob is not None else None for blob in blobs]
+
+    def set_many(self, items, retain=0):
+        now = time.time()
+        self.stats["round_trips"] += 1
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, value, expires in items:
+                keep_ms = int((expires + retain - now) * 1000)
+                if keep_ms > 0:
+                    pipe.set(self.prefix + key, encode(value, expires), px=keep_ms)
+            pipe.execute()
+        except self.errors:
+            self.stats["errors"] += 1
+
+    def delete(self, key):
+        try:
+            self.client.delete(self.prefix + key)
+        except self.errors:
+            self.stats["errors"] += 1
+
+    def items(self):
+        try:
+            batch = []
+            for name in self.client.scan_iter(match=self.prefix + "*", count=1000):
+                batch.append(name)
+                if len(batch) >= 1000:
+                    yield from self._items(batch)
+                    batch = []
+            yield from self._items(batch)
+        except self.errors:
+            self.stats["errors"] += 1
+
+    def _items(self, names):
+        if not names:
+            return
+        for name, blob in zip(names, self.client.mget(names)):
+            entry = decode_or_none(blob, self.stats) if blob is not None else None
+            if entry is not None:
+                key = name.decode("utf-8") if isinstance(name, bytes) else name
+                yield key[len(self.prefix):], entry[0], entry[1]
+
+    def purge_expired(self):
+        pass  # Redis expires keys itself
+
+    def get_stats(self):
+        return dict(self.stats)
+
+
+class TieredBackend:
+    """
+    An in-process L1 in front of a shared L2. Reads go to L2 only for keys
+    that L1 lacks or holds expired, in one batch, and a fresher L2 entry
+    (refreshed by another worker or node) replaces the L1 copy. Writes go to
+    both tiers.
+    """
+
+    def __init__(self, l1, l2):
+        self.l1 = l1
+        self.l2 = l2
+        self._lock = threading.Lock()
+        self.stats = {"l1_hits": 0, "l2_hits": 0, "l2_misses": 0}
+
+    @property
+    def blocking(self):
+        return self.l1.blocking or self.l2.blocking
+
+    def get_many(self, keys):
+        now = time.time()
+        results = self.l1.get_many(keys)
+        pending = [i for i, entry in enumerate(results) if entry is None or entry[1] <= now]
+        l1_hits = len(keys) - len(pending)
+        l2_hits = 0
+        if pending:
+            fills = []
+            for i, entry in zip(pending, self.l2.get_many([keys[i] for i in pending])):
+                if entry is not None and (results[i] is None or entry[1] > results[i][1]):
+                    results[i] = entry
+                    fills.append((keys[i], entry[0], entry[1]))
+                    l2_hits += 1
+            if fills:
+                self.l1.set_many(fills)
+        with self._lock:
+            self.stats["l1_hits"] += l1_hits
+            self.stats["l2_hits"] += l2_hits
+            self.stats["l2_misses"] += len(pending) - l2_hits
+        return results
+
+    def set_many(self, items, retain=0):
+        self.l1.set_many(items, retain)
+        self.l2.set_many(items, retain)
+
+    def delete(self, key):
+        self.l1.delete(key)
+        self.l2.delete(key)
+
+    def items(self):
+        return self.l2.items()
+
+    def purge_expired(self):
+        self.l1.purge_expired()
+        self.l2.purge_expired()
+
+    def __len__(self):
+        return len(self.l1)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats.update(("l1_" + key, value) for key, value in self.l1.get_stats().items())
+        stats.update(("l2_" + key, value) for key, value in self.l2.get_stats().items())
+        return stats
+
+
+def shared_backend(namespace, url=CACHE_URL):
+    """
+    The configured cross-node backend for a namespace, or None.
+    """
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url, namespace)
+    return None
+
+
+def make_backend(namespace, max_entries, local=None, url=CACHE_URL):
+    """
+    Backend for one cache: an in-process LRU, in front of Redis when
+    WEATHERPY_CACHE_URL is set, else in front of `local` (e.g. an SQLite
+    backend) if given.
+    """
+    l1 = MemoryBackend(max_entries)
+    l2 = shared_backend(namespace, url) or local
+    return TieredBackend(l1, l2) if l2 is not None else l1
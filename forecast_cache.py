@@ -0,0 +1,215 @@
+import threading
+import time
+
+from cache_backends import make_backend
+
+# --- Forecast Response Cache ---
+# Open-Meteo refreshes the `current` block every 15 minutes, so forecast
+# responses are cached per lat/lon grid cell and requested variables until the
+# next upstream update. Expired entries are still served ("stale") for a while
+# whilst a single background thread refreshes them. Entries older than that
+# count as misses but are kept for RETAIN seconds (or until evicted), so that
+# callers can still fall back to them (peek) when upstream refuses or fails
+# requests: the degraded mode, in which values are flagged as stale.
+# Entries live in a cache_backends backend: an in-process LRU, in front of a
+# shared Redis store when WEATHERPY_CACHE_URL is set, so a cell fetched by one
+# node is a hit on every other.
+
+GRID_RESOLUTION = 0.1          # degrees, roughly 11 km; finer than the models
+UPDATE_INTERVAL = 15 * 60      # upstream `current` update cadence, seconds
+UPDATE_GRACE = 30              # give upstream time to publish the new block
+MAX_STALE = 60 * 60            # how long past expiry an entry may still be served
+RETAIN = 24 * 3600             # how long past expiry an entry is kept for peek()
+DEFAULT_MAX_ENTRIES = 4096
+
+
+def grid_cell(latitude, longitude, resolution=GRID_RESOLUTION):
+    """
+    Snaps coordinates to the centre of their grid cell.
+    """
+    lat = round(round(latitude / resolution) * resolution, 4)
+    lon = round(round(longitude / resolution) * resolution, 4)
+    return lat, lon
+
+
+def cache_key(latitude, longitude, variables, resolution=GRID_RESOLUTION):
+    """
+    Builds the cache key for a forecast request: (cell_lat, cell_lon, variables).
+    """
+    lat, lon = grid_cell(latitude, longitude, resolution)
+    return lat, lon, variables
+
+
+def key_string(key):
+    """
+    Backend key for a cache key, e.g. "51.5:-0.1:temperature_2m,..." or
+    "51.5:-0.1:series/7".
+    """
+    lat, lon, variables = key
+    if isinstance(variables, tuple):
+        variables = "/".join(str(part) for part in variables)
+    return f"{lat}:{lon}:{variables}"
+
+
+def next_update(now, interval=UPDATE_INTERVAL, grace=UPDATE_GRACE):
+    """
+    Returns the timestamp at which upstream data fetched at `now` goes out of date.
+    """
+    return (int(now - grace) // interval + 1) * interval + grace
+
+
+class ForecastCache:
+    """
+    LRU cache of forecast payloads with expiry aligned to the upstream update
+    interval and stale-while-revalidate semantics.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, interval=UPDATE_INTERVAL,
+                 max_stale=MAX_STALE, backend=None):
+        self.max_entries = max_entries
+        self.interval = interval
+        self.max_stale = max_stale
+        self.backend = backend if backend is not None else make_backend("forecast", max_entries)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.stats = {
+            "hits": 0, "misses": 0, "stale": 0, "last_known": 0,
+            "refreshes": 0, "refresh_errors": 0,
+            "refresh_seconds_total": 0.0, "refresh_seconds_max": 0.0,
+        }
+
+    def _get(self, keys):
+        return self.backend.get_many([key_string(key) for key in keys])
+
+    def lookup_many(self, keys):
+        """
+        lookup() for several keys with a single backend round trip.
+        Returns a list of (value, status) in the order of `keys`.
+        """
+        now = time.time()
+        results = []
+        counts = {"hits": 0, "stale": 0, "misses": 0}
+        for entry in self._get(keys):
+            if entry is not None and now < entry[1]:
+                counts["hits"] += 1
+                results.append((entry[0], "hit"))
+            elif entry is not None and now < entry[1] + self.max_stale:
+                counts["stale"] += 1
+                results.append((entry[0], "stale"))
+            else:
+                counts["misses"] += 1
+                results.append((None, "miss"))
+        with self._lock:
+            for name, count in counts.items():
+                self.stats[name] += count
+        return results
+
+    def lookup(self, key):
+        """
+        Returns (value, status) where status is "hit", "stale" or "miss".
+        """
+        return self.lookup_many([key])[0]
+
+    def peek(self, key):
+        """
+        Returns the last value stored for `key`, however old, or None.
+        Used as a fallback when upstream cannot be reached.
+        """
+        entry = self._get([key])[0]
+        if entry is None:
+            return None
+        with self._lock:
+            self.stats["last_known"] += 1
+        return entry[0]
+
+    def warm(self, keys):
+        """
+        Loads the entries for `keys` from the shared tier into memory,
+        without counting them as lookups.
+        """
+        self._get(keys)
+
+    def store_many(self, items):
+        """
+        Stores (key, value) pairs, all expiring at the next upstream update.
+        """
+        expires = next_update(time.time(), self.interval)
+        self.backend.set_many([(key_string(key), value, expires) for key, value in items], retain=RETAIN)
+
+    def store(self, key, value):
+        self.store_many([(key, value)])
+
+    def ttl_many(self, keys):
+        """
+        ttl() for several keys with a single backend round trip.
+        """
+        now = time.time()
+        return [max(0, int(entry[1] - now)) if entry is not None else 0 for entry in self._get(keys)]
+
+    def ttl(self, key):
+        """
+        Seconds until the entry for `key` expires (0 if missing or expired).
+        """
+        return self.ttl_many([key])[0]
+
+    def claim_refresh(self, key):
+        """
+        Marks `key` as being refreshed. Returns False if a refresh is already running.
+        """
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def finish_refresh(self, key, elapsed, ok=True):
+        with self._lock:
+            self._refreshing.discard(key)
+            self.stats["refreshes"] += 1
+            if not ok:
+                self.stats["refresh_errors"] += 1
+            self.stats["refresh_seconds_total"] += elapsed
+            self.stats["refresh_seconds_max"] = max(self.stats["refresh_seconds_max"], elapsed)
+
+    def _refresh(self, key, fetch):
+        started = time.perf_counter()
+        ok = True
+        try:
+            self.store(key, fetch())
+        except Exception:
+            # Keep serving the stale value; the next request will retry.
+            ok = False
+        self.finish_refresh(key, time.perf_counter() - started, ok)
+
+    def get_or_fetch(self, key, fetch, refresh=None):
+        """
+        Returns the value for `key`. On a miss `fetch()` is called inline;
+        on a stale hit the old value is returned immediately and `refresh()`
+        (default `fetch()`) runs once in a background thread.
+        """
+        value, status = self.lookup(key)
+        if status == "hit":
+            return value
+        if status == "stale":
+            if self.claim_refresh(key):
+                threading.Thread(target=self._refresh, args=(key, refresh or fetch), daemon=True).start()
+            return value
+        value = fetch()
+        self.store(key, value)
+        return value
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["refreshing"] = len(self._refreshing)
+        stats.update(self.backend.get_stats())
+        stats["entries"] = len(self.backend)
+        lookups = stats["hits"] + stats["stale"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["stale"]) / lookups, 4) if lookups else 0.0
+        if stats["refreshes"]:
+            stats["refresh_seconds_avg"] = round(stats["refresh_seconds_total"] / stats["refreshes"], 4)
+        return stats
+
+
+# Shared instance used by the web front-end.
+forecast_cache = ForecastCache()
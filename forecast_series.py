@@ -0,0 +1,370 @@
+import array
+import math
+import struct
+import sys
+import warnings
+
+try:
+    import numpy as np  # optional: vectorised columns
+except ImportError:
+    np = None
+
+from json_codec import codec
+from weather_core import UNKNOWN_CONDITION, WMO_DESCRIPTIONS
+
+# --- Hourly and Daily Forecast Series ---
+# Hourly/daily responses carry 168+ timesteps per variable, so they are kept
+# as columns rather than lists of dicts: NumPy arrays when NumPy is installed,
+# `array` module arrays otherwise. Upstream data is always requested in metric
+# units and cached once per grid cell; unit conversion, WMO code mapping and
+# daily aggregates are whole-column operations applied per request.
+#
+# Two output formats:
+#   json    columnar: {"hourly": {"time": [...], "temperature_2m": [...]}, ...}
+#   binary  BINARY_MAGIC, uint32 header length, JSON header describing each
+#           column (series, name, dtype, offset, length), then the raw
+#           little-endian column bytes (int64 times, float32 values, NaN = null).
+
+HOURLY_VARIABLES = ('temperature_2m', 'relative_humidity_2m', 'precipitation', 'weather_code', 'wind_speed_10m')
+DAILY_VARIABLES = ('weather_code', 'temperature_2m_max', 'temperature_2m_min', 'precipitation_sum',
+                   'wind_speed_10m_max')
+# Hourly columns summarised into daily min/max/mean.
+AGGREGATED_VARIABLES = ('temperature_2m', 'relative_humidity_2m', 'wind_speed_10m')
+
+DEFAULT_DAYS = 7
+MAX_DAYS = 16
+FORMATS = ("json", "binary")
+BINARY_MAGIC = b"WPFS"
+BINARY_CONTENT_TYPE = "application/vnd.weatherpy.series"
+
+# unit system -> quantity -> (label, scale, offset) applied to metric values
+UNITS = {
+    "metric": {"temperature": ("°C", 1.0, 0.0), "wind": ("m/s", 1.0, 0.0),
+               "precipitation": ("mm", 1.0, 0.0), "humidity": ("%", 1.0, 0.0)},
+    "imperial": {"temperature": ("°F", 1.8, 32.0), "wind": ("mph", 2.2369363, 0.0),
+                 "precipitation": ("in", 1 / 25.4, 0.0), "humidity": ("%", 1.0, 0.0)},
+}
+
+# Description of every WMO code 0-99 by index, for lookups on whole columns.
+CODE_TABLE = tuple(WMO_DESCRIPTIONS.get(code, UNKNOWN_CONDITION) for code in range(100))
+
+
+def quantity(name):
+    """
+    The physical quantity of a column, which decides its unit conversion.
+    """
+    if name.startswith('temperature'):
+        return "temperature"
+    if name.startswith('wind_speed'):
+        return "wind"
+    if name.startswith('precipitation'):
+        return "precipitation"
+    if name.startswith('relative_humidity'):
+        return "humidity"
+    return None
+
+
+def series_params(latitude, longitude, days):
+    """
+    Open-Meteo query for `days` of hourly and daily data in metric units.
+    Days start at local midnight (timezone=auto), so hourly data splits into
+    whole local days.
+    """
+    return {
+        'latitude': latitude,
+        'longitude': longitude,
+        'hourly': ",".join(HOURLY_VARIABLES),
+        'daily': ",".join(DAILY_VARIABLES),
+        'forecast_days': days,
+        'timezone': 'auto',
+        'timeformat': 'unixtime',
+        'wind_speed_unit': 'ms'
+    }
+
+# --- Columns ---
+
+def to_column(values, integer=False):
+    """
+    Converts a JSON list to a column; nulls become NaN in float columns.
+    """
+    if np is not None:
+        if integer:
+            return np.asarray(values, dtype=np.int64)
+        return np.array(values, dtype=np.float64)
+    if integer:
+        return array.array('q', values)
+    return array.array('d', [math.nan if v is None else v for v in values])
+
+
+def scale(column, factor, offset):
+    if factor == 1.0 and offset == 0.0:
+        return column
+    if np is not None:
+        return column * factor + offset
+    return array.array('d', [v * factor + offset for v in column])
+
+
+def round_column(column, digits=2):
+    if np is not None:
+        return np.round(column, digits)
+    return array.array('d', [round(v, digits) for v in column])
+
+
+def present_codes(column):
+    """
+    Sorted distinct WMO codes present in a column.
+    """
+    if np is not None:
+        valid = column[~np.isnan(column)]
+        return [int(code) for code in np.unique(valid)]
+    return sorted({int(v) for v in column if v == v})
+
+
+def daily_aggregates(column, hours_per_day=24):
+    """
+    Per-day (min, max, mean) of an hourly column; partial trailing days are
+    dropped and all-NaN days yield NaN.
+    """
+    days = len(column) // hours_per_day
+    if np is not None:
+        grid = np.asarray(column[:days * hours_per_day]).reshape(days, hours_per_day)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN days
+            return np.nanmin(grid, axis=1), np.nanmax(grid, axis=1), np.nanmean(grid, axis=1)
+    mins, maxs, means = array.array('d'), array.array('d'), array.array('d')
+    for day in range(days):
+        values = [v for v in column[day * hours_per_day:(day + 1) * hours_per_day] if v == v]
+        mins.append(min(values) if values else math.nan)
+        maxs.append(max(values) if values else math.nan)
+        means.append(sum(values) / len(values) if values else math.nan)
+    return mins, maxs, means
+
+
+def column_list(column):
+    """
+    Plain list for JSON; gaps (NaN) become None, and whole-number columns
+    without gaps (codes, humidity) become ints so they serialize without a
+    trailing ".0".
+    """
+    if np is not None:
+        column = np.asarray(column)
+        if column.dtype.kind != 'f':
+            return column.tolist()
+        gaps = np.isnan(column)
+        if gaps.any():
+            return [None if gap else v for v, gap in zip(column.tolist(), gaps.tolist())]
+        if len(column) and np.array_equal(column, np.floor(column)):
+            return column.astype(np.int64).tolist()
+        return column.tolist()
+    if column.typecode != 'd':
+        return column.tolist()
+    if all(v == v and v == int(v) for v in column):
+        return [int(v) for v in column]
+    return [v if v == v else None for v in column]
+
+
+DTYPES = {'q': '<i8', 'f': '<f4', 'd': '<f8'}   # array typecode -> little-endian dtype
+
+
+def column_bytes(column, typecode):
+    """
+    Little-endian bytes of a column as int64 ('q'), float32 ('f') or
+    float64 ('d').
+    """
+    if np is not None:
+        return np.asarray(column).astype(DTYPES[typecode]).tobytes()
+    converted = array.array(typecode, column)
+    if sys.byteorder != 'little':
+        converted.byteswap()
+    return converted.tobytes()
+
+
+def _from_raw(data, typecode):
+    if np is not None:
+        return np.frombuffer(data, dtype=DTYPES[typecode]).copy()
+    column = array.array(typecode)
+    column.frombytes(bytes(data))
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column
+
+# --- Parsed Series ---
+
+class ForecastSeries:
+    """
+    Hourly and daily columns for one grid cell, in metric units.
+    """
+    __slots__ = ("utc_offset_seconds", "hourly", "daily")
+    CACHE_TAG = b"s"   # cache_backends envelope tag, see to_bytes()
+
+    def __init__(self, utc_offset_seconds, hourly, daily):
+        self.utc_offset_seconds = utc_offset_seconds
+        self.hourly = hourly
+        self.daily = daily
+
+    def converted(self, units="metric"):
+        """
+        Returns (hourly, daily, unit_labels) in the requested unit system,
+        with daily min/max/mean of the hourly variables added.
+        """
+        system = UNITS[units]
+        hourly = {}
+        for name, column in self.hourly.items():
+            hourly[name] = self._convert(name, column, system)
+        daily = {}
+        for name, column in self.daily.items():
+            daily[name] = self._convert(name, column, system)
+        for name in AGGREGATED_VARIABLES:
+            if name not in hourly:
+                continue
+            for suffix, column in zip(("_min", "_max", "_mean"), daily_aggregates(hourly[name])):
+                daily.setdefault(name + suffix, round_column(column))
+        labels = {}
+        for name in list(hourly) + list(daily):
+            kind = quantity(name)
+            if kind:
+                labels[name] = system[kind][0]
+        return hourly, daily, labels
+
+    @staticmethod
+    def _convert(name, column, system):
+        kind = quantity(name)
+        if kind is None:
+            return column
+        label, factor, offset = system[kind]
+        return round_column(scale(column, factor, offset))
+
+    def to_bytes(self):
+        """
+        Compact form for shared caches: uint32 header length, JSON header
+        listing each column (series, name, length), then the raw columns,
+        little-endian int64 times and float64 values.
+        """
+        header = {"utc_offset_seconds": self.utc_offset_seconds, "columns": []}
+        blobs = []
+        for block, columns in (("hourly", self.hourly), ("daily", self.daily)):
+            for name, column in columns.items():
+                header["columns"].append([block, name, len(column)])
+                blobs.append(column_bytes(column, 'q' if name == 'time' else 'd'))
+        header_bytes = codec.dumps(header)
+        return struct.pack("<I", len(header_bytes)) + header_bytes + b"".join(blobs)
+
+    @classmethod
+    def from_bytes(cls, data):
+        (header_size,) = struct.unpack_from("<I", data)
+        header = codec.loads(bytes(data[4:4 + header_size]))
+        offset = 4 + header_size
+        series = {"hourly": {}, "daily": {}}
+        for block, name, length in header["columns"]:
+            typecode = 'q' if name == 'time' else 'd'
+            series[block][name] = _from_raw(data[offset:offset + 8 * length], typecode)
+            offset += 8 * length
+        return cls(header["utc_offset_seconds"], series["hourly"], series["daily"])
+
+    def weather_codes(self):
+        """
+        {code: description} for every WMO code in the series.
+        """
+        codes = set()
+        for columns in (self.hourly, self.daily):
+            if 'weather_code' in columns:
+                codes.update(present_codes(columns['weather_code']))
+        return {str(code): CODE_TABLE[code] if 0 <= code < 100 else UNKNOWN_CONDITION
+                for code in sorted(codes)}
+
+
+def parse_series(payload):
+    """
+    Builds a ForecastSeries from an Open-Meteo hourly/daily response.
+    """
+    series = []
+    for block in ('hourly', 'daily'):
+        data = payload.get(block) or {}
+        columns = {}
+        for name, values in data.items():
+            columns[name] = to_column(values, integer=(name == 'time'))
+        series.append(columns)
+    return ForecastSeries(payload.get('utc_offset_seconds', 0), series[0], series[1])
+
+# --- Serialization ---
+
+def _columns_json(columns):
+    return codec.dumps({name: column_list(column) for name, column in columns.items()})
+
+
+def _header(location, series, units, labels, stale=False):
+    header = {
+        "location": {"name": location.name, "latitude": location.latitude, "longitude": location.longitude},
+        "utc_offset_seconds": series.utc_offset_seconds,
+        "units": labels,
+        "unit_system": units,
+        "weather_codes": series.weather_codes(),
+    }
+    if stale:
+        header["stale"] = True
+    return header
+
+
+def to_json(location, series, units="metric", stale=False):
+    """
+    Columnar JSON document as UTF-8 bytes.
+    """
+    hourly, daily, labels = series.converted(units)
+    header = codec.dumps(_header(location, series, units, labels, stale))
+    return b"".join((header[:-1], b',"hourly":', _columns_json(hourly), b',"daily":', _columns_json(daily), b"}"))
+
+
+def to_binary(location, series, units="metric", stale=False):
+    """
+    Binary document: magic, header length, JSON header, column bytes.
+    """
+    hourly, daily, labels = series.converted(units)
+    header = _header(location, series, units, labels, stale)
+    header["columns"] = []
+    blobs = []
+    offset = 0
+    for block, columns in (("hourly", hourly), ("daily", daily)):
+        for name, column in columns.items():
+            typecode = 'q' if name == 'time' else 'f'
+            blob = column_bytes(column, typecode)
+            blob += b"\0" * (-len(blob) % 8)  # keep every column 8-byte aligned
+            header["columns"].append({
+                "series": block, "name": name, "dtype": DTYPES[typecode],
+                "offset": offset, "length": len(column),
+            })
+            blobs.append(blob)
+            offset += len(blob)
+    header_bytes = codec.dumps(header)
+    # Pad the header so int64 columns start 8-byte aligned in the file.
+    header_bytes += b" " * (-(len(header_bytes) + 8) % 8)
+    return BINARY_MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes + b"".join(blobs)
+
+
+def serialize(location, series, units="metric", fmt="json", stale=False):
+    """
+    Returns (content_type, body) for the requested format; `stale` adds
+    "stale": true to the header (see weather_core.Forecast).
+    """
+    if fmt == "binary":
+        return BINARY_CONTENT_TYPE, to_binary(location, series, units, stale)
+    return "application/json", to_json(location, series, units, stale)
+
+
+def parse_options(days, units, fmt):
+    """
+    Validates /forecast query values (strings or None).
+    Returns (days, units, fmt, None) or (None, None, None, error_message).
+    """
+    try:
+        days = DEFAULT_DAYS if days in (None, "") else int(days)
+    except ValueError:
+        days = 0
+    if not 1 <= days <= MAX_DAYS:
+        return None, None, None, f"days must be between 1 and {MAX_DAYS}"
+    units = units or "metric"
+    if units not in UNITS:
+        return None, None, None, f"units must be one of {', '.join(UNITS)}"
+    fmt = fmt or "json"
+    if fmt not in FORMATS:
+        return None, None, None, f"format must be one of {', '.join(FORMATS)}"
+    return days, units, fmt, None
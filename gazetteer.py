@@ -0,0 +1,240 @@
+import argparse
+import heapq
+import mmap
+import os
+import struct
+import threading
+
+from geocache import normalize_name
+
+# --- Offline Gazetteer ---
+# An optional local geocoder consulted before the Open-Meteo geocoding API.
+# A GeoNames cities dump (e.g. cities15000.txt) is converted once into a
+# compact binary index which is memory-mapped at runtime, so start-up costs a
+# header read rather than parsing a large CSV.
+#
+#     python gazetteer.py build cities15000.txt --countries countryInfo.txt \
+#         --admin1 admin1CodesASCII.txt
+#
+# Index layout (little-endian):
+#   header   MAGIC, version, record count, key blob size, text blob size
+#   records  sorted by (key, -population), RECORD_FORMAT each
+#   keys     normalized UTF-8 names, concatenated
+#   texts    "name\x1fadmin1\x1fcountry", concatenated
+
+DEFAULT_PATH = os.environ.get(
+    "WEATHERPY_GAZETTEER",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.idx"),
+)
+
+MAGIC = b"WPGZ"
+VERSION = 1
+HEADER_FORMAT = "<4sIIII"
+RECORD_FORMAT = "<IHIHffI"   # key_off, key_len, text_off, text_len, lat, lon, population
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+SEPARATOR = "\x1f"
+MAX_PREFIX_SCAN = 20000
+
+
+class Gazetteer:
+    """
+    Read-only, memory-mapped city index with exact and prefix lookup.
+    The file is opened lazily on first use; if it does not exist every
+    lookup simply returns nothing.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._mm = None
+        self._opened = False
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def _open(self):
+        with self._lock:
+            if self._opened:
+                return self._mm is not None
+            self._opened = True
+            if not self.path or not os.path.exists(self.path):
+                return False
+            with open(self.path, "rb") as handle:
+                mm = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, count, key_size, text_size = struct.unpack_from(HEADER_FORMAT, mm, 0)
+            if magic != MAGIC or version != VERSION:
+                mm.close()
+                return False
+            self.count = count
+            self._keys_at = HEADER_SIZE + count * RECORD_SIZE
+            self._texts_at = self._keys_at + key_size
+            self._mm = mm
+            return True
+
+    @property
+    def available(self):
+        return self._open()
+
+    def _record(self, index):
+        return struct.unpack_from(RECORD_FORMAT, self._mm, HEADER_SIZE + index * RECORD_SIZE)
+
+    def _key(self, index):
+        key_off, key_len = struct.unpack_from("<IH", self._mm, HEADER_SIZE + index * RECORD_SIZE)
+        start = self._keys_at + key_off
+        return self._mm[start:start + key_len]
+
+    def _lower_bound(self, key):
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            if self._key(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def _location(self, index):
+        key_off, key_len, text_off, text_len, lat, lon, population = self._record(index)
+        start = self._texts_at + text_off
+        name, admin1, country = self._mm[start:start + text_len].decode("utf-8").split(SEPARATOR)
+        return {
+            "name": name,
+            "admin1": admin1,
+            "country": country,
+            "latitude": round(lat, 5),
+            "longitude": round(lon, 5),
+            "population": population,
+        }
+
+    def lookup(self, city):
+        """
+        Returns the most populous place whose normalized name equals `city`,
+        as a location dict like the geocoding API's, or None.
+        """
+        if not self._open():
+            return None
+        key = normalize_name(city).encode("utf-8")
+        if not key:
+            return None
+        index = self._lower_bound(key)
+        if index < self.count and self._key(index) == key:
+            return self._location(index)
+        return None
+
+    def prefix(self, text, limit=10):
+        """
+        Returns up to `limit` locations whose name starts with `text`,
+        most populous first.
+        """
+        if not self._open():
+            return []
+        key = normalize_name(text).encode("utf-8")
+        if not key:
+            return []
+        index = self._lower_bound(key)
+        candidates = []
+        end = min(self.count, index + MAX_PREFIX_SCAN)
+        while index < end and self._key(index).startswith(key):
+            candidates.append((self._record(index)[6], index))
+            index += 1
+        return [self._location(i) for _, i in heapq.nlargest(limit, candidates)]
+
+
+# --- Building the index ---
+
+def _load_names(path, key_column, value_column):
+    names = {}
+    if not path:
+        return names
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            if line.startswith("#") or not line.strip():
+                continue
+            columns = line.rstrip("\n").split("\t")
+            if len(columns) > max(key_column, value_column):
+                names[columns[key_column]] = columns[value_column]
+    return names
+
+
+def build_index(cities_path, output_path, countries_path=None, admin1_path=None):
+    """
+    Converts a GeoNames cities file into the binary index format.
+    Returns the number of records written.
+    """
+    countries = _load_names(countries_path, 0, 4)   # countryInfo.txt: ISO -> Country
+    admin1_names = _load_names(admin1_path, 0, 1)   # admin1CodesASCII.txt: CC.code -> name
+
+    rows = []
+    with open(cities_path, encoding="utf-8") as handle:
+        for line in handle:
+            columns = line.rstrip("\n").split("\t")
+            if len(columns) < 15:
+                continue
+            name, ascii_name = columns[1], columns[2]
+            country_code, admin1_code = columns[8], columns[10]
+            text = SEPARATOR.join((
+                name,
+                admin1_names.get(f"{country_code}.{admin1_code}", ""),
+                countries.get(country_code, country_code),
+            ))
+            latitude, longitude = float(columns[4]), float(columns[5])
+            population = int(columns[14] or 0)
+            for key in {normalize_name(name), normalize_name(ascii_name)}:
+                if key:
+                    rows.append((key.encode("utf-8"), -population, text.encode("utf-8"), latitude, longitude))
+    rows.sort()
+
+    records = bytearray()
+    keys = bytearray()
+    texts = bytearray()
+    text_offsets = {}
+    for key, neg_population, text, latitude, longitude in rows:
+        text_off = text_offsets.get(text)
+        if text_off is None:
+            text_off = text_offsets[text] = len(texts)
+            texts += text
+        records += struct.pack(RECORD_FORMAT, len(keys), len(key), text_off, len(text),
+                               latitude, longitude, min(-neg_population, 0xFFFFFFFF))
+        keys += key
+
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "wb") as handle:
+        handle.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, len(rows), len(keys), len(texts)))
+        handle.write(records)
+        handle.write(keys)
+        handle.write(texts)
+    os.replace(tmp_path, output_path)
+    return len(rows)
+
+
+# Shared instance consulted by resolve_location().
+gazetteer = Gazetteer()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the offline gazetteer index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="convert a GeoNames cities file")
+    build.add_argument("cities")
+    build.add_argument("--countries", help="GeoNames countryInfo.txt for country names")
+    build.add_argument("--admin1", help="GeoNames admin1CodesASCII.txt for region names")
+    build.add_argument("-o", "--output", default=DEFAULT_PATH)
+    query = commands.add_parser("lookup", help="look a name or prefix up")
+    query.add_argument("name")
+    query.add_argument("--prefix", action="store_true")
+    query.add_argument("-i", "--index", default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build_index(args.cities, args.output, args.countries, args.admin1)
+        print(f"Wrote {count} entries to {args.output}")
+    else:
+        index = Gazetteer(args.index)
+        if args.prefix:
+            for location in index.prefix(args.name):
+                print(location)
+        else:
+            print(index.lookup(args.name))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+import unicodedata
+
+from cache_backends import SQLiteBackend, make_backend
+from json_codec import LOCATION_FIELDS
+from state_paths import state_path
+
+# --- Geocoding Cache ---
+# City coordinates practically never change, so lookups are kept in two tiers:
+# a bounded in-process LRU and an SQLite file that survives restarts and is
+# shared by every gunicorn worker on the host. With WEATHERPY_CACHE_URL set,
+# a Redis store shared by every node takes the place of the SQLite file.
+
+DEFAULT_DB_PATH = state_path("WEATHERPY_GEOCACHE_DB", "geocache.sqlite3")
+DEFAULT_MAX_ENTRIES = 2048
+POSITIVE_TTL = 30 * 24 * 3600   # found cities: 30 days
+NEGATIVE_TTL = 3600             # unknown names: 1 hour
+
+
+def normalize_name(city):
+    """
+    Builds a cache key from a city name: case-folded, accents stripped,
+    and whitespace collapsed, so "  São  Paulo" and "sao paulo" share an entry.
+    """
+    text = unicodedata.normalize('NFKD', city or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(text.casefold().split())
+
+
+class GeocodeCache:
+    """
+    Two-tier (memory + SQLite or Redis) cache of geocoding results.
+    Values are trimmed location dicts, or None for names the API did not find.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, max_entries=DEFAULT_MAX_ENTRIES,
+                 ttl=POSITIVE_TTL, negative_ttl=NEGATIVE_TTL, backend=None):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        if backend is None:
+            local = SQLiteBackend(db_path, "geocode_entries") if db_path else None
+            backend = make_backend("geocode", max_entries, local=local)
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0, "stores": 0}
+        # Callables invoked with each newly stored (found) location.
+        self.listeners = []
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def _find_many(self, keys):
+        now = time.time()
+        return [entry if entry is not None and entry[1] > now else None
+                for entry in self.backend.get_many(keys)]
+
+    def _find(self, key):
+        return self._find_many([key])[0]
+
+    # --- Public API ---
+
+    def get(self, city):
+        """
+        Returns (found, location). `found` is False on a cache miss;
+        `location` may be None for a cached "city not found" result.
+        """
+        entry = self._find(normalize_name(city))
+        if entry is None:
+            self._count("misses")
+            return False, None
+        self._count("hits")
+        if entry[0] is None:
+            self._count("negative_hits")
+        return True, entry[0]
+
+    def warm(self, cities):
+        """
+        Loads the entries for several names into the in-process tier with
+        one round trip to the shared tier, so that the per-city lookups of a
+        batch request that follow are memory hits.
+        """
+        self.backend.get_many(list(dict.fromkeys(normalize_name(city) for city in cities)))
+
+    def set(self, city, location):
+        """
+        Stores a geocoding result; pass None to cache a "not found" answer.
+        Returns the value as stored.
+        """
+        key = normalize_name(city)
+        if location is not None:
+            location = {field: location.get(field) for field in LOCATION_FIELDS}
+            expires = time.time() + self.ttl
+        else:
+            expires = time.time() + self.negative_ttl
+        self.backend.set_many([(key, location, expires)])
+        self._count("stores")
+        if location is not None:
+            for listener in self.listeners:
+                listener(location)
+        return location
+
+    def lookup(self, city, fetch, flight=None):
+        """
+        Returns the cached location for `city`, calling `fetch(city)` on a miss.
+        `fetch` returns a location dict or None; exceptions it raises
+        (network errors) are propagated and never cached.
+        If a SingleFlight is given, concurrent misses for the same name share
+        one `fetch` call.
+        """
+        found, location = self.get(city)
+        if found:
+            return location
+        if flight is None:
+            return self.set(city, fetch(city))
+
+        key = normalize_name(city)
+
+        def fill():
+            # Another thread, worker or node may have filled the entry while
+            # we waited for the flight's lock.
+            entry = self._find(key)
+            if entry is not None:
+                return entry[0]
+            return self.set(city, fetch(city))
+
+        return flight.do(key, fill)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats.update(self.backend.get_stats())
+        stats["memory_entries"] = len(self.backend)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+    def iter_locations(self):
+        """
+        Yields every unexpired cached location (negative entries excluded),
+        from the shared tier when there is one, else from memory.
+        """
+        now = time.time()
+        for key, value, expires in self.backend.items():
+            if value is not None and expires > now:
+                yield value
+
+    def purge_expired(self):
+        """
+        Drops expired entries from every tier.
+        """
+        self.backend.purge_expired()
+
+
+# Shared instance used by all front-ends.
+geocode_cache = GeocodeCache()
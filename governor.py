@@ -0,0 +1,348 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+import requests
+
+import metrics
+from state_paths import state_path
+
+# --- Upstream Rate Governor ---
+# Open-Meteo limits requests per client IP, so every upstream call first takes
+# a token from a bucket kept in a small SQLite file that all workers on the
+# host share. Callers are ranked by priority: interactive lookups may wait
+# briefly for a token; batch lookups wait longer but leave a reserve of tokens
+# for interactive traffic; bulk runs (the multi-city CLI) leave the same
+# reserve but queue for as long as it takes, since nobody is waiting on any
+# single city; prefetching only uses spare capacity and never waits. Within a
+# process, waiters are served highest priority first. A 429 (or Retry-After)
+# from upstream pauses the whole bucket for every worker. Refused calls raise
+# RateLimitedError, and callers that hold a stale copy serve it instead. Like
+# the SQLite cache tier, the shared bucket is best effort: if its database
+# cannot be used, calls are let through rather than failed.
+
+GOVERNOR_DB_PATH = state_path("WEATHERPY_GOVERNOR_DB", "governor.sqlite3")
+RATE = float(os.environ.get("WEATHERPY_UPSTREAM_RATE", 5))      # tokens per second; 0 disables
+BURST = float(os.environ.get("WEATHERPY_UPSTREAM_BURST", 50))
+MIN_WAIT = 0.001               # shorter waits are not counted as waits
+DEFAULT_PENALTY = 5.0          # seconds to pause after a 429 without Retry-After
+MAX_PENALTY = 300.0
+BUCKET_NAME = "open-meteo"
+
+MAX_IDLE_WAIT = 60.0           # queued waiters re-check at least this often
+
+INTERACTIVE, BATCH, BULK, PREFETCH = 0, 1, 2, 3
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch", BULK: "bulk", PREFETCH: "prefetch"}
+# priority -> (longest wait for a token in seconds, fraction of BURST left untouched)
+POLICY = {
+    INTERACTIVE: (2.0, 0.0),
+    BATCH: (10.0, 0.2),
+    BULK: (float("inf"), 0.2),
+    PREFETCH: (0.0, 0.5),
+}
+
+current_priority = contextvars.ContextVar("upstream_priority", default=INTERACTIVE)
+
+WAIT_SECONDS = metrics.registry.histogram(
+    "weatherpy_governor_wait_seconds", "Time spent waiting for an upstream token.", ("priority",))
+DECISIONS = metrics.registry.counter(
+    "weatherpy_governor_decisions_total", "Upstream token requests by priority and outcome.",
+    ("priority", "outcome"))
+
+
+class RateLimitedError(requests.exceptions.ConnectionError):
+    """Raised when no upstream token is available within the caller's wait budget."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@contextmanager
+def priority(level):
+    """
+    Runs the enclosed upstream calls at the given priority.
+    """
+    token = current_priority.set(level)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+def with_priority(level, fn, *args):
+    """
+    Calls fn(*args) at the given priority; handy for executor and thread
+    targets, which do not inherit the caller's context.
+    """
+    with priority(level):
+        return fn(*args)
+
+
+def parse_retry_after(value, now=None):
+    """
+    Seconds to wait from a Retry-After header (delta-seconds or HTTP-date).
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when - (time.time() if now is None else now))
+
+
+class SQLiteTokenBucket:
+    """
+    Token bucket whose state lives in SQLite so every process on the host
+    draws from the same budget. Each take is one short IMMEDIATE transaction.
+    SQLite errors (e.g. "database is locked" past the busy timeout) grant
+    the take and are counted in `errors`.
+    """
+
+    def __init__(self, db_path, rate, burst, name=BUCKET_NAME):
+        self.db_path = db_path
+        self.rate = rate
+        self.burst = burst
+        self.name = name
+        self.errors = 0
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS bucket ("
+            " name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL,"
+            " blocked_until REAL NOT NULL DEFAULT 0)"
+        )
+
+    def _connect(self):
+        # One connection per thread; one inherited across fork() (preloading
+        # servers) is not reused.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _state(self, conn, now):
+        row = conn.execute("SELECT tokens, updated, blocked_until FROM bucket WHERE name = ?",
+                           (self.name,)).fetchone()
+        if row is None:
+            return self.burst, 0.0
+        tokens, updated, blocked_until = row
+        return min(self.burst, tokens + max(0.0, now - updated) * self.rate), blocked_until
+
+    def take(self, cost=1.0, reserve=0.0):
+        """
+        Takes `cost` tokens if at least `reserve` would remain.
+        Returns (True, 0) or (False, seconds until it could succeed).
+        """
+        try:
+            return self._take(self._connect(), time.time(), cost, reserve)
+        except sqlite3.Error:
+            self.errors += 1
+            return True, 0.0
+
+    def _take(self, conn, now, cost, reserve):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            tokens, blocked_until = self._state(conn, now)
+            if blocked_until > now:
+                granted, wait = False, blocked_until - now
+            elif tokens >= cost + reserve:
+                granted, wait = True, 0.0
+                tokens -= cost
+            else:
+                granted, wait = False, (cost + reserve - tokens) / self.rate
+            conn.execute(
+                "INSERT INTO bucket (name, tokens, updated, blocked_until) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (self.name, tokens, now, blocked_until))
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return granted, wait
+
+    def block(self, seconds):
+        """
+        Refuses all takes, in every process, for the next `seconds`.
+        """
+        try:
+            conn = self._connect()
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                tokens, blocked_until = self._state(conn, now)
+                conn.execute(
+                    "INSERT INTO bucket (name, tokens, updated, blocked_until) VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT(name) DO UPDATE SET blocked_until = MAX(blocked_until, excluded.blocked_until)",
+                    (self.name, tokens, now, now + seconds))
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            self.errors += 1
+
+    def peek(self):
+        """
+        Current (tokens, seconds still blocked) without taking anything,
+        or None if the database cannot be read.
+        """
+        now = time.time()
+        try:
+            tokens, blocked_until = self._state(self._connect(), now)
+        except sqlite3.Error:
+            self.errors += 1
+            return None
+        return tokens, max(0.0, blocked_until - now)
+
+
+class Governor:
+    """
+    Priority-aware admission control for upstream calls.
+    """
+
+    def __init__(self, db_path=GOVERNOR_DB_PATH, rate=RATE, burst=BURST, policy=POLICY):
+        self.enabled = rate > 0 and bool(db_path)
+        self.policy = policy
+        self.burst = burst
+        self.bucket = SQLiteTokenBucket(db_path, rate, burst) if self.enabled else None
+        self._waiters = []   # heap of (priority, sequence)
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._async_waiting = 0
+        self.stats = {"granted": 0, "rejected": 0, "waited": 0, "wait_seconds_total": 0.0,
+                      "penalties": 0, "stale_served": 0}
+
+    def _limits(self, level):
+        max_wait, reserve_fraction = self.policy.get(level, self.policy[INTERACTIVE])
+        return max_wait, reserve_fraction * self.burst
+
+    def _record(self, level, granted, waited):
+        name = PRIORITY_NAMES.get(level, str(level))
+        DECISIONS.inc(priority=name, outcome="granted" if granted else "rejected")
+        if waited >= MIN_WAIT:
+            WAIT_SECONDS.observe(waited, priority=name)
+        with self._cond:
+            self.stats["granted" if granted else "rejected"] += 1
+            if waited >= MIN_WAIT:
+                self.stats["waited"] += 1
+                self.stats["wait_seconds_total"] += waited
+
+    def acquire(self, level=None):
+        """
+        Blocks until an upstream token is granted for the current (or given)
+        priority. Raises RateLimitedError once the priority's wait budget is
+        spent. Returns the seconds waited.
+        """
+        if not self.enabled:
+            return 0.0
+        level = current_priority.get() if level is None else level
+        max_wait, reserve = self._limits(level)
+        started = time.monotonic()
+        deadline = started + max_wait
+        ticket = (level, next(self._sequence))
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            self._cond.notify_all()
+            try:
+                while True:
+                    now = time.monotonic()
+                    remaining = deadline - now
+                    if self._waiters[0] == ticket:
+                        granted, wait = self.bucket.take(1.0, reserve)
+                        if granted or wait > remaining:
+                            break
+                    elif remaining <= 0:
+                        granted, wait = False, 0.0
+                        break
+                    else:
+                        wait = remaining  # higher-priority waiters go first
+                    self._cond.wait(min(wait, MAX_IDLE_WAIT))
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+        waited = time.monotonic() - started
+        self._record(level, granted, waited)
+        if not granted:
+            raise RateLimitedError("Upstream request budget exhausted", retry_after=wait)
+        return waited
+
+    async def acquire_async(self, level=None):
+        """
+        asyncio variant of acquire(). Priority is enforced through the token
+        reserves only; there is no in-process queue. The SQLite transaction
+        runs on a worker thread, off the event loop.
+        """
+        if not self.enabled:
+            return 0.0
+        level = current_priority.get() if level is None else level
+        max_wait, reserve = self._limits(level)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + max_wait
+        self._async_waiting += 1
+        try:
+            while True:
+                granted, wait = await asyncio.to_thread(self.bucket.take, 1.0, reserve)
+                now = loop.time()
+                if granted:
+                    self._record(level, True, now - started)
+                    return now - started
+                if now + wait > deadline:
+                    self._record(level, False, now - started)
+                    raise RateLimitedError("Upstream request budget exhausted", retry_after=wait)
+                await asyncio.sleep(min(wait, MAX_IDLE_WAIT))
+        finally:
+            self._async_waiting -= 1
+
+    def penalize(self, retry_after=None):
+        """
+        Pauses upstream calls from every worker after a 429, for Retry-After
+        seconds if given.
+        """
+        if not self.enabled:
+            return
+        seconds = parse_retry_after(retry_after)
+        seconds = DEFAULT_PENALTY if seconds is None else min(seconds, MAX_PENALTY)
+        self.bucket.block(seconds)
+        with self._cond:
+            self.stats["penalties"] += 1
+            self._cond.notify_all()
+
+    def note_stale_served(self):
+        with self._cond:
+            self.stats["stale_served"] += 1
+
+    def get_stats(self):
+        with self._cond:
+            stats = dict(self.stats)
+            stats["queue_depth"] = len(self._waiters) + self._async_waiting
+        stats["enabled"] = self.enabled
+        if self.enabled:
+            state = self.bucket.peek()
+            if state is not None:
+                stats["tokens"] = round(state[0], 2)
+                stats["blocked_seconds"] = round(state[1], 2)
+            stats["errors"] = self.bucket.errors
+        return stats
+
+
+# Shared instance used by the HTTP clients.
+governor = Governor()
@@ -0,0 +1,39 @@
+import serve
+
+# --- Gunicorn Settings ---
+# Read by `python serve.py` (or `gunicorn -c gunicorn.conf.py weather_webApp:app`).
+# Worker class, count and threads are tuned in serve.worker_profile(); every
+# value can be overridden with the WEATHERPY_* variables listed in the README.
+
+_profile = serve.worker_profile()
+
+bind = serve.BIND
+worker_class = _profile["worker_class"]
+workers = _profile["workers"]
+threads = _profile["threads"]
+worker_connections = _profile.get("worker_connections", 1000)
+preload_app = _profile["preload_app"]
+pidfile = serve.PIDFILE
+
+# Streams (/weather/stream) stay open; heartbeats keep them under the timeout.
+timeout = 60
+graceful_timeout = serve.GRACEFUL_TIMEOUT
+keepalive = 5
+# Recycle workers now and then, staggered so they never all restart at once.
+max_requests = 50000
+max_requests_jitter = 5000
+
+accesslog = serve.ACCESS_LOG
+errorlog = "-"
+loglevel = "info"
+
+
+def when_ready(server):
+    # Runs in the master after the app is preloaded and before the first fork.
+    if preload_app:
+        serve.warm_up()
+    server.log.info("WeatherPy: %s x %s workers, %s threads each", workers, worker_class, threads)
+
+
+def post_worker_init(worker):
+    serve.after_fork()
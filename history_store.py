@@ -0,0 +1,484 @@
+import array
+import atexit
+import datetime
+import math
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+
+from forecast_cache import grid_cell
+from json_codec import codec
+
+# --- Observation History ---
+# With WEATHERPY_HISTORY=1, every `current` block fetched from upstream is
+# also written to a local history, so past conditions can be served without
+# the archive API. Fetches only queue their blocks; one writer thread per
+# process stores them, off the request path and the event loop, and deletes
+# day files older than WEATHERPY_HISTORY_DAYS. Storage
+# is one small file per grid cell and UTC day, holding a fixed-width float32
+# column per variable with one slot per 15-minute observation (NaN = no data):
+#
+#   <WEATHERPY_HISTORY_DIR>/<lat>_<lon>/<YYYY-MM-DD>.wph
+#   header  HEADER_FORMAT: magic, version, column count, slot seconds,
+#           slots per day, days since the epoch
+#   columns VARIABLES in order, SLOTS_PER_DAY little-endian float32 each
+#
+# A slot's position follows from its time, so writers only ever fill in
+# slots and concurrent workers never conflict. Reads memory-map each day file
+# in the range, so months of one cell are a few hundred small mapped reads.
+# NumPy, if installed, is only imported once history is read.
+
+HISTORY_ENABLED = os.environ.get("WEATHERPY_HISTORY", "0") != "0"
+HISTORY_DIR = os.environ.get("WEATHERPY_HISTORY_DIR", ".weatherpy_history")
+RETENTION_DAYS = int(os.environ.get("WEATHERPY_HISTORY_DAYS", "400"))   # 0 keeps everything
+
+VARIABLES = ('temperature_2m', 'relative_humidity_2m', 'weather_code', 'wind_speed_10m')
+UNITS = {'temperature_2m': "°C", 'relative_humidity_2m': "%", 'wind_speed_10m': "m/s"}
+SLOT_SECONDS = 15 * 60
+SLOTS_PER_DAY = 86400 // SLOT_SECONDS
+MAGIC = b"WPHS"
+VERSION = 1
+HEADER_FORMAT = "<4sHHIIi"
+HEADER_SIZE = 32                    # HEADER_FORMAT, zero-padded
+COLUMN_SIZE = SLOTS_PER_DAY * 4
+FILE_SIZE = HEADER_SIZE + len(VARIABLES) * COLUMN_SIZE
+
+DEFAULT_RANGE = 7 * 86400
+MAX_RANGE_DAYS = 366
+MAX_POINTS = 2000
+MAX_PENDING = 10000                 # queued observations; more are dropped
+PRUNE_INTERVAL = 3600               # seconds between retention sweeps
+# Downsampling steps chosen automatically when none is requested.
+AUTO_STEPS = (SLOT_SECONDS, 3600, 3 * 3600, 6 * 3600, 86400, 7 * 86400)
+STEP_UNITS = {"m": 60, "h": 3600, "d": 86400}
+# Day files can only be named for datetime.date's range: years 1 to 9999.
+EARLIEST = (datetime.date.min - datetime.date(1970, 1, 1)).days * 86400
+LATEST = ((datetime.date.max - datetime.date(1970, 1, 1)).days + 1) * 86400
+
+
+def observation_time(current, now=None):
+    """
+    Epoch seconds of a `current` block: its `time` (ISO in GMT or unixtime),
+    or `now` if it has none.
+    """
+    value = current.get('time')
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        try:
+            parsed = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            parsed = None
+        if parsed is not None:
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+            return int(parsed.timestamp())
+    return int(time.time() if now is None else now)
+
+
+def _float(value):
+    return math.nan if value is None else float(value)
+
+
+def _numpy():
+    """
+    NumPy for vectorised reads and downsampling, or None if not installed.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _read_column(mm, index, np):
+    offset = HEADER_SIZE + index * COLUMN_SIZE
+    if np is not None:
+        return np.frombuffer(mm, dtype='<f4', count=SLOTS_PER_DAY, offset=offset).astype(np.float64)
+    column = array.array('f')
+    column.frombytes(mm[offset:offset + COLUMN_SIZE])
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return array.array('d', column)
+
+
+class HistoryStore:
+    """
+    Append-only observation history, one day file per grid cell and day.
+    """
+
+    def __init__(self, root=HISTORY_DIR, enabled=HISTORY_ENABLED, retention_days=RETENTION_DAYS):
+        self.root = root
+        self.enabled = enabled and bool(root)
+        self.retention_days = retention_days
+        self._pending = queue.Queue(MAX_PENDING)
+        self._pid = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self.stats = {
+            "writes": 0, "write_errors": 0, "dropped": 0, "files_created": 0, "files_pruned": 0,
+            "queries": 0, "days_read": 0,
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def cell_dir(self, latitude, longitude):
+        lat, lon = grid_cell(latitude, longitude)
+        return os.path.join(self.root, f"{lat:+09.4f}_{lon:+010.4f}")
+
+    def day_path(self, latitude, longitude, day):
+        date = datetime.date(1970, 1, 1) + datetime.timedelta(days=day)
+        return os.path.join(self.cell_dir(latitude, longitude), f"{date.isoformat()}.wph")
+
+    # --- Writing ---
+
+    def _create(self, path, day):
+        """
+        Creates an empty day file. It is built under a temporary name and
+        linked into place, so readers and other writers never see it half
+        written, and a file created meanwhile by another worker wins.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, len(VARIABLES), SLOT_SECONDS, SLOTS_PER_DAY, day)
+        empty = struct.pack("<f", math.nan) * SLOTS_PER_DAY
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as handle:
+            handle.write(header.ljust(HEADER_SIZE, b"\0") + empty * len(VARIABLES))
+        try:
+            os.link(tmp, path)
+            self._count("files_created")
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp)
+
+    def record(self, latitude, longitude, current):
+        """
+        Queues one `current` block for the cell containing the coordinates.
+        Never blocks or raises into the fetch path: when the writer falls
+        MAX_PENDING behind, blocks are dropped and counted.
+        """
+        if not self.enabled or not current:
+            return
+        self.ensure_started()
+        try:
+            self._pending.put_nowait((latitude, longitude, current))
+        except queue.Full:
+            self._count("dropped")
+
+    def ensure_started(self):
+        """
+        Starts the writer thread once per process; a forked worker starts its
+        own, with a fresh queue.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                if self._pid is None:
+                    atexit.register(self.flush)
+                else:
+                    self._pending = queue.Queue(MAX_PENDING)
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, args=(self._pending,), name="weather-history",
+                                 daemon=True).start()
+
+    def flush(self):
+        """
+        Stores every queued block now (at exit, and for tests).
+        """
+        while True:
+            try:
+                self.write(*self._pending.get_nowait())
+            except queue.Empty:
+                return
+
+    def _run(self, pending):
+        last_prune = None
+        while True:
+            if last_prune is None or time.monotonic() - last_prune >= PRUNE_INTERVAL:
+                self.prune()
+                last_prune = time.monotonic()
+            try:
+                item = pending.get(timeout=PRUNE_INTERVAL)
+            except queue.Empty:
+                continue
+            self.write(*item)
+
+    def write(self, latitude, longitude, current):
+        """
+        Stores one `current` block. Storage errors are counted, never raised.
+        """
+        observed = observation_time(current)
+        day, seconds = divmod(observed, 86400)
+        slot = seconds // SLOT_SECONDS
+        path = self.day_path(latitude, longitude, day)
+        try:
+            if not os.path.exists(path):
+                self._create(path, day)
+            with open(path, "r+b") as handle:
+                for index, name in enumerate(VARIABLES):
+                    handle.seek(HEADER_SIZE + index * COLUMN_SIZE + slot * 4)
+                    handle.write(struct.pack("<f", _float(current.get(name))))
+            self._count("writes")
+        except (OSError, TypeError, ValueError):
+            self._count("write_errors")
+
+    def prune(self, now=None):
+        """
+        Deletes day files older than `retention_days`, and the cell
+        directories this empties. Returns the number of files deleted.
+        """
+        if not self.retention_days:
+            return 0
+        now = time.time() if now is None else now
+        oldest = datetime.date(1970, 1, 1) + datetime.timedelta(days=int(now) // 86400 - self.retention_days)
+        oldest_name = f"{oldest.isoformat()}.wph"   # ISO dates sort as strings
+        deleted = 0
+        try:
+            cells = [entry.path for entry in os.scandir(self.root) if entry.is_dir()]
+        except OSError:
+            return 0
+        for cell in cells:
+            try:
+                names = os.listdir(cell)
+                expired = [name for name in names if name.endswith(".wph") and name < oldest_name]
+                for name in expired:
+                    os.unlink(os.path.join(cell, name))
+                    deleted += 1
+                if expired and len(expired) == len(names):
+                    os.rmdir(cell)
+            except OSError:
+                pass   # another worker pruning, or a writer creating a file meanwhile
+        if deleted:
+            self._count("files_pruned", deleted)
+        return deleted
+
+    # --- Reading ---
+
+    def _read_day(self, path, day):
+        try:
+            with open(path, "rb") as handle:
+                mm = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        try:
+            if len(mm) < FILE_SIZE:
+                return None
+            magic, version, count, slot_seconds, slots, stored_day = struct.unpack_from(HEADER_FORMAT, mm, 0)
+            if (magic, version, count, slot_seconds, slots, stored_day) != \
+                    (MAGIC, VERSION, len(VARIABLES), SLOT_SECONDS, SLOTS_PER_DAY, day):
+                return None
+            np = _numpy()
+            return [_read_column(mm, index, np) for index in range(len(VARIABLES))]
+        finally:
+            mm.close()
+
+    def query(self, latitude, longitude, start, end):
+        """
+        Raw observations for one cell with start <= time < end.
+        Returns (times, {variable: column}); slots without data are left out.
+        """
+        self._count("queries")
+        days, columns = [], [[] for _ in VARIABLES]
+        for day in range(int(start) // 86400, (int(end) - 1) // 86400 + 1):
+            data = self._read_day(self.day_path(latitude, longitude, day), day)
+            if data is None:
+                continue
+            self._count("days_read")
+            days.append(day)
+            for index, column in enumerate(data):
+                columns[index].append(column)
+        return _select(days, columns, start, end)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["enabled"] = self.enabled
+        stats["pending"] = self._pending.qsize()
+        return stats
+
+
+def _select(days, day_columns, start, end):
+    """
+    Flattens per-day columns and keeps slots in [start, end) holding data.
+    """
+    np = _numpy()
+    if np is not None:
+        if not days:
+            empty = np.empty(0)
+            return np.empty(0, dtype=np.int64), {name: empty for name in VARIABLES}
+        offsets = np.arange(SLOTS_PER_DAY, dtype=np.int64) * SLOT_SECONDS
+        times = (np.asarray(days, dtype=np.int64)[:, None] * 86400 + offsets).ravel()
+        columns = [np.concatenate(parts) for parts in day_columns]
+        keep = (times >= start) & (times < end) & ~np.all(np.isnan(np.vstack(columns)), axis=0)
+        return times[keep], {name: column[keep] for name, column in zip(VARIABLES, columns)}
+    times = array.array('q')
+    columns = {name: array.array('d') for name in VARIABLES}
+    for position, day in enumerate(days):
+        for slot in range(SLOTS_PER_DAY):
+            stamp = day * 86400 + slot * SLOT_SECONDS
+            values = [parts[position][slot] for parts in day_columns]
+            if start <= stamp < end and any(v == v for v in values):
+                times.append(stamp)
+                for name, value in zip(VARIABLES, values):
+                    columns[name].append(value)
+    return times, columns
+
+
+def downsample(times, columns, step):
+    """
+    Aggregates observations into buckets of `step` seconds: the mean of each
+    variable, except weather_code which keeps the most severe (highest) code.
+    Returns (bucket_start_times, columns).
+    """
+    if step <= SLOT_SECONDS or not len(times):
+        return times, columns
+    np = _numpy()
+    if np is not None:
+        buckets = times // step * step
+        starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+        result = {}
+        for name, column in columns.items():
+            valid = ~np.isnan(column)
+            if name == 'weather_code':
+                worst = np.maximum.reduceat(np.where(valid, column, -np.inf), starts)
+                result[name] = np.where(np.isinf(worst), np.nan, worst)
+            else:
+                sums = np.add.reduceat(np.where(valid, column, 0.0), starts)
+                counts = np.add.reduceat(valid.astype(np.int64), starts)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    result[name] = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+        return buckets[starts], result
+    bucket_times = array.array('q')
+    groups = []
+    for position, stamp in enumerate(times):
+        bucket = stamp // step * step
+        if not bucket_times or bucket_times[-1] != bucket:
+            bucket_times.append(bucket)
+            groups.append([])
+        groups[-1].append(position)
+    result = {}
+    for name, column in columns.items():
+        aggregated = array.array('d')
+        for group in groups:
+            values = [column[i] for i in group if column[i] == column[i]]
+            if not values:
+                aggregated.append(math.nan)
+            elif name == 'weather_code':
+                aggregated.append(max(values))
+            else:
+                aggregated.append(sum(values) / len(values))
+        result[name] = aggregated
+    return bucket_times, result
+
+
+# --- Request Handling ---
+
+def parse_time(value):
+    """
+    Epoch seconds from unix seconds, an ISO date or an ISO datetime (UTC
+    unless an offset is given). Raises ValueError.
+    """
+    value = value.strip()
+    if value.lstrip("-").isdigit():
+        return int(value)
+    parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return int(parsed.timestamp())
+
+
+def parse_step(value):
+    """
+    Seconds from "90" or "15m" / "1h" / "1d"; rounded up to whole slots.
+    Raises ValueError.
+    """
+    value = value.strip().lower()
+    multiplier = STEP_UNITS.get(value[-1:], None)
+    seconds = int(value[:-1]) * multiplier if multiplier else int(value)
+    if seconds <= 0:
+        raise ValueError(value)
+    return -(-seconds // SLOT_SECONDS) * SLOT_SECONDS
+
+
+def parse_options(start, end, step, now=None):
+    """
+    Validates /history query values (strings or None); the range defaults to
+    the last week and the step to the finest one giving at most MAX_POINTS.
+    Returns (start, end, step, None) or (None, None, None, error_message).
+    """
+    now = int(time.time() if now is None else now)
+    try:
+        end = parse_time(end) if end else now
+        start = parse_time(start) if start else end - DEFAULT_RANGE
+    except (ValueError, OverflowError):
+        return None, None, None, "start and end must be ISO dates/times or unix seconds"
+    if not EARLIEST <= start <= LATEST or not EARLIEST <= end <= LATEST:
+        return None, None, None, "start and end must fall within the years 1 to 9999"
+    if start >= end:
+        return None, None, None, "start must be before end"
+    if end - start > MAX_RANGE_DAYS * 86400:
+        return None, None, None, f"range must be at most {MAX_RANGE_DAYS} days"
+    if step:
+        try:
+            step = parse_step(step)
+        except ValueError:
+            return None, None, None, "step must be seconds or a number followed by m, h or d"
+        if (end - start) // step > MAX_POINTS:
+            return None, None, None, f"step too small: at most {MAX_POINTS} points per request"
+    else:
+        step = next((s for s in AUTO_STEPS if (end - start) // s <= MAX_POINTS), AUTO_STEPS[-1])
+    return start, end, step, None
+
+
+def to_json(location, start, end, step, times, columns):
+    """
+    Columnar JSON document as UTF-8 bytes, like /forecast's (missing = null).
+    """
+    from forecast_series import CODE_TABLE, column_list, present_codes, round_column
+
+    codes = present_codes(columns['weather_code'])
+    header = codec.dumps({
+        "location": {"name": location.name, "latitude": location.latitude, "longitude": location.longitude},
+        "start": start,
+        "end": end,
+        "step": step,
+        "units": UNITS,
+        "weather_codes": {str(code): CODE_TABLE[code] for code in codes if 0 <= code < len(CODE_TABLE)},
+    })
+    series = {"time": column_list(times)}
+    for name, column in columns.items():
+        series[name] = column_list(round_column(column, 1))
+    body = codec.dumps(series)
+    return b"".join((header[:-1], b",", body[1:]))
+
+
+def max_age(end, now=None):
+    """
+    Cache lifetime of a /history response: ranges that ended a slot ago are
+    final, anything newer may gain an observation in the next slot.
+    """
+    now = time.time() if now is None else now
+    if end <= now - SLOT_SECONDS:
+        return 86400
+    return SLOT_SECONDS - int(now) % SLOT_SECONDS
+
+
+def history_document(location, start, end, step):
+    """
+    Reads, downsamples and serializes one /history response body.
+    """
+    times, columns = history.query(location.latitude, location.longitude, start, end)
+    times, columns = downsample(times, columns, step)
+    return to_json(location, start, end, step, times, columns)
+
+
+# Shared instance fed by the fetch path and read by /history.
+history = HistoryStore()
@@ -0,0 +1,118 @@
+import gzip
+import hashlib
+
+try:
+    import brotli  # optional: adds a "br" variant of static assets
+except ImportError:
+    brotli = None
+
+# --- HTTP Caching Helpers ---
+# Shared by the Flask and ASGI front-ends so both send the same validators.
+# Static assets are encoded and compressed once at import time; each request
+# then only has to pick a pre-built variant or answer 304 Not Modified.
+
+PAGE_CACHE_CONTROL = "public, max-age=600"
+
+
+def make_etag(body):
+    """
+    Strong ETag for a response body.
+    """
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Evaluates an If-None-Match header against our ETag. Comparison is weak,
+    as RFC 9110 requires for If-None-Match, so a W/ prefix added by a proxy
+    that re-compressed the body still matches.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def accepted_encodings(accept_encoding):
+    """
+    Parses Accept-Encoding into the set of codings with a non-zero q-value.
+    """
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted.add(coding)
+    return accepted
+
+
+def max_age_header(seconds):
+    return f"public, max-age={max(0, int(seconds))}"
+
+
+def conditional(body, content_type, cache_control, if_none_match, etag=None, vary=None, content_encoding=None):
+    """
+    Returns (status, headers, body) for a cacheable GET: 304 with an empty
+    body if the client's copy is current, otherwise 200 with validators.
+    """
+    etag = etag or make_etag(body)
+    headers = [("ETag", etag), ("Cache-Control", cache_control)]
+    if vary:
+        headers.append(("Vary", vary))
+    if etag_matches(if_none_match, etag):
+        return 304, headers, b""
+    headers.append(("Content-Type", content_type))
+    if content_encoding:
+        headers.append(("Content-Encoding", content_encoding))
+    return 200, headers, body
+
+
+class StaticAsset:
+    """
+    A response body built once, with precomputed gzip (and, when the
+    `brotli` package is installed, br) variants. Each variant has its own
+    strong ETag, derived from the hash of the uncompressed body.
+    """
+
+    def __init__(self, body, content_type, cache_control=PAGE_CACHE_CONTROL):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.etag = make_etag(body)
+        self.variants = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(body, quality=11)
+        self.etags = {encoding: self.etag if encoding == "identity" else f'{self.etag[:-1]}-{encoding}"'
+                      for encoding in self.variants}
+
+    def respond(self, if_none_match=None, accept_encoding=None):
+        """
+        Returns (status, headers, body) for a GET of this asset.
+        """
+        accepted = accepted_encodings(accept_encoding)
+        encoding = "identity"
+        for candidate in ("br", "gzip"):
+            if candidate in self.variants and candidate in accepted:
+                encoding = candidate
+                break
+        return conditional(self.variants[encoding], self.content_type, self.cache_control, if_none_match,
+                           etag=self.etags[encoding], vary="Accept-Encoding",
+                           content_encoding=None if encoding == "identity" else encoding)
@@ -0,0 +1,380 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import tracing
+from governor import RateLimitedError, governor as upstream_governor
+from json_codec import codec
+from metrics import UPSTREAM_RESPONSES, UPSTREAM_SECONDS
+
+# --- Shared HTTP Client ---
+# One keep-alive session for every front-end, so TCP and TLS handshakes to the
+# Open-Meteo hosts happen once per pooled connection rather than per request.
+# Each upstream host gets its own connection pool and circuit breaker, and every
+# call is admitted by the rate governor (see governor.py) first. In a traced
+# request each upstream call is recorded as a client span (see tracing.py).
+
+GEOCODING_URL = os.environ.get("WEATHERPY_GEOCODING_URL", "https://geocoding-api.open-meteo.com/v1/search")
+FORECAST_URL = os.environ.get("WEATHERPY_FORECAST_URL", "https://api.open-meteo.com/v1/forecast")
+
+CONNECT_TIMEOUT = float(os.environ.get("WEATHERPY_CONNECT_TIMEOUT", 3.05))
+READ_TIMEOUT = float(os.environ.get("WEATHERPY_READ_TIMEOUT", 10))
+POOL_SIZE = int(os.environ.get("WEATHERPY_POOL_SIZE", 32))
+ASYNC_POOL_SIZE = int(os.environ.get("WEATHERPY_ASYNC_POOL_SIZE", 256))
+# Never call upstream; everything is served from the caches (and a restored
+# snapshot, see snapshot.py). Entries still within their stale-while-revalidate
+# window are served as usual; only the last-known values that stand in for
+# older ones are flagged as stale.
+OFFLINE = os.environ.get("WEATHERPY_OFFLINE", "0") == "1"
+
+# 429 is not retried here: the governor pauses every worker for Retry-After
+# and callers fall back to stale data instead of holding a request open.
+RETRY_STATUSES = (500, 502, 503, 504)
+RETRY_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+RETRIES = 3
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised without touching the network while a host's circuit is open."""
+
+
+class OfflineError(requests.exceptions.ConnectionError):
+    """Raised for every call in offline mode (WEATHERPY_OFFLINE=1)."""
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker. After `threshold` consecutive failures the
+    circuit opens and requests fail fast for `reset_timeout` seconds; then one
+    trial request is let through (half-open) to decide whether to close it.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def cancel(self):
+        """
+        Gives back a half-open trial slot taken by allow() but not used.
+        """
+        with self._lock:
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.failures >= self.threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+
+def _host_of(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class HTTPClient:
+    """
+    Thin wrapper around a pooled requests.Session with timeouts, retries and
+    per-host circuit breakers. Retries happen here rather than in urllib3,
+    so that each attempt is admitted by the governor like any other call.
+    """
+
+    def __init__(self, hosts=(GEOCODING_URL, FORECAST_URL), pool_size=POOL_SIZE,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), retries=RETRIES, governor=upstream_governor,
+                 offline=OFFLINE):
+        self.timeout = timeout
+        self.retries = retries
+        self.pool_size = pool_size
+        self.governor = governor
+        self.offline = offline
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = "WeatherPy"
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "failures": 0, "short_circuited": 0, "retries": 0, "rate_limited": 0,
+                      "offline": 0}
+        for url in hosts:
+            self._mount(_host_of(url))
+
+    def _mount(self, host):
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=False)
+        self.session.mount(host, adapter)
+
+    def breaker(self, host):
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker()
+            return breaker
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get(self, url, params=None, timeout=None):
+        """
+        Performs a GET through the shared session, retrying 5xx and transport
+        errors with jittered backoff. Raises OfflineError in offline mode,
+        CircuitOpenError if the host is failing, RateLimitedError if the
+        governor refuses the call or upstream answers 429, and the usual
+        requests exceptions otherwise.
+        """
+        host = _host_of(url)
+        if self.offline:
+            self._count("offline")
+            raise OfflineError(f"Offline mode: not calling {host}")
+        breaker = self.breaker(host)
+        if not breaker.allow():
+            self._count("short_circuited")
+            UPSTREAM_RESPONSES.inc(host=host, code="CircuitOpen")
+            raise CircuitOpenError(f"Circuit open for {host}")
+
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            # Every attempt takes a token, so retries during an upstream
+            # outage cannot exceed the configured rate.
+            try:
+                self.governor.acquire()
+            except RateLimitedError:
+                if attempt == 0:
+                    breaker.cancel()
+                    self._count("rate_limited")
+                    UPSTREAM_RESPONSES.inc(host=host, code="RateLimited")
+                    raise
+                # No token for a retry: settle for the last attempt's outcome.
+                break
+            self._count("retries" if attempt else "requests")
+            try:
+                # One client span per attempt, as OpenTelemetry does for retries.
+                with tracing.span("GET", tracing.CLIENT, {"url.full": url}) as span:
+                    response = self.session.get(url, params=params, timeout=timeout or self.timeout)
+                    span.set("http.response.status_code", response.status_code)
+                error = None
+            except RETRY_ERRORS as e:
+                response, error = None, e
+            except requests.exceptions.RequestException as e:
+                response, error = None, e
+                break
+            if (error is None and response.status_code not in RETRY_STATUSES) or attempt >= self.retries:
+                break
+            time.sleep(_retry_delay(response, attempt))
+            attempt += 1
+
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, host=host)
+        if error is not None:
+            UPSTREAM_RESPONSES.inc(host=host, code=type(error).__name__)
+            breaker.record_failure()
+            self._count("failures")
+            raise error
+        UPSTREAM_RESPONSES.inc(host=host, code=response.status_code)
+        if response.status_code >= 500:
+            breaker.record_failure()
+            self._count("failures")
+        else:
+            breaker.record_success()
+        if response.status_code == 429:
+            self._count("rate_limited")
+        _check_throttle(self.governor, host, response)
+        return response
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["circuits"] = {host: b.state for host, b in self._breakers.items()}
+        return stats
+
+
+def _check_throttle(governor, host, response):
+    """
+    Pauses the governor when upstream asks us to back off: on 429, raised
+    as RateLimitedError, and on 503 with a Retry-After header.
+    """
+    retry_after = response.headers.get("Retry-After")
+    if response.status_code == 429:
+        governor.penalize(retry_after)
+        raise RateLimitedError(f"Rate limited by {host}", retry_after=retry_after)
+    if response.status_code == 503 and retry_after:
+        governor.penalize(retry_after)
+
+
+def _retry_delay(response, attempt, backoff=0.2, jitter=0.2, cap=10.0):
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), cap)
+    return min(backoff * (2 ** attempt) + random.uniform(0, jitter), cap)
+
+
+class AsyncResponse:
+    """
+    Fully-read response returned by AsyncHTTPClient, mirroring the parts of
+    requests.Response the fetch code uses.
+    """
+
+    __slots__ = ("url", "status_code", "headers", "content")
+
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return codec.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error for url: {self.url}")
+
+
+class AsyncHTTPClient:
+    """
+    asyncio counterpart of HTTPClient built on a pooled aiohttp session, with
+    the same timeouts, retry policy and per-host circuit breakers. Transport
+    errors are re-raised as requests exceptions so callers handle both clients
+    the same way. Must be created inside a running event loop.
+    """
+
+    def __init__(self, pool_size=ASYNC_POOL_SIZE, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), retries=RETRIES,
+                 governor=upstream_governor, offline=OFFLINE):
+        import aiohttp  # optional: only the async server needs it
+
+        self.aiohttp = aiohttp
+        self.retries = retries
+        self.governor = governor
+        self.offline = offline
+        self.session = aiohttp.ClientSession(
+            headers={"User-Agent": "WeatherPy"},
+            timeout=aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1]),
+            connector=aiohttp.TCPConnector(limit=pool_size, ttl_dns_cache=300),
+        )
+        self._breakers = {}
+        self.stats = {"requests": 0, "failures": 0, "short_circuited": 0, "retries": 0, "rate_limited": 0,
+                      "offline": 0}
+
+    def breaker(self, host):
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker()
+        return breaker
+
+    async def _get_once(self, url, params):
+        try:
+            async with self.session.get(url, params=params) as response:
+                content = await response.read()
+                return AsyncResponse(str(response.url), response.status, response.headers, content)
+        except asyncio.TimeoutError as e:
+            raise requests.exceptions.Timeout(str(e) or "timed out") from e
+        except self.aiohttp.ClientError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+
+    async def get(self, url, params=None):
+        """
+        Performs a GET, retrying 5xx and transport errors with jittered
+        backoff. Raises OfflineError, CircuitOpenError, RateLimitedError or
+        other requests exceptions.
+        """
+        host = _host_of(url)
+        if self.offline:
+            self.stats["offline"] += 1
+            raise OfflineError(f"Offline mode: not calling {host}")
+        breaker = self.breaker(host)
+        if not breaker.allow():
+            self.stats["short_circuited"] += 1
+            UPSTREAM_RESPONSES.inc(host=host, code="CircuitOpen")
+            raise CircuitOpenError(f"Circuit open for {host}")
+
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            # Every attempt takes a token, as in HTTPClient.get.
+            try:
+                await self.governor.acquire_async()
+            except RateLimitedError:
+                if attempt == 0:
+                    breaker.cancel()
+                    self.stats["rate_limited"] += 1
+                    UPSTREAM_RESPONSES.inc(host=host, code="RateLimited")
+                    raise
+                break
+            self.stats["retries" if attempt else "requests"] += 1
+            try:
+                # One client span per attempt, as OpenTelemetry does for retries.
+                with tracing.span("GET", tracing.CLIENT, {"url.full": url}) as span:
+                    response = await self._get_once(url, params)
+                    span.set("http.response.status_code", response.status_code)
+                error = None
+            except RETRY_ERRORS as e:
+                response, error = None, e
+            if (error is None and response.status_code not in RETRY_STATUSES) or attempt >= self.retries:
+                break
+            await asyncio.sleep(_retry_delay(response, attempt))
+            attempt += 1
+
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, host=host)
+        if error is not None:
+            UPSTREAM_RESPONSES.inc(host=host, code=type(error).__name__)
+            breaker.record_failure()
+            self.stats["failures"] += 1
+            raise error
+        UPSTREAM_RESPONSES.inc(host=host, code=response.status_code)
+        if response.status_code >= 500:
+            breaker.record_failure()
+            self.stats["failures"] += 1
+        else:
+            breaker.record_success()
+        if response.status_code == 429:
+            self.stats["rate_limited"] += 1
+        _check_throttle(self.governor, host, response)
+        return response
+
+    async def aclose(self):
+        await self.session.close()
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["circuits"] = {host: b.state for host, b in self._breakers.items()}
+        return stats
+
+
+# Shared client used by all front-ends.
+client = HTTPClient()
+
+
+def get(url, params=None, timeout=None):
+    return client.get(url, params=params, timeout=timeout)
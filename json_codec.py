@@ -0,0 +1,188 @@
+import json
+import os
+from typing import List, Optional, TypedDict, Union
+
+import requests
+
+# --- JSON Codec ---
+# Every JSON body WeatherPy parses or sends goes through one codec. It uses
+# orjson when installed, else msgspec, else the standard library; set
+# WEATHERPY_JSON to pin one. Output is always compact UTF-8 bytes, ready to be
+# written to the socket, so no front-end re-encodes a str.
+#
+# Upstream replies carry far more than WeatherPy reads (units, elevation,
+# timezone names, postcodes, feature codes...). The decode_* functions keep
+# only the fields below, as plain dicts with numbers left exactly as upstream
+# sent them; rounding and units are applied by the Weather/Forecast
+# formatting at the edge. With msgspec installed the trimming happens while
+# parsing, against the typed shapes below, so unused fields are skipped
+# rather than built and thrown away (see benchmarks/codec_cost.py).
+
+JSON_LIBRARY = os.environ.get("WEATHERPY_JSON", "auto")   # auto | orjson | msgspec | stdlib
+
+Number = Union[int, float, None]
+
+
+# weather_core.CURRENT_VARIABLES, plus the observation time.
+class CurrentBlock(TypedDict, total=False):
+    time: Union[str, int, None]
+    temperature_2m: Number
+    relative_humidity_2m: Number
+    weather_code: Number
+    wind_speed_10m: Number
+
+
+class ForecastReply(TypedDict, total=False):
+    current: CurrentBlock
+
+
+class GeocodeResult(TypedDict, total=False):
+    name: Optional[str]
+    admin1: Optional[str]
+    country: Optional[str]
+    latitude: Number
+    longitude: Number
+    population: Number
+
+
+class GeocodeReply(TypedDict, total=False):
+    results: List[GeocodeResult]
+
+
+# Only these fields of upstream replies are kept.
+CURRENT_FIELDS = tuple(CurrentBlock.__annotations__)
+LOCATION_FIELDS = tuple(GeocodeResult.__annotations__)
+SERIES_FIELDS = ('utc_offset_seconds', 'hourly', 'daily')
+
+
+def _untuple(value):
+    # orjson only serializes exact tuples; namedtuples become lists.
+    if isinstance(value, tuple):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def _library(name):
+    """
+    (name, loads, dumps) for a JSON_LIBRARY setting. Naming a library that
+    is not installed raises ImportError; "auto" falls through to the next.
+    """
+    if name in ("auto", "orjson"):
+        try:
+            import orjson
+        except ImportError:
+            if name == "orjson":
+                raise
+        else:
+            options = orjson.OPT_NON_STR_KEYS
+            return "orjson", orjson.loads, lambda value: orjson.dumps(value, default=_untuple, option=options)
+    if name in ("auto", "msgspec"):
+        try:
+            import msgspec
+        except ImportError:
+            if name == "msgspec":
+                raise
+        else:
+            return "msgspec", msgspec.json.decode, msgspec.json.Encoder(enc_hook=_untuple).encode
+    if name not in ("auto", "stdlib"):
+        raise ValueError(f"Unknown WEATHERPY_JSON library {name!r}")
+    # json.dumps() with arguments builds a new encoder on every call.
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_untuple).encode
+    return "stdlib", json.loads, lambda value: encode(value).encode("utf-8")
+
+
+def _trim(value, fields):
+    if not isinstance(value, dict):
+        raise ValueError("Unexpected JSON shape in upstream reply")
+    return {field: value[field] for field in fields if field in value}
+
+
+def _locations(payload):
+    results = _trim(payload, ('results',)).get('results') or []
+    return [_trim(result, LOCATION_FIELDS) for result in results]
+
+
+def _current_blocks(payload):
+    # A single location comes back as an object, several as a list.
+    if isinstance(payload, dict):
+        payload = [payload]
+    if not isinstance(payload, list):
+        raise ValueError("Unexpected JSON shape in upstream reply")
+    return [_trim(_trim(item, ('current',)).get('current') or {}, CURRENT_FIELDS) for item in payload]
+
+
+def _series(payload):
+    return _trim(payload, SERIES_FIELDS)
+
+
+class JSONCodec:
+    """
+    loads()/dumps() over the selected JSON library, plus decoders that read
+    only the fields WeatherPy uses out of Open-Meteo replies.
+    """
+
+    def __init__(self, library=JSON_LIBRARY):
+        self.name, self.loads, self.dumps = _library(library)
+        self._typed = {}
+        if library in ("auto", "msgspec"):
+            try:
+                import msgspec
+            except ImportError:
+                pass
+            else:
+                self._typed = {
+                    _locations: msgspec.json.Decoder(GeocodeReply).decode,
+                    _current_blocks: msgspec.json.Decoder(Union[ForecastReply, List[ForecastReply]]).decode,
+                }
+        self.stats = {"decode_errors": 0}
+
+    def _decode(self, data, extract):
+        """
+        Parses an upstream reply (typed when there is a decoder for it) and
+        extracts the fields used. Malformed or unexpected JSON is raised as
+        requests' JSONDecodeError, which the fetch paths already handle like
+        any failed upstream call.
+        """
+        try:
+            return extract(self._typed.get(extract, self.loads)(data))
+        except ValueError as e:   # every library's decode errors are ValueErrors
+            self.stats["decode_errors"] += 1
+            raise requests.exceptions.JSONDecodeError(str(e), "", 0) from e
+
+    def decode_locations(self, data):
+        """
+        The results of a geocoding reply, trimmed to LOCATION_FIELDS.
+        """
+        return self._decode(data, _locations)
+
+    def decode_current_many(self, data):
+        """
+        The `current` blocks of a multi-location forecast reply, in order,
+        trimmed to CURRENT_FIELDS.
+        """
+        return self._decode(data, _current_blocks)
+
+    def decode_current(self, data):
+        """
+        The `current` block of a single-location forecast reply.
+        """
+        blocks = self._decode(data, _current_blocks)
+        return blocks[0] if blocks else {}
+
+    def decode_series(self, data):
+        """
+        The hourly and daily series of a forecast reply. Columns are long
+        arrays of numbers, which the untyped parsers build fastest, so they
+        are parsed whole and only the surrounding fields are dropped.
+        """
+        return self._decode(data, _series)
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["library"] = self.name
+        stats["typed_decoding"] = bool(self._typed)
+        return stats
+
+
+# Shared instance used by all front-ends.
+codec = JSONCodec()
@@ -0,0 +1,250 @@
+import asyncio
+import os
+import threading
+
+import requests
+
+from forecast_cache import cache_key, forecast_cache
+from governor import RateLimitedError
+from json_codec import codec
+from weather_core import CURRENT_VARIABLES, UPSTREAM_BUSY, WEATHER_FAILED, Weather, get_current
+
+# --- Live Weather Streams ---
+# Server-sent events for /weather/stream. Everyone watching the same location
+# shares one channel: a single thread polls the forecast cache for it, waking
+# just after the cached `current` block expires, and pushes an event to every
+# subscriber only when the values have changed. A thousand watchers of one
+# city therefore cost one upstream poll per update interval. Each event is
+# encoded once and the same bytes are handed to every subscriber. Subscribers
+# hold only the latest event, so a slow client skips to the newest values
+# rather than queueing old ones.
+#
+# In the Flask app each open stream holds one of the worker's threads, so at
+# most MAX_THREAD_STREAMS are open per worker; further watchers get a 503 that
+# tells EventSource when to come back, and ordinary requests keep threads to
+# run on. The ASGI app holds no thread per stream and has no such cap.
+
+HEARTBEAT = 15          # seconds between keep-alive comments on an idle stream
+STALE_RETRY = 2         # poll again this soon while a stale entry is refreshed
+ERROR_RETRY = 10
+RECONNECT_MS = 5000     # client reconnect delay advertised to EventSource
+STREAM_HEADERS = [("Content-Type", "text/event-stream"), ("Cache-Control", "no-cache"),
+                  ("X-Accel-Buffering", "no")]
+KEEPALIVE = b": keepalive\n\n"
+PREAMBLE = f"retry: {RECONNECT_MS}\n\n".encode("ascii")
+MAX_THREAD_STREAMS = int(os.environ.get("WEATHERPY_MAX_THREAD_STREAMS", 4))   # per worker; 0 = no cap
+BUSY_RETRY = 30         # seconds a watcher turned away waits before trying again
+BUSY_BODY = f"retry: {BUSY_RETRY * 1000}\n\n".encode("ascii")
+
+
+def format_event(event, payload):
+    """
+    Encodes one server-sent event with a JSON payload.
+    """
+    return b"event: " + event.encode("utf-8") + b"\ndata: " + codec.dumps(payload) + b"\n\n"
+
+
+class Subscription:
+    """
+    Latest-event mailbox for one client served from a thread.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._event = None
+        self.closed = False
+
+    def deliver(self, event):
+        with self._cond:
+            self._event = event
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+    def next(self, timeout=HEARTBEAT):
+        """
+        Waits for the next event; returns None on timeout or once closed.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._event is not None or self.closed, timeout)
+            event, self._event = self._event, None
+            return event
+
+
+class AsyncSubscription:
+    """
+    Latest-event mailbox for one client served from an event loop; events
+    are handed over from the channel thread with call_soon_threadsafe.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+        self._event = None
+        self.closed = False
+
+    def deliver(self, event):
+        self.loop.call_soon_threadsafe(self._set, event)
+
+    def _set(self, event):
+        self._event = event
+        self._ready.set()
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    async def next(self, timeout=HEARTBEAT):
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._ready.clear()
+        event, self._event = self._event, None
+        return event
+
+
+class StreamLimit:
+    """
+    Counts the streams open in this process and refuses new ones past
+    `limit` (0 = no limit).
+    """
+
+    def __init__(self, limit=MAX_THREAD_STREAMS):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self.stats = {"open": 0, "rejected": 0}
+
+    def acquire(self):
+        with self._lock:
+            if self.limit and self.stats["open"] >= self.limit:
+                self.stats["rejected"] += 1
+                return False
+            self.stats["open"] += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.stats["open"] -= 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["limit"] = self.limit
+        return stats
+
+
+class Channel:
+    """
+    Subscribers and last published state for one location.
+    """
+
+    def __init__(self, location):
+        self.location = location
+        self.key = cache_key(location.latitude, location.longitude, CURRENT_VARIABLES)
+        self.subscribers = set()
+        self.last_weather = None
+        self.last_error = None
+        self.last_event = None
+        self.stop = threading.Event()
+
+
+class StreamHub:
+    """
+    One polling thread per watched location, fanning out change events.
+    """
+
+    def __init__(self):
+        self._channels = {}   # Location -> Channel
+        self._lock = threading.Lock()
+        self.stats = {"channels_started": 0, "polls": 0, "updates": 0, "events_sent": 0, "errors": 0}
+
+    def subscribe(self, location, subscriber):
+        """
+        Adds a subscriber for `location`, starting its channel if needed.
+        The latest event, if any, is delivered straight away.
+        """
+        with self._lock:
+            channel = self._channels.get(location)
+            if channel is None:
+                channel = self._channels[location] = Channel(location)
+                self.stats["channels_started"] += 1
+                threading.Thread(target=self._run, args=(channel,), name="weather-stream", daemon=True).start()
+            channel.subscribers.add(subscriber)
+            last_event = channel.last_event
+        if last_event is not None:
+            subscriber.deliver(last_event)
+
+    def unsubscribe(self, location, subscriber):
+        """
+        Removes a subscriber; the channel stops with its last subscriber.
+        """
+        with self._lock:
+            channel = self._channels.get(location)
+            if channel is None:
+                return
+            channel.subscribers.discard(subscriber)
+            if not channel.subscribers:
+                del self._channels[location]
+                channel.stop.set()
+
+    def _run(self, channel):
+        while not channel.stop.is_set():
+            channel.stop.wait(self.poll(channel))
+
+    def poll(self, channel):
+        """
+        Reads the channel's `current` block through the forecast cache and
+        publishes it if it changed. Returns the seconds until the next poll.
+        """
+        with self._lock:
+            self.stats["polls"] += 1
+        try:
+            weather = Weather.from_current(channel.location, *get_current(channel.key))
+            error = None
+        except RateLimitedError:
+            error = UPSTREAM_BUSY
+        except (requests.exceptions.RequestException, KeyError, ValueError):
+            error = WEATHER_FAILED
+
+        if error is not None:
+            with self._lock:
+                self.stats["errors"] += 1
+            # Watchers keep the last good values; only report errors before any.
+            if channel.last_weather is None and error != channel.last_error:
+                channel.last_error = error
+                self._publish(channel, format_event("error", {"error": error}))
+            return ERROR_RETRY
+
+        # Upstream's observation time moves on even when the values do not.
+        last = channel.last_weather
+        if last is None or weather.values != last.values or weather.stale != last.stale:
+            channel.last_weather = weather
+            with self._lock:
+                self.stats["updates"] += 1
+            self._publish(channel, format_event("weather", weather.as_dict()))
+        # Expired entries are refreshed in the background; look again shortly.
+        ttl = forecast_cache.ttl(channel.key)
+        return ttl + 1 if ttl > 0 else STALE_RETRY
+
+    def _publish(self, channel, event):
+        with self._lock:
+            channel.last_event = event
+            subscribers = list(channel.subscribers)
+            self.stats["events_sent"] += len(subscribers)
+        for subscriber in subscribers:
+            subscriber.deliver(event)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["channels"] = len(self._channels)
+            stats["subscribers"] = sum(len(channel.subscribers) for channel in self._channels.values())
+        return stats
+
+
+# Shared instance used by the web front-ends.
+stream_hub = StreamHub()
@@ -0,0 +1,220 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+
+import tracing
+
+# --- Metrics ---
+# Minimal Prometheus-style counters, gauges and histograms, rendered in the
+# text exposition format on /metrics. Each update takes one short lock, so the
+# instrumentation is cheap enough to leave on in production. Values are per
+# process; Prometheus aggregates across workers.
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        """
+        Counts the enclosed block as in progress.
+        """
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(float(bound))))
+                yield self.name + "_bucket", labels, cumulative
+            labels = _format_labels(self.labelnames, key)
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, count
+
+
+class Registry:
+    """
+    Holds metrics plus collector callbacks that report externally kept
+    counters (cache statistics, for instance) at scrape time.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def add_collector(self, collector):
+        """
+        `collector()` returns an iterable of (name, kind, help, labels_dict, value).
+        """
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        # Samples of one family must be contiguous, so group collector output.
+        families = {}
+        for collector in self._collectors:
+            for name, kind, help_text, labels, value in collector():
+                family = families.setdefault(name, (kind, help_text, []))
+                label_str = _format_labels(tuple(labels), tuple(labels.values()))
+                family[2].append(f"{name}{label_str} {_format_value(value)}")
+        for name, (kind, help_text, samples) in families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = Registry()
+
+# --- Hot-path metrics shared by the front-ends ---
+
+STAGE_SECONDS = registry.histogram(
+    "weatherpy_stage_seconds", "Time spent per request stage.", ("stage",))
+REQUESTS = registry.counter(
+    "weatherpy_requests_total", "HTTP requests served.", ("endpoint", "status"))
+REQUEST_SECONDS = registry.histogram(
+    "weatherpy_request_seconds", "End-to-end request latency.", ("endpoint",))
+IN_FLIGHT = registry.gauge(
+    "weatherpy_requests_in_flight", "Requests currently being served.")
+UPSTREAM_RESPONSES = registry.counter(
+    "weatherpy_upstream_responses_total", "Upstream responses by host and status code.", ("host", "code"))
+UPSTREAM_SECONDS = registry.histogram(
+    "weatherpy_upstream_seconds", "Upstream call latency including retries.", ("host",))
+
+
+def stage(name):
+    """
+    Times a request stage: `with stage("geocode"): ...`. In a traced request
+    (see tracing.py) the stage is also recorded as a span.
+    """
+    if not tracing.active():
+        return STAGE_SECONDS.time(stage=name)
+    return tracing.span(name, on_end=partial(STAGE_SECONDS.observe, stage=name))
+
+
+def stats_collector(prefix, stats_fn, labels):
+    """
+    Turns a get_stats() dict into gauge samples, e.g. for cache counters.
+    Nested dicts and non-numeric values are skipped.
+    """
+    def collect():
+        for key, value in stats_fn().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            yield f"{prefix}_{key}", "gauge", f"{prefix} {key.replace('_', ' ')}", labels, value
+    return collect
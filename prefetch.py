@@ -0,0 +1,260 @@
+import atexit
+import json
+import math
+import os
+import threading
+import time
+
+import requests
+
+from forecast_cache import cache_key, forecast_cache, next_update
+from governor import PREFETCH, RateLimitedError, with_priority
+from state_paths import state_path
+from weather_core import BATCH_CHUNK_SIZE, CURRENT_VARIABLES, chunked, fetch_chunk
+
+# --- Popular-City Prefetching ---
+# Traffic is heavily skewed toward a few hundred places, so each web process
+# keeps a decaying request count per forecast grid cell and refreshes the
+# hottest cells itself, with batched multi-location calls, as soon as their
+# cached `current` block expires. Expiry is aligned to the upstream update
+# schedule (see forecast_cache.next_update), which is also when new data
+# becomes available, so refreshing any earlier would only fetch the same
+# block again. Upstream calls are limited by a token bucket and run at the
+# governor's prefetch priority, so they only use spare upstream capacity; the
+# counts are saved to disk so a freshly started worker warms the same cells
+# straight away.
+
+PREFETCH_ENABLED = os.environ.get("WEATHERPY_PREFETCH", "1") != "0"
+STATE_PATH = state_path("WEATHERPY_PREFETCH_STATE", "prefetch.json")
+BUDGET_PER_MINUTE = float(os.environ.get("WEATHERPY_PREFETCH_BUDGET", 30))  # upstream calls
+HOT_SET_SIZE = int(os.environ.get("WEATHERPY_PREFETCH_KEYS", 500))
+HALF_LIFE = 60 * 60            # popularity halves after an hour without requests
+MAX_TRACKED = 5000
+MAX_SLEEP = 60                 # seconds between scheduler passes at most
+SAVE_INTERVAL = 5 * 60
+STATE_VERSION = 1
+
+
+class PopularityTracker:
+    """
+    Exponentially decaying request counts per forecast key.
+    """
+
+    def __init__(self, half_life=HALF_LIFE, max_tracked=MAX_TRACKED):
+        self.half_life = half_life
+        self.max_tracked = max_tracked
+        self._entries = {}   # key -> [score, updated, name]
+        self._lock = threading.Lock()
+
+    def _decayed(self, entry, now):
+        return entry[0] * math.pow(0.5, (now - entry[1]) / self.half_life)
+
+    def record(self, key, name, weight=1.0, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = [weight, now, name]
+                if len(self._entries) > self.max_tracked:
+                    self._prune(now)
+            else:
+                entry[0] = self._decayed(entry, now) + weight
+                entry[1] = now
+                entry[2] = name
+
+    def _prune(self, now):
+        # Drop the coldest tenth in one go rather than one entry per insert.
+        ranked = sorted(self._entries, key=lambda k: self._decayed(self._entries[k], now))
+        for key in ranked[:max(1, len(ranked) // 10)]:
+            del self._entries[key]
+
+    def top(self, n, now=None):
+        """
+        The `n` hottest entries as [(score, key, name)], hottest first.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            scored = [(self._decayed(entry, now), key, entry[2]) for key, entry in self._entries.items()]
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored[:n]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class Prefetcher:
+    """
+    Background thread that refreshes the hottest expired forecast keys in
+    batches, spending at most `budget_per_minute` upstream calls.
+    """
+
+    def __init__(self, tracker=None, cache=forecast_cache, state_path=STATE_PATH,
+                 budget_per_minute=BUDGET_PER_MINUTE, hot_set_size=HOT_SET_SIZE):
+        self.tracker = tracker or PopularityTracker()
+        self.cache = cache
+        self.state_path = state_path
+        self.budget_per_minute = budget_per_minute
+        self.hot_set_size = hot_set_size
+        self.tokens = budget_per_minute
+        self._tokens_updated = time.monotonic()
+        self._thread = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self.stats = {"passes": 0, "keys_refreshed": 0, "upstream_calls": 0, "errors": 0,
+                      "deferred": 0, "saves": 0}
+
+    def record(self, weather):
+        """
+        Counts a served Weather result toward its grid cell's popularity.
+        """
+        self.tracker.record(cache_key(weather.latitude, weather.longitude, CURRENT_VARIABLES), weather.city)
+
+    # --- Scheduling ---
+
+    def ensure_started(self):
+        """
+        Starts the scheduler thread once per process. Called lazily (first
+        request, ASGI startup) so forking servers start it in each worker.
+        """
+        if self._thread is not None or not PREFETCH_ENABLED:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                if not len(self.tracker):   # a preloading server may have loaded it already
+                    self.load()
+                atexit.register(self.save)
+                self._thread = threading.Thread(target=self._run, name="weather-prefetch", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.save()
+
+    def _run(self):
+        last_save = time.monotonic()
+        while not self._stop.is_set():
+            self.run_once()
+            if time.monotonic() - last_save >= SAVE_INTERVAL:
+                self.save()
+                last_save = time.monotonic()
+            # Wake up just after the next upstream update lands, or sooner.
+            now = time.time()
+            self._stop.wait(min(MAX_SLEEP, max(1.0, next_update(now, self.cache.interval) - now + 1)))
+
+    def _refill(self):
+        now = time.monotonic()
+        rate = self.budget_per_minute / 60.0
+        self.tokens = min(self.budget_per_minute, self.tokens + (now - self._tokens_updated) * rate)
+        self._tokens_updated = now
+
+    def run_once(self):
+        """
+        One scheduler pass: refreshes hot keys that are missing or expired,
+        hottest first, as far as the budget allows. Returns the keys refreshed.
+        """
+        self.stats["passes"] += 1
+        self._refill()
+        hot = [key for score, key, name in self.tracker.top(self.hot_set_size)]
+        due = [key for key, ttl in zip(hot, self.cache.ttl_many(hot)) if ttl <= 0]
+        capacity = int(self.tokens) * BATCH_CHUNK_SIZE
+        if len(due) > capacity:
+            self.stats["deferred"] += len(due) - capacity
+            due = due[:capacity]
+        claimed = [key for key in due if self.cache.claim_refresh(key)]
+
+        refreshed = []
+        rate_limited = False
+        for keys in chunked(claimed, BATCH_CHUNK_SIZE):
+            if rate_limited:
+                # No spare upstream capacity; leave the rest for the next pass.
+                self.stats["deferred"] += len(keys)
+                for key in keys:
+                    self.cache.finish_refresh(key, 0.0, False)
+                continue
+            self.tokens -= 1
+            self.stats["upstream_calls"] += 1
+            started = time.perf_counter()
+            ok = True
+            try:
+                with_priority(PREFETCH, fetch_chunk, keys)
+                refreshed.extend(keys)
+            except RateLimitedError:
+                ok = False
+                rate_limited = True
+                self.stats["deferred"] += len(keys)
+            except (requests.exceptions.RequestException, ValueError):
+                ok = False
+                self.stats["errors"] += 1
+            elapsed = time.perf_counter() - started
+            for key in keys:
+                self.cache.finish_refresh(key, elapsed, ok)
+        self.stats["keys_refreshed"] += len(refreshed)
+        return refreshed
+
+    # --- Persistence ---
+
+    def save(self):
+        """
+        Writes the hot set to STATE_PATH atomically. Workers sharing the file
+        simply overwrite each other; any recent snapshot is good enough.
+        """
+        if not self.state_path or not len(self.tracker):
+            return
+        now = time.time()
+        entries = [{"lat": key[0], "lon": key[1], "name": name, "score": round(score, 4)}
+                   for score, key, name in self.tracker.top(self.tracker.max_tracked, now)]
+        tmp = f"{self.state_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as handle:
+                json.dump({"version": STATE_VERSION, "saved": now, "entries": entries}, handle)
+            os.replace(tmp, self.state_path)
+            self.stats["saves"] += 1
+        except OSError:
+            pass
+
+    def load(self):
+        """
+        Seeds the tracker from STATE_PATH, decayed by the time since it was saved.
+        """
+        try:
+            with open(self.state_path, encoding="utf-8") as handle:
+                state = json.load(handle)
+        except (OSError, ValueError):
+            return 0
+        if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+            return 0
+        entries = state.get("entries")
+        try:
+            saved = float(state.get("saved", time.time()))
+        except (TypeError, ValueError):
+            return 0
+        if not isinstance(entries, list) or not math.isfinite(saved):
+            return 0
+        loaded = 0
+        for entry in entries:
+            # Damaged entries are skipped; they must not keep a server from starting.
+            try:
+                lat, lon = float(entry["lat"]), float(entry["lon"])
+                score = float(entry.get("score", 1.0))
+            except (KeyError, TypeError, ValueError, AttributeError):
+                continue
+            if not (math.isfinite(lat) and math.isfinite(lon) and math.isfinite(score)) or score <= 0:
+                continue
+            name = entry.get("name")
+            key = cache_key(lat, lon, CURRENT_VARIABLES)
+            self.tracker.record(key, name if isinstance(name, str) else None, weight=score, now=saved)
+            loaded += 1
+        return loaded
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["tracked"] = len(self.tracker)
+        stats["tokens"] = round(self.tokens, 2)
+        stats["enabled"] = PREFETCH_ENABLED
+        return stats
+
+
+# Shared instance used by the web front-ends.
+prefetcher = Prefetcher()
@@ -0,0 +1,128 @@
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# --- Sampling Profiler ---
+# GET /admin/profile?seconds=10 samples the Python stack of every thread of
+# the worker that answers, every few milliseconds, and returns the counts in
+# collapsed-stack format ("thread;file:function;file:function count" per
+# line), which flamegraph.pl, speedscope and inferno render as a flame graph.
+# Nothing runs unless a profile is requested; sampling only costs while it
+# lasts. The endpoint is disabled unless WEATHERPY_ADMIN_TOKEN is set, and
+# then requires "Authorization: Bearer <token>".
+
+ADMIN_TOKEN = os.environ.get("WEATHERPY_ADMIN_TOKEN", "")
+DEFAULT_SECONDS = 10
+MAX_SECONDS = 60
+DEFAULT_INTERVAL_MS = 5
+MIN_INTERVAL_MS = 1
+COLLAPSED_CONTENT_TYPE = "text/plain; charset=utf-8"
+# Leaf functions of threads that are only waiting (locks, sockets, sleeps);
+# dropped when the caller asks for busy threads only.
+IDLE_FUNCTIONS = frozenset((
+    "wait", "wait_for", "_wait_for_tstate_lock", "acquire", "sleep", "select", "poll", "epoll", "accept",
+    "recv", "recv_into", "readinto", "readline", "get", "_worker", "_run_once", "run_forever",
+))
+
+
+class ProfileBusyError(Exception):
+    """Raised when a profile is already running in this process."""
+
+
+def admin_authorized(authorization, token=ADMIN_TOKEN):
+    """
+    Checks an Authorization header against WEATHERPY_ADMIN_TOKEN.
+    Returns None if admin endpoints are disabled, else True or False.
+    """
+    if not token:
+        return None
+    scheme, _, presented = (authorization or "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(presented.strip(), token)
+
+
+def parse_options(seconds, interval_ms, idle):
+    """
+    Validates /admin/profile query values (strings or None).
+    Returns (seconds, interval, include_idle, None) or (None, None, None, error_message).
+    """
+    try:
+        seconds = DEFAULT_SECONDS if seconds in (None, "") else float(seconds)
+        interval_ms = DEFAULT_INTERVAL_MS if interval_ms in (None, "") else float(interval_ms)
+    except ValueError:
+        return None, None, None, "seconds and interval_ms must be numbers"
+    if not 0 < seconds <= MAX_SECONDS:
+        return None, None, None, f"seconds must be between 0 and {MAX_SECONDS}"
+    if interval_ms < MIN_INTERVAL_MS:
+        return None, None, None, f"interval_ms must be at least {MIN_INTERVAL_MS}"
+    return seconds, interval_ms / 1000.0, idle in ("1", "true"), None
+
+
+def _frame_label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """
+    Wall-clock stack sampler over sys._current_frames(). One profile runs
+    at a time per process.
+    """
+
+    def __init__(self):
+        self._running = threading.Lock()
+        self.stats = {"profiles": 0, "samples": 0, "busy_rejections": 0}
+
+    def sample(self, seconds, interval, include_idle=False):
+        """
+        Samples every other thread for `seconds`. Returns a Counter of
+        collapsed stacks (root first, ';'-separated) to sample counts.
+        """
+        if not self._running.acquire(blocking=False):
+            self.stats["busy_rejections"] += 1
+            raise ProfileBusyError("A profile is already running in this worker")
+        try:
+            own = threading.get_ident()
+            names = {}
+            stacks = Counter()
+            deadline = time.monotonic() + seconds
+            samples = 0
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    if not include_idle and frame.f_code.co_name in IDLE_FUNCTIONS:
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(_frame_label(frame.f_code))
+                        frame = frame.f_back
+                    if ident not in names:
+                        names = {thread.ident: thread.name for thread in threading.enumerate()}
+                    labels.append(names.get(ident, f"thread-{ident}"))
+                    stacks[";".join(reversed(labels))] += 1
+                samples += 1
+                time.sleep(interval)
+            self.stats["profiles"] += 1
+            self.stats["samples"] += samples
+            return stacks
+        finally:
+            self._running.release()
+
+    def collapsed(self, seconds, interval, include_idle=False):
+        """
+        Collapsed-stack text for a profile of `seconds`, heaviest stacks first.
+        """
+        stacks = self.sample(seconds, interval, include_idle)
+        lines = [f"{stack} {count}" for stack, count in stacks.most_common()]
+        return ("\n".join(lines) + "\n" if lines else "").encode("utf-8")
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["running"] = self._running.locked()
+        return stats
+
+
+# Shared instance used by the web front-ends.
+profiler = SamplingProfiler()
@@ -0,0 +1,215 @@
+import argparse
+import os
+import shutil
+import signal
+import sys
+import time
+
+# --- Production Serving ---
+# `python serve.py` runs the web app under gunicorn with the settings in
+# gunicorn.conf.py, instead of the Werkzeug development server. Requests spend
+# most of their time waiting on Open-Meteo or on the shared caches, so the
+# sync app runs threaded (gthread) workers: one Python process per GIL's worth
+# of CPU, each with enough threads to keep upstream calls overlapping. The app
+# is imported and its caches warmed once in the master before forking, so
+# workers start with the gazetteer mapped, the suggestion index built and the
+# popular cities' entries in memory. gevent workers and the ASGI app (one
+# uvicorn event loop per worker) are available as alternatives.
+#
+#   python serve.py                  start (foreground)
+#   python serve.py reload           re-read config, replace workers gracefully
+#   python serve.py upgrade          start a new master with new code, then
+#                                    retire the old one without dropping requests
+#   python serve.py stop             graceful shutdown
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.path.join(ROOT, "gunicorn.conf.py")
+
+BIND = os.environ.get("WEATHERPY_BIND", "0.0.0.0:8000")
+SERVER = os.environ.get("WEATHERPY_SERVER", "sync")                   # sync (Flask) or async (ASGI)
+WORKER_CLASS = os.environ.get("WEATHERPY_WORKER_CLASS", "auto")       # auto, gthread or gevent
+WORKERS = int(os.environ.get("WEATHERPY_WORKERS", 0))                 # 0: from the CPU count
+THREADS = int(os.environ.get("WEATHERPY_THREADS", 0))                 # 0: THREADS_PER_WORKER
+PIDFILE = os.environ.get("WEATHERPY_PIDFILE", ".weatherpy_gunicorn.pid")
+GRACEFUL_TIMEOUT = int(os.environ.get("WEATHERPY_GRACEFUL_TIMEOUT", 30))
+ACCESS_LOG = os.environ.get("WEATHERPY_ACCESS_LOG") or None            # path, or "-" for stderr
+
+APPS = {"sync": "weather_webApp:app", "async": "weather_asgi:app"}
+WORKERS_PER_CPU = 2            # best sync throughput in the serving benchmark (see README)
+MAX_WORKERS = 16               # each worker has its own L1 caches and upstream pools
+THREADS_PER_WORKER = 16        # concurrent upstream waits per sync worker
+GEVENT_CONNECTIONS = 1000      # greenlets per gevent worker
+UPGRADE_TIMEOUT = 30           # seconds to wait for a new master's pidfile
+
+
+def cpu_count():
+    """
+    CPUs this process may use: the affinity mask, further limited by a
+    cgroup v2 CPU quota when running in a container.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as handle:
+            quota, period = handle.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def gevent_available():
+    try:
+        import gevent  # noqa: F401  optional: only for WEATHERPY_WORKER_CLASS=gevent
+    except ImportError:
+        return False
+    return True
+
+
+def uvicorn_worker_class():
+    try:
+        import uvicorn_worker  # noqa: F401  the maintained home of UvicornWorker
+    except ImportError:
+        return "uvicorn.workers.UvicornWorker"
+    return "uvicorn_worker.UvicornWorker"
+
+
+def worker_profile(cpus=None, server=SERVER, worker_class=WORKER_CLASS, workers=WORKERS, threads=THREADS):
+    """
+    Gunicorn worker settings for this machine, as a dict of config names.
+    Explicit settings win; zero or "auto" means tuned from the CPU count.
+    """
+    cpus = cpu_count() if cpus is None else cpus
+    if server == "async":
+        # One event loop per CPU already overlaps every upstream wait.
+        return {"worker_class": uvicorn_worker_class(), "workers": workers or min(cpus, MAX_WORKERS),
+                "threads": 1, "preload_app": True}
+    workers = workers or min(cpus * WORKERS_PER_CPU, MAX_WORKERS)
+    if worker_class == "auto":
+        worker_class = "gthread"
+    if worker_class == "gevent":
+        if not gevent_available():
+            raise SystemExit("WEATHERPY_WORKER_CLASS=gevent needs the gevent package (pip install gevent)")
+        # gevent must patch the standard library before the app imports it,
+        # so the app is loaded in each worker instead of in the master.
+        return {"worker_class": "gevent", "workers": workers, "threads": 1,
+                "worker_connections": GEVENT_CONNECTIONS, "preload_app": False}
+    return {"worker_class": worker_class, "workers": workers, "threads": threads or THREADS_PER_WORKER,
+            "preload_app": True}
+
+
+def warm_up():
+    """
+    Loads what every worker would otherwise load on its first requests.
+    Runs in the master before forking, so the work is done once and the
+    memory is shared copy-on-write. Nothing here opens upstream connections.
+    """
+    from forecast_cache import forecast_cache
+    from gazetteer import gazetteer
+    from geocache import geocode_cache
+    from prefetch import prefetcher
+    from snapshot import snapshotter
+    from suggest import suggest_index
+
+    started = time.perf_counter()
+    gazetteer.available   # maps the file
+    # Before the suggest index, which is built from the geocode cache.
+    restored = snapshotter.load()
+    suggest_index.load()
+    tracked = prefetcher.load()
+    # Pull the popular cities' entries from the shared tiers into memory.
+    hot = prefetcher.tracker.top(prefetcher.hot_set_size)
+    geocode_cache.warm(name for score, key, name in hot if name)
+    forecast_cache.warm([key for score, key, name in hot])
+    print(f"Warmed caches in {time.perf_counter() - started:.2f}s "
+          f"({restored} snapshot entries, {tracked} popular cells)", file=sys.stderr)
+
+
+def after_fork():
+    """
+    Per-worker start-up, once the worker is initialised (and, for gevent,
+    patched): background threads do not survive fork().
+    """
+    from prefetch import prefetcher
+    from snapshot import snapshotter
+
+    snapshotter.ensure_started()
+    prefetcher.ensure_started()
+
+
+def read_pid(path):
+    try:
+        with open(path) as handle:
+            return int(handle.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def signal_master(sig, pidfile=PIDFILE):
+    pid = read_pid(pidfile)
+    if pid is None:
+        raise SystemExit(f"No running server found ({pidfile} is missing)")
+    os.kill(pid, sig)
+    return pid
+
+
+def upgrade(pidfile=PIDFILE, timeout=UPGRADE_TIMEOUT):
+    """
+    Zero-downtime code upgrade. USR2 makes the master start a new master
+    (with freshly imported code) that shares its sockets and writes
+    `<pidfile>.2`; once it is up the old master is shut down gracefully and
+    the new one takes over the pidfile.
+    """
+    old_pid = signal_master(signal.SIGUSR2, pidfile)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        new_pid = read_pid(pidfile + ".2")
+        if new_pid is not None and new_pid != old_pid:
+            os.kill(old_pid, signal.SIGTERM)
+            return new_pid
+        time.sleep(0.2)
+    raise SystemExit("The new master did not start; the old one keeps serving")
+
+
+def gunicorn_script():
+    # The console script rather than `python -m gunicorn`: on upgrade the
+    # master re-executes its own argv, and running gunicorn/__main__.py as a
+    # script would put gunicorn's `http` package ahead of the standard one.
+    script = os.path.join(os.path.dirname(sys.executable), "gunicorn")
+    if not os.path.exists(script):
+        script = shutil.which("gunicorn")
+    if script is None:
+        raise SystemExit("gunicorn is not installed (pip install -r requirements.txt)")
+    return script
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run WeatherPy under gunicorn.")
+    parser.add_argument("command", nargs="?", default="start", choices=("start", "reload", "upgrade", "stop"))
+    parser.add_argument("--bind", help=f"address to listen on (default {BIND})")
+    parser.add_argument("--async", dest="asgi", action="store_true", help="serve the ASGI app")
+    args = parser.parse_args()
+
+    if args.command == "reload":
+        # With preload_app, HUP restarts the workers but keeps the loaded code.
+        signal_master(signal.SIGHUP)
+    elif args.command == "upgrade":
+        print(f"Now serving from master {upgrade()}")
+    elif args.command == "stop":
+        signal_master(signal.SIGTERM)
+    else:
+        if args.bind:
+            os.environ["WEATHERPY_BIND"] = args.bind
+        server = "async" if args.asgi else SERVER
+        os.environ["WEATHERPY_SERVER"] = server
+        os.chdir(ROOT)
+        os.execv(gunicorn_script(), [gunicorn_script(), "-c", CONFIG_PATH, APPS[server]])
+
+
+# --- Main Execution ---
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+try:
+    import fcntl
+except ImportError:  # Windows: cross-process coalescing is unavailable
+    fcntl = None
+
+# --- Single-Flight Request Coalescing ---
+# Concurrent callers asking for the same key share one in-flight call and all
+# receive its result or its exception. Optionally a per-key lock file also
+# serialises the call across worker processes, so that a worker arriving late
+# finds the result in a shared cache (e.g. the SQLite geocoding tier) instead
+# of repeating the upstream request.
+
+LOCK_DIR = os.environ.get("WEATHERPY_SINGLEFLIGHT_LOCK_DIR")
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into a single execution.
+    """
+
+    def __init__(self, lock_dir=None):
+        self.lock_dir = lock_dir if fcntl is not None else None
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "executions": 0, "collapsed": 0, "process_waits": 0}
+
+    @contextmanager
+    def _process_lock(self, key):
+        if not self.lock_dir:
+            yield
+            return
+        name = hashlib.sha1(repr(key).encode("utf-8")).hexdigest() + ".lock"
+        with open(os.path.join(self.lock_dir, name), "a") as handle:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another worker is already fetching this key; wait for it.
+                with self._lock:
+                    self.stats["process_waits"] += 1
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def do(self, key, fn):
+        """
+        Runs `fn()` unless a call for `key` is already in flight, in which
+        case waits for that call and returns (or raises) its outcome.
+        """
+        with self._lock:
+            self.stats["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.stats["executions"] += 1
+            else:
+                self.stats["collapsed"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            with self._process_lock(key):
+                call.result = fn()
+        except BaseException as e:
+            # Followers must not mistake an interrupted call for a None result.
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
+
+
+class AsyncSingleFlight:
+    """
+    asyncio counterpart of SingleFlight for coroutines on one event loop.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.stats = {"calls": 0, "executions": 0, "collapsed": 0}
+
+    async def do(self, key, fn):
+        """
+        Awaits `fn()` unless a call for `key` is already in flight, in which
+        case awaits that call's outcome instead.
+        """
+        self.stats["calls"] += 1
+        task = self._calls.get(key)
+        if task is None:
+            self.stats["executions"] += 1
+            # The call runs in a task of its own, so that the caller which
+            # started it being cancelled (a client disconnecting) does not
+            # cancel it for everyone else waiting on the same key.
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(partial(self._finished, key))
+        else:
+            self.stats["collapsed"] += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved when nobody else was waiting.
+            task.exception()
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["in_flight"] = len(self._calls)
+        return stats
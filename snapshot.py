@@ -0,0 +1,302 @@
+import atexit
+import gc
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from cache_backends import decode, encode
+from json_codec import codec
+from state_paths import state_path
+
+# --- Cache Snapshots ---
+# The geocode and forecast caches can be written to one compact file and read
+# back, so that a freshly started worker, or the CLI with no network, starts
+# warm without a single upstream call. Every process restores
+# WEATHERPY_SNAPSHOT when it starts and rewrites it every SAVE_INTERVAL and at
+# exit; processes sharing the file simply overwrite each other, as with the
+# prefetch state. Entries keep their expiry: restored values are fresh until
+# upstream's next update, and after that are served flagged as stale in
+# degraded mode (see weather_core.last_known) for as long as the caches
+# retain them.
+#
+# File layout, little-endian: MAGIC, uint16 FORMAT_VERSION, then zlib data:
+#   uint32 header length, JSON header {"created", "caches": {name: {"entries",
+#   "json", "typed"}}}, then per cache, in header order, `json` bytes of
+#   [[key, expires, value], ...] for plain values and `typed` bytes of
+#   (uint16 key length, uint32 blob length, key, cache_backends envelope)
+#   records for values with their own binary form (forecast series).
+# Plain values are parsed with one codec.loads per cache rather than one per
+# entry, and the cyclic garbage collector is paused meanwhile, which keeps
+# restoring 100k entries well under a second (see
+# benchmarks/snapshot_restore.py).
+
+SNAPSHOT_PATH = state_path("WEATHERPY_SNAPSHOT", "snapshot")
+SAVE_INTERVAL = float(os.environ.get("WEATHERPY_SNAPSHOT_INTERVAL", 10 * 60))
+MAGIC = b"WPSN"
+FORMAT_VERSION = 1
+PREFIX = struct.Struct("<4sH")
+RECORD = struct.Struct("<HI")
+COMPRESS_LEVEL = 1             # fastest: saves run inside serving processes
+
+
+class SnapshotError(Exception):
+    """Raised for files that are not readable snapshots of this version."""
+
+
+def snapshot_caches():
+    """
+    The caches a snapshot holds: {name: (backend, retain)}, where `retain`
+    is how long past expiry the cache keeps entries.
+    """
+    from forecast_cache import RETAIN, forecast_cache
+    from geocache import geocode_cache
+
+    return {"geocode": (geocode_cache.backend, 0), "forecast": (forecast_cache.backend, RETAIN)}
+
+
+@contextmanager
+def _gc_paused():
+    # Snapshots are hundreds of thousands of small, acyclic containers;
+    # collection passes over them would cost more than the parsing itself.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def dumps(caches, now=None):
+    """
+    Serializes every entry the caches' backends hold into snapshot bytes.
+    Returns (data, entries).
+    """
+    now = time.time() if now is None else now
+    header = {"created": now, "caches": {}}
+    sections = []
+    total = 0
+    for name, (backend, retain) in caches.items():
+        plain, typed = [], []
+        with _gc_paused():
+            for key, value, expires in backend.items():
+                if getattr(type(value), "CACHE_TAG", None) is None:
+                    plain.append((key, expires, value))
+                else:
+                    key_bytes = key.encode("utf-8")
+                    blob = encode(value, expires)
+                    typed.append(RECORD.pack(len(key_bytes), len(blob)) + key_bytes + blob)
+        plain_bytes = codec.dumps(plain)
+        typed_bytes = b"".join(typed)
+        header["caches"][name] = {"entries": len(plain) + len(typed), "json": len(plain_bytes),
+                                  "typed": len(typed_bytes)}
+        sections += (plain_bytes, typed_bytes)
+        total += len(plain) + len(typed)
+    header_bytes = codec.dumps(header)
+    body = struct.pack("<I", len(header_bytes)) + header_bytes + b"".join(sections)
+    return PREFIX.pack(MAGIC, FORMAT_VERSION) + zlib.compress(body, COMPRESS_LEVEL), total
+
+
+def _open(data):
+    """
+    Checks and decompresses snapshot bytes. Returns (header, body, offset of
+    the first section).
+    """
+    if len(data) < PREFIX.size:
+        raise SnapshotError("Truncated snapshot")
+    magic, version = PREFIX.unpack_from(data)
+    if magic != MAGIC:
+        raise SnapshotError("Not a WeatherPy snapshot")
+    if version != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot version {version} (expected {FORMAT_VERSION})")
+    try:
+        body = zlib.decompress(memoryview(data)[PREFIX.size:])
+        header_size, = struct.unpack_from("<I", body)
+        header = codec.loads(body[4:4 + header_size])
+    except (zlib.error, struct.error, ValueError) as e:
+        raise SnapshotError(f"Corrupt snapshot: {e}") from e
+    return header, body, 4 + header_size
+
+
+def describe(data):
+    """
+    The header of a snapshot: {"version", "created", "caches": {...}}.
+    """
+    header, body, offset = _open(data)
+    return dict(header, version=FORMAT_VERSION)
+
+
+def _entries(plain, typed, retain, now):
+    items = [(key, value, expires) for key, expires, value in codec.loads(plain) if expires + retain > now]
+    position = 0
+    while position < len(typed):
+        key_size, blob_size = RECORD.unpack_from(typed, position)
+        position += RECORD.size
+        key = typed[position:position + key_size].decode("utf-8")
+        position += key_size
+        value, expires = decode(typed[position:position + blob_size])
+        position += blob_size
+        if expires + retain > now:
+            items.append((key, value, expires))
+    return items
+
+
+def _merge(backend, items, retain):
+    """
+    Writes `items` to `backend`, except keys it already holds a fresher
+    entry for. Returns the number written.
+    """
+    held = backend.get_many([key for key, value, expires in items])
+    items = [item for item, entry in zip(items, held) if entry is None or entry[1] < item[2]]
+    if items:
+        backend.set_many(items, retain)
+    return len(items)
+
+
+def loads(data, caches, now=None):
+    """
+    Restores snapshot bytes into `caches` (see snapshot_caches()). Entries
+    past their retention are skipped, as are entries a cache already holds a
+    fresher copy of. Returns {name: entries restored}; raises SnapshotError
+    for data that is not a snapshot of this version.
+    """
+    now = time.time() if now is None else now
+    header, body, offset = _open(data)
+    restored = {}
+    for name, section in header["caches"].items():
+        plain = body[offset:offset + section["json"]]
+        offset += section["json"]
+        typed = body[offset:offset + section["typed"]]
+        offset += section["typed"]
+        if name in caches:
+            backend, retain = caches[name]
+            with _gc_paused():
+                restored[name] = _merge(backend, _entries(plain, typed, retain, now), retain)
+    return restored
+
+
+class Snapshotter:
+    """
+    Restores the caches from a snapshot file once per process and keeps the
+    file up to date from a background thread.
+    """
+
+    def __init__(self, path=SNAPSHOT_PATH, interval=SAVE_INTERVAL, caches=None):
+        self.path = path
+        self.interval = interval
+        self._caches = caches
+        self.restored = False
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.stats = {
+            "loads": 0, "load_errors": 0, "restored_entries": 0, "load_seconds": 0.0,
+            "saves": 0, "save_errors": 0, "saved_entries": 0, "save_seconds": 0.0,
+        }
+
+    @property
+    def caches(self):
+        return self._caches if self._caches is not None else snapshot_caches()
+
+    def load(self):
+        """
+        Restores the caches from the snapshot file, if there is one.
+        Returns the number of entries restored.
+        """
+        self.restored = True
+        if not self.path:
+            return 0
+        started = time.perf_counter()
+        try:
+            with open(self.path, "rb") as handle:
+                data = handle.read()
+        except OSError:
+            return 0
+        try:
+            restored = sum(loads(data, self.caches).values())
+        except (SnapshotError, struct.error, ValueError, KeyError, TypeError,
+                AttributeError, OSError) as e:
+            # Any unreadable snapshot, however damaged, means starting cold.
+            self.stats["load_errors"] += 1
+            print(f"Ignoring snapshot {self.path}: {e}", file=sys.stderr)
+            return 0
+        self.stats["loads"] += 1
+        self.stats["restored_entries"] += restored
+        self.stats["load_seconds"] = round(time.perf_counter() - started, 4)
+        return restored
+
+    def save(self):
+        """
+        Writes the caches to the snapshot file atomically. An empty process
+        (nothing restored, nothing fetched) leaves an existing file alone.
+        """
+        if not self.path:
+            return 0
+        started = time.perf_counter()
+        data, entries = dumps(self.caches)
+        if not entries:
+            return 0
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as handle:
+                handle.write(data)
+            os.replace(tmp, self.path)
+        except OSError:
+            self.stats["save_errors"] += 1
+            return 0
+        self.stats["saves"] += 1
+        self.stats["saved_entries"] = entries
+        self.stats["save_seconds"] = round(time.perf_counter() - started, 4)
+        return entries
+
+    def ensure_started(self):
+        """
+        Restores the snapshot (unless a preloading parent already did) and
+        starts the saving thread, once per process.
+        """
+        if self._thread is not None or not self.path:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                if not self.restored:
+                    self.load()
+                atexit.register(self.save)
+                self._thread = threading.Thread(target=self._run, name="weather-snapshot", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.save()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.save()
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["enabled"] = bool(self.path)
+        return stats
+
+
+# Shared instance used by all front-ends.
+snapshotter = Snapshotter()
+
+
+if __name__ == "__main__":
+    # python snapshot.py [path]: describes a snapshot file.
+    path = sys.argv[1] if len(sys.argv) > 1 else SNAPSHOT_PATH
+    try:
+        with open(path, "rb") as handle:
+            info = describe(handle.read())
+    except (OSError, SnapshotError) as e:
+        sys.exit(f"{path}: {e}")
+    age = time.time() - info["created"]
+    print(f"{path}: version {info['version']}, {os.path.getsize(path)} bytes, saved {age / 60:.0f} min ago")
+    for name, section in info["caches"].items():
+        print(f"  {name:<10} {section['entries']:>8} entries")
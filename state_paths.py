@@ -0,0 +1,30 @@
+import os
+
+# --- Local State Files ---
+# The SQLite files and state files WeatherPy keeps between runs (geocoding
+# cache, rate governor bucket, prefetch popularity, cache snapshot) default
+# to one directory rather than the current one, so running the CLI from
+# anywhere leaves nothing behind there: $WEATHERPY_STATE_DIR, else
+# $XDG_CACHE_HOME/weatherpy, else ~/.cache/weatherpy. Each file's own
+# WEATHERPY_* variable still overrides its path.
+
+STATE_DIR = os.environ.get("WEATHERPY_STATE_DIR") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "weatherpy")
+
+
+def state_path(variable, name):
+    """
+    Path of a state file: environment `variable` when set (an empty value
+    disables the file for the modules that allow it), else `name` inside
+    STATE_DIR, which is created if missing. A directory that cannot be
+    created is left to the file's users, which treat storage errors as best
+    effort.
+    """
+    path = os.environ.get(variable)
+    if path is not None:
+        return path
+    try:
+        os.makedirs(STATE_DIR, exist_ok=True)
+    except OSError:
+        pass
+    return os.path.join(STATE_DIR, name)
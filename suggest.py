@@ -0,0 +1,116 @@
+import bisect
+import threading
+from collections import OrderedDict
+
+from gazetteer import gazetteer
+from geocache import geocode_cache, normalize_name
+
+# --- City Autocomplete ---
+# Suggestions are served from memory: a sorted array of normalized names
+# seeded from the geocoding cache (and kept current as new cities are
+# geocoded), merged with prefix matches from the offline gazetteer. Results
+# are ranked by population and memoised per prefix, so repeat keystrokes are
+# answered without any scanning and never reach the upstream API.
+
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+MEMO_SIZE = 4096
+
+
+def location_label(location):
+    """
+    Formats a location dict as "Name, Region, Country".
+    """
+    parts = (location.get('name'), location.get('admin1'), location.get('country'))
+    return ", ".join(part for part in parts if part)
+
+
+class SuggestIndex:
+    """
+    Sorted-array prefix index of city names with popularity-ranked top-k lookup.
+    """
+
+    def __init__(self, cache=geocode_cache, local_geocoder=gazetteer):
+        self.cache = cache
+        self.local_geocoder = local_geocoder
+        self._keys = []       # sorted normalized names
+        self._entries = []    # parallel to _keys: (population, label, name)
+        self._labels = set()
+        self._memo = OrderedDict()
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        # Seed from the shared cache once, then follow new stores.
+        self._loaded = True
+        for location in self.cache.iter_locations():
+            self._insert(location)
+        self.cache.listeners.append(self.add)
+
+    def load(self):
+        """
+        Seeds the index from the geocoding cache, if not done yet.
+        """
+        with self._lock:
+            if not self._loaded:
+                self._load()
+
+    def _insert(self, location):
+        label = location_label(location)
+        key = normalize_name(location.get('name') or '')
+        if not key or label in self._labels:
+            return False
+        index = bisect.bisect_right(self._keys, key)
+        self._keys.insert(index, key)
+        self._entries.insert(index, (location.get('population') or 0, label, location.get('name')))
+        self._labels.add(label)
+        return True
+
+    def add(self, location):
+        """
+        Adds a geocoded location to the index.
+        """
+        with self._lock:
+            if self._insert(location):
+                self._memo.clear()
+
+    def _cached_matches(self, key, limit):
+        start = bisect.bisect_left(self._keys, key)
+        end = bisect.bisect_left(self._keys, key + "\uffff")
+        matches = sorted(self._entries[start:end], reverse=True)
+        return matches[:limit]
+
+    def suggest(self, text, limit=DEFAULT_LIMIT):
+        """
+        Returns up to `limit` suggestions for a prefix, most populous first,
+        as [{"name": ..., "label": ...}].
+        """
+        key = normalize_name(text)
+        if not key:
+            return []
+        limit = max(1, min(limit, MAX_LIMIT))
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            memo_key = (key, limit)
+            result = self._memo.get(memo_key)
+            if result is not None:
+                self._memo.move_to_end(memo_key)
+                return result
+
+            ranked = {}
+            for population, label, name in self._cached_matches(key, limit):
+                ranked[label] = (population, name)
+            for location in self.local_geocoder.prefix(key, limit):
+                ranked.setdefault(location_label(location), (location.get('population') or 0, location['name']))
+            top = sorted(ranked.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+            result = [{"name": name, "label": label} for label, (population, name) in top]
+
+            self._memo[memo_key] = result
+            if len(self._memo) > MEMO_SIZE:
+                self._memo.popitem(last=False)
+            return result
+
+
+# Shared instance used by the web front-ends.
+suggest_index = SuggestIndex()
@@ -0,0 +1,261 @@
+import contextvars
+import os
+import random
+import threading
+import time
+
+from json_codec import codec
+
+# --- Request Tracing ---
+# Opt-in (WEATHERPY_TRACE=1) per-request traces. Every metrics.stage() of a
+# traced request (geocode, forecast, parse, serialize, ...) and every upstream
+# call becomes a span with its own timing. Requests slower than
+# WEATHERPY_TRACE_SLOW_MS, plus a random WEATHERPY_TRACE_SAMPLE fraction of
+# the rest, are appended to WEATHERPY_TRACE_FILE as OTLP/JSON lines (one
+# ExportTraceServiceRequest per line), the format of the OpenTelemetry
+# Collector's file exporter, so they can be replayed into Jaeger, Tempo or
+# any other OTLP backend with the collector's otlpjsonfile receiver.
+#
+# With tracing off, start_request() returns None and span() returns a shared
+# no-op object: the cost is one flag check per request and one context
+# variable read per span.
+
+TRACE_ENABLED = os.environ.get("WEATHERPY_TRACE", "0") == "1"
+SLOW_MS = float(os.environ.get("WEATHERPY_TRACE_SLOW_MS", 500))
+SAMPLE_RATE = float(os.environ.get("WEATHERPY_TRACE_SAMPLE", 0))       # of requests faster than SLOW_MS
+TRACE_FILE = os.environ.get("WEATHERPY_TRACE_FILE", ".weatherpy_traces.jsonl")
+MAX_FILE_BYTES = int(os.environ.get("WEATHERPY_TRACE_MAX_BYTES", 50 * 1024 * 1024))   # then rotated to .1
+SERVICE_NAME = "weatherpy"
+# Long-lived or deliberately slow endpoints would always look slow.
+UNTRACED_PATHS = ("/weather/stream", "/admin/profile")
+
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+STATUS_ERROR = 2
+
+_current = contextvars.ContextVar("trace_span", default=None)   # (Trace, Span) or None
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name, parent_id=None, kind=INTERNAL, attributes=None):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or ())
+        self.error = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def to_otlp(self, trace_id):
+        span = {
+            "traceId": trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.error:
+            span["status"] = {"code": STATUS_ERROR, "message": self.error}
+        return span
+
+
+class _NullSpan:
+    """
+    What span() returns when nothing is being traced.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, key, value):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    __slots__ = ("trace_id", "root", "spans", "started")
+
+    def __init__(self, root):
+        self.trace_id = os.urandom(16).hex()
+        self.root = root
+        self.spans = [root]
+        self.started = time.perf_counter()
+
+
+class _SpanContext:
+    __slots__ = ("trace", "span", "on_end", "token", "started")
+
+    def __init__(self, trace, span, on_end):
+        self.trace = trace
+        self.span = span
+        self.on_end = on_end
+
+    def __enter__(self):
+        self.trace.spans.append(self.span)
+        self.token = _current.set((self.trace, self.span))
+        self.started = time.perf_counter()
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        self.span.end_ns = self.span.start_ns + int(elapsed * 1e9)
+        if exc_type is not None:
+            self.span.error = exc_type.__name__
+        _current.reset(self.token)
+        if self.on_end is not None:
+            self.on_end(elapsed)
+        return False
+
+
+def span(name, kind=INTERNAL, attributes=None, on_end=None):
+    """
+    Context manager recording a child span of the current one, if the
+    current request is traced. `on_end(seconds)` is called afterwards; it
+    is how metrics.stage() keeps feeding its histogram.
+    """
+    current = _current.get()
+    if current is None:
+        return NULL_SPAN
+    trace, parent = current
+    return _SpanContext(trace, Span(name, parent.span_id, kind, attributes), on_end)
+
+
+def active():
+    """
+    True while the current request is being traced.
+    """
+    return _current.get() is not None
+
+
+def bind(fn):
+    """
+    Wraps `fn` so that, called from a pool or thread, its spans still join
+    the current request's trace. Returns `fn` itself when not tracing.
+    """
+    current = _current.get()
+    if current is None:
+        return fn
+
+    def traced(*args):
+        token = _current.set(current)
+        try:
+            return fn(*args)
+        finally:
+            _current.reset(token)
+    return traced
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Tracer:
+    """
+    Starts request traces and writes the slow (or sampled) ones to a file.
+    """
+
+    def __init__(self, enabled=TRACE_ENABLED, path=TRACE_FILE, slow_ms=SLOW_MS, sample_rate=SAMPLE_RATE,
+                 max_bytes=MAX_FILE_BYTES):
+        self.enabled = enabled and bool(path)
+        self.path = path
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.stats = {"traced": 0, "written_slow": 0, "written_sampled": 0, "write_errors": 0}
+
+    def start_request(self, method, path):
+        """
+        Begins tracing the current request. Returns a handle for
+        end_request(), or None if tracing is off or the path is exempt.
+        """
+        if not self.enabled or path in UNTRACED_PATHS:
+            return None
+        root = Span(f"{method} {path}", kind=SERVER,
+                    attributes={"http.request.method": method, "url.path": path})
+        trace = Trace(root)
+        return _current.set((trace, root)), trace
+
+    def end_request(self, handle, status, route=None):
+        """
+        Closes the request's trace and writes it out if it was slow or sampled.
+        """
+        if handle is None:
+            return
+        token, trace = handle
+        root = trace.root
+        _current.reset(token)
+        elapsed_ms = (time.perf_counter() - trace.started) * 1000
+        root.end_ns = root.start_ns + int(elapsed_ms * 1e6)
+        root.set("http.response.status_code", status)
+        if route:
+            root.set("http.route", route)
+        if status >= 500:
+            root.error = f"HTTP {status}"
+        if elapsed_ms >= self.slow_ms:
+            reason = "written_slow"
+        elif self.sample_rate and random.random() < self.sample_rate:
+            reason = "written_sampled"
+        else:
+            reason = None
+        with self._lock:
+            self.stats["traced"] += 1
+        if reason is not None:
+            self.write(trace, reason)
+
+    def write(self, trace, reason):
+        document = {"resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": SERVICE_NAME}},
+                {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+            ]},
+            "scopeSpans": [{
+                "scope": {"name": "weatherpy.tracing"},
+                "spans": [span.to_otlp(trace.trace_id) for span in trace.spans],
+            }],
+        }]}
+        line = codec.dumps(document) + b"\n"
+        with self._lock:
+            try:
+                if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                # One O_APPEND write per trace, so lines from several workers never interleave.
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, line)
+                finally:
+                    os.close(fd)
+                self.stats[reason] += 1
+            except OSError:
+                self.stats["write_errors"] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["enabled"] = self.enabled
+        return stats
+
+
+# Shared instance used by the web front-ends.
+tracer = Tracer()
@@ -1,121 +1,155 @@
-import requests
+import argparse
 import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-def get_weather_description(code):
-    """
-    Converts WMO weather code to a human-readable description.
-    Codes from Open-Meteo documentation.
-    """
-    codes = {
-        0: "Clear sky",
-        1: "Mainly clear",
-        2: "Partly cloudy",
-        3: "Overcast",
-        45: "Fog",
-        48: "Depositing rime fog",
-        51: "Drizzle: Light intensity",
-        53: "Drizzle: Moderate intensity",
-        55: "Drizzle: Dense intensity",
-        56: "Freezing Drizzle: Light intensity",
-        57: "Freezing Drizzle: Dense intensity",
-        61: "Rain: Slight intensity",
-        63: "Rain: Moderate intensity",
-        65: "Rain: Heavy intensity",
-        66: "Freezing Rain: Light intensity",
-        67: "Freezing Rain: Heavy intensity",
-        71: "Snow fall: Slight intensity",
-        73: "Snow fall: Moderate intensity",
-        75: "Snow fall: Heavy intensity",
-        77: "Snow grains",
-        80: "Rain showers: Slight",
-        81: "Rain showers: Moderate",
-        82: "Rain showers: Violent",
-        85: "Snow showers: Slight",
-        86: "Snow showers: Heavy",
-        95: "Thunderstorm: Slight or moderate",
-        96: "Thunderstorm with slight hail",
-        99: "Thunderstorm with heavy hail",
-    }
-    return codes.get(code, "Unknown weather condition")
-
-def get_location_coords(city):
-    """
-    Converts a city name to latitude and longitude using the Open-Meteo Geocoding API.
-    """
-    geocoding_url = "https://geocoding-api.open-meteo.com/v1/search"
-    params = {'name': city, 'count': 1, 'language': 'en', 'format': 'json'}
-    try:
-        response = requests.get(geocoding_url, params=params)
-        response.raise_for_status()
-        results = response.json().get('results')
-        if not results:
-            return None, None, None
-        location = results[0]
-        return location['latitude'], location['longitude'], location.get('country', '')
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching location data: {e}")
-        return None, None, None
+import weather_core
+from governor import BULK, with_priority
+from json_codec import codec
+from snapshot import snapshotter
 
 def get_weather(city):
     """
     Fetches and displays weather data for a given city using the Open-Meteo API.
     """
-    latitude, longitude, country = get_location_coords(city)
-
-    if latitude is None or longitude is None:
-        print(f"Error: Could not find location for '{city}'. Please check the spelling.")
+    weather, error = weather_core.get_weather(city)
+    if error:
+        print(f"Error: {error}")
         return
 
-    # Base URL for the Open-Meteo API
-    base_url = "https://api.open-meteo.com/v1/forecast"
-
-    # Parameters for the API request
-    params = {
-        'latitude': latitude,
-        'longitude': longitude,
-        'current': 'temperature_2m,relative_humidity_2m,weather_code,wind_speed_10m',
-        'wind_speed_unit': 'ms'
-    }
-
-    try:
-        # Make the GET request to the API
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
-
-        # Parse the JSON response
-        weather_data = response.json()
-
-        # --- Extract and display weather information ---
-        current = weather_data.get('current', {})
-        temperature = current.get('temperature_2m')
-        humidity = current.get('relative_humidity_2m')
-        wind_speed = current.get('wind_speed_10m')
-        weather_code = current.get('weather_code')
-
-        description = get_weather_description(weather_code)
-
-        # --- Display the formatted weather information ---
-        print("\n" + "="*40)
-        print(f"Weather Forecast for {city.title()}, {country}")
-        print("="*40)
-        print(f"  Description: {description}")
-        print(f"  Temperature: {temperature}°C")
-        print(f"  Humidity:    {humidity}%")
-        print(f"  Wind Speed:  {wind_speed} m/s")
-        print("="*40 + "\n")
-
-    except requests.exceptions.HTTPError as http_err:
-        print(f"An HTTP error occurred: {http_err}")
-    except requests.exceptions.ConnectionError as conn_err:
-        print(f"A connection error occurred: {conn_err}")
-        print("Please check your internet connection.")
-    except requests.exceptions.RequestException as err:
-        print(f"An unexpected error occurred: {err}")
-    except (KeyError, TypeError):
-        print("Error: Could not parse weather data. The API response format might have changed.")
+    # --- Display the formatted weather information ---
+    print("\n" + "="*40)
+    print(f"Weather Forecast for {weather.city}")
+    print("="*40)
+    print(f"  Description: {weather.description}")
+    print(f"  Temperature: {weather.temperature}°C")
+    print(f"  Humidity:    {weather.humidity}%")
+    print(f"  Wind Speed:  {weather.wind_speed} m/s")
+    if weather.stale:
+        print(f"  Stale:       last known values, observed {weather.observed} GMT")
+    print("="*40 + "\n")
+
+# --- Multi-City Mode ---
+# `python weather.py Paris Tokyo ...`, `--file cities.txt` or `-` for stdin.
+# Cities are fetched on a bounded thread pool and each result is printed as
+# soon as it completes (so the order follows completion, not input), either as
+# a table row or as one JSON object per line. Input is consumed lazily, so a
+# long list piped on stdin starts producing output right away. Lookups run at
+# the governor's bulk priority: past the rate limit they queue for a token
+# rather than failing as "busy". A summary of timing and failures goes to
+# stderr; the exit status is 1 if any city failed.
+
+DEFAULT_CONCURRENCY = 16
+TABLE_HEADER = f"{'CITY':<30} {'DESCRIPTION':<32} {'TEMP':>8} {'HUMID':>6} {'WIND':>9} {'MS':>7}"
+
+def read_cities(args):
+    """
+    Yields city names from the command line, --file, or stdin ("-").
+    """
+    def lines(source):
+        for line in source:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+    for name in args.cities:
+        if name != "-":
+            yield name
+    if args.file:
+        with open(args.file, encoding="utf-8") as handle:
+            yield from lines(handle)
+    if "-" in args.cities:
+        yield from lines(sys.stdin)
+
+def timed_fetch(city):
+    started = time.perf_counter()
+    weather, error = weather_core.get_weather(city)
+    return city, weather, error, time.perf_counter() - started
+
+def run_many(cities, concurrency):
+    """
+    Fetches cities with at most `concurrency` in flight and yields
+    (city, weather, error, seconds) in completion order.
+    """
+    cities = iter(cities)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = set()
+        exhausted = False
+        while pending or not exhausted:
+            # Keep the pool full without reading the whole input up front.
+            while not exhausted and len(pending) < concurrency * 2:
+                city = next(cities, None)
+                if city is None:
+                    exhausted = True
+                else:
+                    pending.add(executor.submit(with_priority, BULK, timed_fetch, city))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+def format_row(city, weather, error, seconds):
+    if error:
+        return f"{city[:30]:<30} ERROR: {error}"
+    return (f"{weather.city[:30]:<30} {weather.description[:32]:<32} "
+            f"{weather.temperature:>6}°C {weather.humidity:>5}% {weather.wind_speed:>5} m/s "
+            f"{seconds * 1000:>7.0f}" + (f"  stale, observed {weather.observed}" if weather.stale else ""))
+
+def format_ndjson(city, weather, error, seconds):
+    record = {"query": city, "ok": error is None, "ms": round(seconds * 1000, 1)}
+    if error:
+        record["error"] = error
+    else:
+        record.update(weather._asdict(), description=weather.description)
+    return codec.dumps(record).decode()
+
+def main_many(args):
+    formatter = format_ndjson if args.format == "ndjson" else format_row
+    if args.format == "table":
+        print(TABLE_HEADER, flush=True)
+
+    started = time.perf_counter()
+    latencies = []
+    failures = []
+    for city, weather, error, seconds in run_many(read_cities(args), args.concurrency):
+        print(formatter(city, weather, error, seconds), flush=True)
+        latencies.append(seconds)
+        if error:
+            failures.append((city, error))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    total = len(latencies)
+    print(f"\n{total} cities in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.1f}/s), "
+          f"{total - len(failures)} ok, {len(failures)} failed", file=sys.stderr)
+    if latencies:
+        print(f"latency p50 {latencies[total // 2] * 1000:.0f} ms, "
+              f"max {latencies[-1] * 1000:.0f} ms, concurrency {args.concurrency}", file=sys.stderr)
+    for city, error in failures:
+        print(f"  FAILED {city}: {error}", file=sys.stderr)
+    return 1 if failures else 0
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Current weather from Open-Meteo. With no cities, runs interactively.")
+    parser.add_argument("cities", nargs="*", help='city names; "-" reads one per line from stdin')
+    parser.add_argument("-f", "--file", help="read city names from a file, one per line")
+    parser.add_argument("-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"cities fetched at once (default {DEFAULT_CONCURRENCY})")
+    parser.add_argument("--format", choices=("table", "ndjson"), default="table")
+    args = parser.parse_args()
+    args.concurrency = max(1, args.concurrency)
+    return args
 
 
 if __name__ == "__main__":
+    args = parse_args()
+    # Start from the last snapshot, so cities seen before still answer offline.
+    snapshotter.ensure_started()
+    if args.cities or args.file:
+        sys.exit(main_many(args))
+
     print("--- Simple Weather App (using Open-Meteo) ---")
     print("Enter 'quit' or 'exit' to stop the application.")
 
@@ -1,121 +1,103 @@
-import requests
-import sys
-import tkinter as tk
-from tkinter import font
-
-# --- Data Fetching and Processing Logic (from previous version) ---
-
-def get_weather_description(code):
-    """
-    Converts WMO weather code to a human-readable description.
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+from geocache import normalize_name
+from snapshot import snapshotter
+from weather_core import get_weather
+
+# --- Background Fetching ---
+# Network calls run on a small worker pool and hand their results back through
+# a queue that the Tk main loop polls with `app.after`, so the window never
+# waits on the network. Every search gets a new generation number; results
+# from superseded searches are dropped, and searches that have not started yet
+# are cancelled outright. Results are remembered per city so a repeat search
+# shows the last answer immediately while a fresh one is fetched.
+
+FETCH_WORKERS = 4
+POLL_INTERVAL_MS = 50
+
+fetch_executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="weather-fetch")
+fetch_results = queue.Queue()
+recent_results = {}
+current_search = {"generation": 0, "future": None}
+
+def fetch_in_background(generation, city):
     """
-    codes = {
-        0: "Clear sky", 1: "Mainly clear", 2: "Partly cloudy", 3: "Overcast",
-        45: "Fog", 48: "Depositing rime fog",
-        51: "Drizzle: Light", 53: "Drizzle: Moderate", 55: "Drizzle: Dense",
-        56: "Freezing Drizzle: Light", 57: "Freezing Drizzle: Dense",
-        61: "Rain: Slight", 63: "Rain: Moderate", 65: "Rain: Heavy",
-        66: "Freezing Rain: Light", 67: "Freezing Rain: Heavy",
-        71: "Snow fall: Slight", 73: "Snow fall: Moderate", 75: "Snow fall: Heavy",
-        77: "Snow grains",
-        80: "Rain showers: Slight", 81: "Rain showers: Moderate", 82: "Rain showers: Violent",
-        85: "Snow showers: Slight", 86: "Snow showers: Heavy",
-        95: "Thunderstorm: Slight or moderate",
-        96: "Thunderstorm with slight hail", 99: "Thunderstorm with heavy hail",
-    }
-    return codes.get(code, "Unknown")
-
-def get_location_coords(city):
+    Worker-thread body: fetches weather and queues the outcome for the GUI.
     """
-    Converts a city name to latitude and longitude. Returns (lat, lon, full_name) or (None, None, None).
-    """
-    geocoding_url = "https://geocoding-api.open-meteo.com/v1/search"
-    params = {'name': city, 'count': 1, 'language': 'en', 'format': 'json'}
     try:
-        response = requests.get(geocoding_url, params=params)
-        response.raise_for_status()
-        results = response.json().get('results')
-        if not results:
-            return None, None, None
-        location = results[0]
-        country = location.get('country', '')
-        admin1 = location.get('admin1', '')
-        full_name = f"{location.get('name', city.title())}, {admin1}, {country}".strip(", ")
-        return location['latitude'], location['longitude'], full_name
-    except requests.exceptions.RequestException:
-        return None, None, None
-
-def get_weather(city):
+        weather_info, error = get_weather(city)
+    except Exception as e:  # never let a worker die silently
+        weather_info, error = None, f"Error fetching weather data: {e}"
+    fetch_results.put((generation, city, weather_info, error))
+
+def poll_results():
     """
-    Fetches weather data and returns it as a dictionary.
-    Returns None on failure.
+    Applies finished fetches on the main loop; stale generations are ignored.
     """
-    latitude, longitude, full_name = get_location_coords(city)
-    if latitude is None:
-        return None, f"Could not find location for '{city}'"
-
-    base_url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        'latitude': latitude,
-        'longitude': longitude,
-        'current': 'temperature_2m,relative_humidity_2m,weather_code,wind_speed_10m',
-        'wind_speed_unit': 'ms'
-    }
     try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
-        weather_data = response.json()
-        current = weather_data.get('current', {})
-        
-        result = {
-            "city": full_name,
-            "description": get_weather_description(current.get('weather_code')),
-            "temperature": f"{current.get('temperature_2m')}°C",
-            "humidity": f"{current.get('relative_humidity_2m')}%",
-            "wind": f"{current.get('wind_speed_10m')} m/s"
-        }
-        return result, None
-    except (requests.exceptions.RequestException, KeyError) as e:
-        return None, f"Error fetching weather data: {e}"
+        while True:
+            generation, city, weather_info, error = fetch_results.get_nowait()
+            if weather_info is not None:
+                recent_results[normalize_name(city)] = weather_info
+            if generation != current_search["generation"]:
+                continue
+            current_search["future"] = None
+            if error:
+                status_label.config(text=error)
+            elif weather_info.stale:
+                show_weather(weather_info, f"Last known weather (observed {weather_info.observed} GMT):")
+            else:
+                show_weather(weather_info, "Weather information:")
+    except queue.Empty:
+        pass
+    app.after(POLL_INTERVAL_MS, poll_results)
 
 # --- GUI Application ---
 
+def clear_results():
+    for label in (location_label, temp_label, desc_label, humidity_label, wind_label):
+        label.config(text="")
+
+def show_weather(weather_info, status):
+    status_label.config(text=status)
+    location_label.config(text=weather_info.city)
+    temp_label.config(text=f"🌡️ {weather_info.temperature}°C")
+    desc_label.config(text=f"☀️ {weather_info.description}")
+    humidity_label.config(text=f"💧 {weather_info.humidity}%")
+    wind_label.config(text=f"💨 {weather_info.wind_speed} m/s")
+
 def fetch_and_display_weather():
     """
-    Gets city from entry, fetches weather, and updates GUI labels.
+    Gets city from entry and starts a background fetch, superseding any
+    search still in flight. Returns immediately.
     """
-    city = city_entry.get()
+    city = city_entry.get().strip()
     if not city:
         status_label.config(text="Please enter a city name.")
         return
 
-    # Clear previous results and show loading status
-    status_label.config(text=f"Searching for {city}...")
-    location_label.config(text="")
-    temp_label.config(text="")
-    desc_label.config(text="")
-    humidity_label.config(text="")
-    wind_label.config(text="")
-    
-    # Run data fetching in a separate thread to not freeze the GUI
-    app.update_idletasks()
-    weather_info, error = get_weather(city)
-    app.update_idletasks()
-
-    if error:
-        status_label.config(text=error)
-        return
+    current_search["generation"] += 1
+    previous = current_search["future"]
+    if previous is not None:
+        previous.cancel()  # only succeeds if it has not started; otherwise its result is ignored
+    current_search["future"] = fetch_executor.submit(fetch_in_background, current_search["generation"], city)
 
-    # Update GUI with new weather data
-    status_label.config(text="Weather information:")
-    location_label.config(text=weather_info['city'])
-    temp_label.config(text=f"🌡️ {weather_info['temperature']}")
-    desc_label.config(text=f"☀️ {weather_info['description']}")
-    humidity_label.config(text=f"💧 {weather_info['humidity']}")
-    wind_label.config(text=f"💨 {weather_info['wind']}")
+    cached = recent_results.get(normalize_name(city))
+    if cached is not None:
+        show_weather(cached, f"Refreshing {city}...")
+    else:
+        clear_results()
+        status_label.config(text=f"Searching for {city}...")
 
 
 if __name__ == "__main__":
+    import tkinter as tk
+    from tkinter import font
+
+    # Start from the last snapshot, so cities seen before still answer offline.
+    snapshotter.ensure_started()
+
     # --- Window Setup ---
     app = tk.Tk()
     app.title("Weather App")
@@ -166,4 +148,6 @@ if __name__ == "__main__":
     wind_label.pack(pady=5)
 
     # --- Start the application ---
-    app.mainloop()
\ No newline at end of file
+    app.after(POLL_INTERVAL_MS, poll_results)
+    app.mainloop()
+    fetch_executor.shutdown(wait=False, cancel_futures=True)
\ No newline at end of file
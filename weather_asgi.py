@@ -0,0 +1,595 @@
+import asyncio
+import time
+from urllib.parse import parse_qs
+
+import requests
+
+import forecast_series
+import history_store
+import http_cache
+import http_client
+import metrics
+import profiler
+import tracing
+import weather_grid
+from forecast_cache import cache_key, forecast_cache
+from gazetteer import gazetteer
+from geocache import geocode_cache, normalize_name
+from live_updates import HEARTBEAT, KEEPALIVE, PREAMBLE, STREAM_HEADERS, AsyncSubscription, stream_hub
+from governor import PREFETCH, RateLimitedError, governor, priority
+from json_codec import codec
+from metrics import stage
+from prefetch import prefetcher
+from snapshot import snapshotter
+from singleflight import AsyncSingleFlight
+from suggest import suggest_index
+from weather_core import (CURRENT_VARIABLES, FORECAST_FAILED, LOCATION_FAILED, LOCATION_NOT_FOUND, UPSTREAM_BUSY,
+                          WEATHER_FAILED, Forecast, Weather, forecast_ttl, get_weather_batch, last_known,
+                          make_location, parse_batch_cities, series_key, weather_ttl)
+from weather_page import INDEX_PAGE
+
+# --- Async (ASGI) Serving Path ---
+# Serves the same `/` and `/weather` contract as weather_webApp.py, but every
+# upstream call is awaited on a pooled async client, so one process can hold
+# thousands of requests that are waiting on Open-Meteo. /weather/batch and
+# /weather/grid run the synchronous batch path, with its thread pool and
+# chunked multi-location calls, in a worker thread.
+#
+#     uvicorn weather_asgi:app --host 0.0.0.0 --port 8000
+
+_client = None
+_background = set()
+
+weather_flight = AsyncSingleFlight()
+geocode_flight = AsyncSingleFlight()
+forecast_flight = AsyncSingleFlight()
+
+# --- Data Fetching and Processing Logic (async versions) ---
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = http_client.AsyncHTTPClient()
+    return _client
+
+async def cache_call(cache, fn, *args):
+    """
+    Calls fn(*args) on a cache; in a worker thread when the cache's backend
+    waits on I/O (an SQLite file or Redis), so the loop never blocks on it.
+    In-memory caches are called directly.
+    """
+    if cache.backend.blocking:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+async def fetch_location(city):
+    """
+    Queries the Open-Meteo Geocoding API. Returns the best match or None.
+    """
+    params = {'name': city, 'count': 1, 'language': 'en', 'format': 'json'}
+    response = await get_client().get(http_client.GEOCODING_URL, params=params)
+    response.raise_for_status()
+    with stage("parse"):
+        results = codec.decode_locations(response.content)
+    return results[0] if results else None
+
+async def resolve_location(city):
+    """
+    Converts a city name to a Location, or None if there is no match.
+    The offline gazetteer is consulted first, then the geocoding cache
+    shared with the synchronous front-ends. Network errors are raised.
+    """
+    found, location = True, gazetteer.lookup(city)
+    if location is None:
+        found, location = await cache_call(geocode_cache, geocode_cache.get, city)
+    if not found:
+        async def fill():
+            fetched = await fetch_location(city)
+            return await cache_call(geocode_cache, geocode_cache.set, city, fetched)
+
+        location = await geocode_flight.do(normalize_name(city), fill)
+    return make_location(city, location) if location is not None else None
+
+async def fetch_current(latitude, longitude):
+    """
+    Queries the Open-Meteo Forecast API and returns the `current` block,
+    which is also added to the observation history.
+    """
+    params = {
+        'latitude': latitude,
+        'longitude': longitude,
+        'current': CURRENT_VARIABLES,
+        'wind_speed_unit': 'ms'
+    }
+    response = await get_client().get(http_client.FORECAST_URL, params=params)
+    response.raise_for_status()
+    with stage("parse"):
+        current = codec.decode_current(response.content)
+    history_store.history.record(latitude, longitude, current)
+    return current
+
+async def fetch_series(latitude, longitude, days):
+    """
+    Queries the Open-Meteo Forecast API for hourly and daily series.
+    """
+    params = forecast_series.series_params(latitude, longitude, days)
+    response = await get_client().get(http_client.FORECAST_URL, params=params)
+    response.raise_for_status()
+    with stage("parse"):
+        return forecast_series.parse_series(codec.decode_series(response.content))
+
+async def _refresh(key, fetch):
+    started = time.perf_counter()
+    ok = True
+    try:
+        # Nobody is waiting on this result, so it only gets spare upstream capacity.
+        with priority(PREFETCH):
+            fetched = await fetch()
+        await cache_call(forecast_cache, forecast_cache.store, key, fetched)
+    except Exception:
+        ok = False
+    forecast_cache.finish_refresh(key, time.perf_counter() - started, ok)
+
+async def get_cached(key, fetch):
+    """
+    Async equivalent of weather_core.get_or_shed(); `fetch` is a
+    coroutine function. Returns (value, stale).
+    """
+    value, status = await cache_call(forecast_cache, forecast_cache.lookup, key)
+    if status == "hit":
+        return value, False
+    if status == "stale":
+        if forecast_cache.claim_refresh(key):
+            task = asyncio.create_task(_refresh(key, fetch))
+            _background.add(task)
+            task.add_done_callback(_background.discard)
+        return value, False
+
+    async def fill():
+        fetched = await fetch()
+        await cache_call(forecast_cache, forecast_cache.store, key, fetched)
+        return fetched
+
+    try:
+        return await forecast_flight.do(key, fill), False
+    except (requests.exceptions.RequestException, ValueError) as e:
+        value = await cache_call(forecast_cache, last_known, key, e)
+        if value is None:
+            raise
+        return value, True
+
+async def locate(city):
+    """
+    Async equivalent of weather_core.locate().
+    """
+    try:
+        with stage("geocode"):
+            location = await resolve_location(city)
+    except RateLimitedError:
+        return None, UPSTREAM_BUSY
+    except requests.exceptions.RequestException:
+        return None, LOCATION_FAILED
+    if location is None:
+        return None, LOCATION_NOT_FOUND.format(city=city)
+    return location, None
+
+async def get_weather(city):
+    """
+    Fetches current weather for a city.
+    Returns (Weather, None) on success, (None, error_message) on failure.
+    """
+    return await weather_flight.do(normalize_name(city), lambda: _get_weather(city))
+
+async def _get_weather(city):
+    location, error = await locate(city)
+    if error:
+        return None, error
+
+    key = cache_key(location.latitude, location.longitude, CURRENT_VARIABLES)
+    try:
+        with stage("forecast"):
+            current, stale = await get_cached(key, lambda: fetch_current(key[0], key[1]))
+        return Weather.from_current(location, current, stale), None
+    except RateLimitedError:
+        return None, UPSTREAM_BUSY
+    except (requests.exceptions.RequestException, KeyError, ValueError):
+        return None, WEATHER_FAILED
+
+async def get_forecast(city, days):
+    """
+    Fetches hourly and daily series for a city.
+    Returns (Forecast, None) on success, (None, error_message) on failure.
+    """
+    location, error = await locate(city)
+    if error:
+        return None, error
+
+    key = series_key(location.latitude, location.longitude, days)
+    try:
+        with stage("forecast"):
+            series, stale = await get_cached(key, lambda: fetch_series(key[0], key[1], days))
+    except RateLimitedError:
+        return None, UPSTREAM_BUSY
+    except (requests.exceptions.RequestException, KeyError, ValueError):
+        return None, FORECAST_FAILED
+    return Forecast(location, days, series, stale), None
+
+# --- ASGI Plumbing ---
+
+for _name, _stats in (("geocode", geocode_cache.get_stats), ("forecast", forecast_cache.get_stats)):
+    metrics.registry.add_collector(metrics.stats_collector("weatherpy_cache", _stats, {"cache": _name}))
+for _name, _flight in (("weather", weather_flight), ("geocode", geocode_flight), ("forecast", forecast_flight)):
+    metrics.registry.add_collector(metrics.stats_collector("weatherpy_coalescing", _flight.get_stats, {"flight": _name}))
+metrics.registry.add_collector(metrics.stats_collector("weatherpy_http_client", lambda: get_client().get_stats(), {}))
+metrics.registry.add_collector(metrics.stats_collector("weatherpy_prefetch", prefetcher.get_stats, {}))
+metrics.registry.add_collector(metrics.stats_collector("weatherpy_governor", governor.get_stats, {}))
+metrics.registry.add_collector(metrics.stats_collector("weatherpy_streams", stream_hub.get_stats, {}))
+metrics.registry.add_collector(metrics.stats_collector("weatherpy_history", history_store.history.get_stats, {}))
+metrics.registry.add_collector(metrics.stats_collector("weatherpy_grid", weather_grid.grid_index.get_stats, {}))
+metrics.registry.add_collector(metrics.stats_collector("weatherpy_tracing", tracing.tracer.get_stats, {}))
+metrics.registry.add_collector(metrics.stats_collector("weatherpy_snapshot", snapshotter.get_stats, {}))
+metrics.registry.add_collector(metrics.stats_collector("weatherpy_profiler", profiler.profiler.get_stats, {}))
+metrics.registry.add_collector(metrics.stats_collector("weatherpy_json", codec.get_stats, {}))
+
+async def send_response(send, status, body, content_type="application/json"):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", content_type.encode("latin-1")),
+            (b"content-length", str(len(body)).encode("latin-1")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def send_prepared(send, status, headers, body):
+    """
+    Sends a (status, headers, body) triple built by http_cache.
+    """
+    raw = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+    raw.append((b"content-length", str(len(body)).encode("latin-1")))
+    await send({"type": "http.response.start", "status": status, "headers": raw})
+    await send({"type": "http.response.body", "body": body})
+
+def request_header(scope, name):
+    name = name.encode("latin-1")
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+async def send_json(send, status, payload):
+    await send_response(send, status, codec.dumps(payload))
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+async def read_json(scope, receive):
+    """
+    The request's JSON body, or None if it is not JSON (like Flask's
+    get_json(silent=True)).
+    """
+    content_type = (request_header(scope, "content-type") or "").split(";")[0].strip().lower()
+    body = await read_body(receive)
+    if content_type != "application/json" and not content_type.endswith("+json"):
+        return None
+    try:
+        return codec.loads(body)
+    except ValueError:
+        return None
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            get_client()
+            snapshotter.ensure_started()
+            # The prefetcher refreshes the shared forecast cache from its own
+            # thread with the synchronous client.
+            prefetcher.ensure_started()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await asyncio.to_thread(prefetcher.stop)
+            await asyncio.to_thread(snapshotter.stop)
+            if _client is not None:
+                await _client.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+# --- Routes ---
+
+async def index(scope, receive, send):
+    """Serves the pre-rendered HTML page, compressed and with validators."""
+    await send_prepared(send, *INDEX_PAGE.respond(request_header(scope, "if-none-match"),
+                                                  request_header(scope, "accept-encoding")))
+
+async def weather_endpoint(scope, receive, send):
+    """API endpoint to get weather data."""
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    city = (query.get("city") or [None])[0]
+    if not city:
+        await send_json(send, 400, {"error": "City parameter is required"})
+        return
+
+    weather_data, error = await get_weather(city)
+    if error:
+        await send_json(send, 404, {"error": error})
+        return
+    prefetcher.record(weather_data)
+    with stage("serialize"):
+        body = codec.dumps(weather_data.as_dict())
+    # Cacheable until the forecast behind it is due for refresh.
+    await send_prepared(send, *http_cache.conditional(
+        body, "application/json",
+        http_cache.max_age_header(await cache_call(forecast_cache, weather_ttl, weather_data)),
+        request_header(scope, "if-none-match")))
+
+async def forecast_endpoint(scope, receive, send):
+    """
+    API endpoint for hourly and daily series:
+    /forecast?city=Paris&days=7&units=metric|imperial&format=json|binary
+    """
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    city = (query.get("city") or [None])[0]
+    if not city:
+        await send_json(send, 400, {"error": "City parameter is required"})
+        return
+    days, units, fmt, error = forecast_series.parse_options(
+        (query.get("days") or [None])[0], (query.get("units") or [None])[0], (query.get("format") or [None])[0])
+    if error:
+        await send_json(send, 400, {"error": error})
+        return
+
+    forecast, error = await get_forecast(city, days)
+    if error:
+        await send_json(send, 404, {"error": error})
+        return
+    with stage("serialize"):
+        content_type, body = forecast_series.serialize(
+            forecast.location, forecast.series, units, fmt, forecast.stale)
+    await send_prepared(send, *http_cache.conditional(
+        body, content_type, http_cache.max_age_header(await cache_call(forecast_cache, forecast_ttl, forecast)),
+        request_header(scope, "if-none-match")))
+
+async def weather_batch_endpoint(scope, receive, send):
+    """
+    API endpoint to get weather for many cities: either
+    GET /weather/batch?cities=Paris,Berlin or POST {"cities": [...]}.
+    """
+    if scope["method"] == "POST":
+        payload = await read_json(scope, receive)
+        cities = payload.get("cities") if isinstance(payload, dict) else None
+    else:
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        cities = (query.get("cities") or [""])[0]
+    cities, error = parse_batch_cities(cities)
+    if error:
+        await send_json(send, 400, {"error": error})
+        return
+
+    # Geocoding and chunked forecast calls run on the batch thread pool;
+    # keep the waiting off the loop.
+    batch = await asyncio.to_thread(get_weather_batch, cities)
+    results = []
+    for city, (weather_data, error) in batch.items():
+        if error:
+            results.append({"query": city, "error": error})
+        else:
+            prefetcher.record(weather_data)
+            results.append({"query": city, "weather": weather_data.as_dict()})
+    with stage("serialize"):
+        await send_json(send, 200, {"results": results})
+
+async def weather_stream_endpoint(scope, receive, send):
+    """
+    Server-sent events with live weather: /weather/stream?city=Paris
+    """
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    city = (query.get("city") or [None])[0]
+    if not city:
+        await send_json(send, 400, {"error": "City parameter is required"})
+        return
+    location, error = await locate(city)
+    if error:
+        await send_json(send, 404, {"error": error})
+        return
+
+    subscription = AsyncSubscription()
+
+    async def watch_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        subscription.close()
+
+    watcher = asyncio.create_task(watch_disconnect())
+    stream_hub.subscribe(location, subscription)
+    try:
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                                for name, value in STREAM_HEADERS]})
+        await send({"type": "http.response.body", "body": PREAMBLE, "more_body": True})
+        while not subscription.closed:
+            event = await subscription.next(HEARTBEAT)
+            if not subscription.closed:
+                await send({"type": "http.response.body", "body": event or KEEPALIVE, "more_body": True})
+    finally:
+        stream_hub.unsubscribe(location, subscription)
+        watcher.cancel()
+
+async def history_endpoint(scope, receive, send):
+    """
+    Past observations from the local history store:
+    /history?city=Paris&start=2024-01-01&end=2024-02-01&step=1h
+    """
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    city = (query.get("city") or [None])[0]
+    if not city:
+        await send_json(send, 400, {"error": "City parameter is required"})
+        return
+    start, end, step, error = history_store.parse_options(
+        (query.get("start") or [None])[0], (query.get("end") or [None])[0], (query.get("step") or [None])[0])
+    if error:
+        await send_json(send, 400, {"error": error})
+        return
+    location, error = await locate(city)
+    if error:
+        await send_json(send, 404, {"error": error})
+        return
+
+    with stage("history"):
+        # Day files are memory-mapped and read from disk; keep that off the loop.
+        body = await asyncio.to_thread(history_store.history_document, location, start, end, step)
+    await send_prepared(send, *http_cache.conditional(
+        body, "application/json", http_cache.max_age_header(history_store.max_age(end)),
+        request_header(scope, "if-none-match")))
+
+async def weather_grid_endpoint(scope, receive, send):
+    """
+    Current conditions on a lat/lon grid, for map overlays:
+    /weather/grid?bbox=west,south,east,north&res=0.5&format=json|binary
+    """
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    grid, fmt, error = weather_grid.parse_options(
+        (query.get("bbox") or [None])[0], (query.get("res") or [None])[0], (query.get("format") or [None])[0])
+    if error:
+        await send_json(send, 400, {"error": error})
+        return
+
+    with stage("grid"):
+        # Missing cells are fetched with the batch path's chunked calls on
+        # its thread pool; keep the waiting off the loop.
+        content_type, body, seconds_valid = await asyncio.to_thread(weather_grid.grid_document, grid, fmt)
+    await send_prepared(send, *http_cache.conditional(
+        body, content_type, http_cache.max_age_header(seconds_valid), request_header(scope, "if-none-match")))
+
+async def suggest_endpoint(scope, receive, send):
+    """City autocomplete, served from memory."""
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    text = (query.get("q") or [""])[0]
+    try:
+        limit = int((query.get("limit") or ["8"])[0])
+    except ValueError:
+        limit = 8
+    await send_json(send, 200, {"suggestions": suggest_index.suggest(text, limit)})
+
+async def metrics_endpoint(scope, receive, send):
+    """Prometheus metrics in text exposition format."""
+    await send_response(send, 200, metrics.registry.render().encode("utf-8"), metrics.CONTENT_TYPE)
+
+async def profile_endpoint(scope, receive, send):
+    """
+    Samples this worker's stacks for a while and returns them collapsed,
+    for flame graphs: /admin/profile?seconds=10&interval_ms=5&idle=0
+    """
+    authorized = profiler.admin_authorized(request_header(scope, "authorization"))
+    if authorized is None:
+        await send_json(send, 404, {"error": "Not found"})
+        return
+    if not authorized:
+        await send_json(send, 401, {"error": "Unauthorized"})
+        return
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    seconds, interval, include_idle, error = profiler.parse_options(
+        (query.get("seconds") or [None])[0], (query.get("interval_ms") or [None])[0], (query.get("idle") or [None])[0])
+    if error:
+        await send_json(send, 400, {"error": error})
+        return
+    try:
+        # Sampled from a worker thread, so the event loop shows up in the profile.
+        body = await asyncio.to_thread(profiler.profiler.collapsed, seconds, interval, include_idle)
+    except profiler.ProfileBusyError as e:
+        await send_json(send, 409, {"error": str(e)})
+        return
+    await send_response(send, 200, body, profiler.COLLAPSED_CONTENT_TYPE)
+
+async def stats_endpoint(scope, receive, send):
+    """Reports cache hit/miss counters."""
+    await send_json(send, 200, {
+        "geocode_cache": geocode_cache.get_stats(),
+        "forecast_cache": forecast_cache.get_stats(),
+        "upstream": get_client().get_stats(),
+        "prefetch": prefetcher.get_stats(),
+        "governor": governor.get_stats(),
+        "streams": stream_hub.get_stats(),
+        "history": history_store.history.get_stats(),
+        "grid": weather_grid.grid_index.get_stats(),
+        "tracing": tracing.tracer.get_stats(),
+        "snapshot": snapshotter.get_stats(),
+        "profiler": profiler.profiler.get_stats(),
+        "json": codec.get_stats(),
+        "coalescing": {
+            "weather": weather_flight.get_stats(),
+            "geocode": geocode_flight.get_stats(),
+            "forecast": forecast_flight.get_stats(),
+        },
+    })
+
+ROUTES = {
+    "/": index,
+    "/weather": weather_endpoint,
+    "/weather/batch": weather_batch_endpoint,
+    "/weather/stream": weather_stream_endpoint,
+    "/weather/grid": weather_grid_endpoint,
+    "/forecast": forecast_endpoint,
+    "/history": history_endpoint,
+    "/suggest": suggest_endpoint,
+    "/metrics": metrics_endpoint,
+    "/stats": stats_endpoint,
+    "/admin/profile": profile_endpoint,
+}
+
+# Routes accepting more than GET and HEAD.
+METHODS = {
+    "/weather/batch": ("GET", "HEAD", "POST"),
+}
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    handler = ROUTES.get(scope["path"])
+    if handler is None:
+        await send_json(send, 404, {"error": "Not found"})
+        return
+    if scope["method"] not in METHODS.get(scope["path"], ("GET", "HEAD")):
+        await send_json(send, 405, {"error": "Method not allowed"})
+        return
+
+    status = 500
+    started = time.perf_counter()
+
+    async def instrumented_send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        await send(message)
+
+    trace = tracing.tracer.start_request(scope["method"], scope["path"])
+    with metrics.IN_FLIGHT.track():
+        try:
+            await handler(scope, receive, instrumented_send)
+        finally:
+            endpoint = handler.__name__
+            metrics.REQUESTS.inc(endpoint=endpoint, status=status)
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+            tracing.tracer.end_request(trace, status, endpoint)
+
+
+# --- Main Execution ---
+
+if __name__ == "__main__":
+    import uvicorn
+
+    print("Starting ASGI server...")
+    print("Open your web browser and go to http://127.0.0.1:8000")
+    uvicorn.run("weather_asgi:app", host="127.0.0.1", port=8000)
@@ -0,0 +1,470 @@
+import threading
+import time
+from collections import namedtuple
+from functools import partial
+
+import requests
+
+import http_client
+import tracing
+from forecast_cache import cache_key, forecast_cache
+from gazetteer import gazetteer
+from geocache import geocode_cache, normalize_name
+from governor import BATCH, PREFETCH, RateLimitedError, governor, with_priority
+from history_store import history
+from json_codec import codec
+from metrics import stage
+from singleflight import LOCK_DIR, SingleFlight
+
+# --- Shared Weather Core ---
+# The lookup pipeline used by every front-end: offline gazetteer, then the
+# geocoding cache, then the forecast cache keyed by grid cell, all on the
+# pooled HTTP client, with concurrent identical lookups coalesced. The CLI,
+# the Tk app and the Flask server call it directly; the ASGI server shares
+# its tables, types and formatting and awaits its own fetches. Nothing here
+# imports a UI or web framework, so each front-end only pays for its own.
+
+# WMO weather interpretation codes, from the Open-Meteo documentation.
+WMO_DESCRIPTIONS = {
+    0: "Clear sky", 1: "Mainly clear", 2: "Partly cloudy", 3: "Overcast",
+    45: "Fog", 48: "Depositing rime fog",
+    51: "Drizzle: Light", 53: "Drizzle: Moderate", 55: "Drizzle: Dense",
+    56: "Freezing Drizzle: Light", 57: "Freezing Drizzle: Dense",
+    61: "Rain: Slight", 63: "Rain: Moderate", 65: "Rain: Heavy",
+    66: "Freezing Rain: Light", 67: "Freezing Rain: Heavy",
+    71: "Snow fall: Slight", 73: "Snow fall: Moderate", 75: "Snow fall: Heavy",
+    77: "Snow grains",
+    80: "Rain showers: Slight", 81: "Rain showers: Moderate", 82: "Rain showers: Violent",
+    85: "Snow showers: Slight", 86: "Snow showers: Heavy",
+    95: "Thunderstorm: Slight or moderate",
+    96: "Thunderstorm with slight hail", 99: "Thunderstorm with heavy hail",
+}
+UNKNOWN_CONDITION = "Unknown condition"
+
+CURRENT_VARIABLES = 'temperature_2m,relative_humidity_2m,weather_code,wind_speed_10m'
+
+LOCATION_NOT_FOUND = "Could not find location for '{city}'"
+LOCATION_FAILED = "Error fetching location data."
+WEATHER_FAILED = "Error fetching weather data."
+FORECAST_FAILED = "Error fetching forecast data."
+UPSTREAM_BUSY = "Weather service is busy, please try again shortly."
+
+# Concurrent identical lookups share one upstream call: per city for the whole
+# lookup, per name for geocoding (optionally across workers via lock files)
+# and per grid cell for the forecast fetch.
+weather_flight = SingleFlight()
+geocode_flight = SingleFlight(lock_dir=LOCK_DIR)
+forecast_flight = SingleFlight()
+
+# Batch lookups resolve cities in parallel and fetch forecasts for up to
+# BATCH_CHUNK_SIZE locations per upstream call.
+BATCH_CHUNK_SIZE = 100
+BATCH_WORKERS = 16
+BATCH_MAX_CITIES = 1000        # per /weather/batch request
+_batch_pool = None
+_batch_pool_lock = threading.Lock()
+
+def get_weather_description(code):
+    """
+    Converts WMO weather code to a human-readable description.
+    """
+    return WMO_DESCRIPTIONS.get(code, UNKNOWN_CONDITION)
+
+# --- Result Types ---
+
+Location = namedtuple("Location", "name latitude longitude")
+Location.__doc__ = """
+A resolved place: display name ("City, Region, Country") and coordinates.
+"""
+
+class Weather(namedtuple("Weather", "city latitude longitude weather_code temperature humidity wind_speed "
+                                    "stale observed", defaults=(False, None))):
+    """
+    Current conditions for one place. Values are kept as returned by the
+    API (°C, %, m/s); as_dict() formats them for the JSON responses.
+    `stale` marks the last known values, served while upstream is
+    unreachable; `observed` is upstream's time of the observation (ISO 8601,
+    GMT).
+    """
+    __slots__ = ()
+
+    @property
+    def values(self):
+        """
+        The reported conditions, city to wind speed, without the staleness.
+        """
+        return self[:7]
+
+    @classmethod
+    def from_current(cls, location, current, stale=False):
+        return cls(location.name, location.latitude, location.longitude,
+                   current.get('weather_code'), current.get('temperature_2m'),
+                   current.get('relative_humidity_2m'), current.get('wind_speed_10m'),
+                   stale, current.get('time'))
+
+    @property
+    def description(self):
+        return get_weather_description(self.weather_code)
+
+    def as_dict(self):
+        result = {
+            "city": self.city,
+            "description": self.description,
+            "temperature": f"{self.temperature}°C",
+            "humidity": f"{self.humidity}%",
+            "wind": f"{self.wind_speed} m/s"
+        }
+        if self.stale:
+            result["stale"] = True
+            result["observed"] = self.observed
+        return result
+
+Forecast = namedtuple("Forecast", "location days series stale", defaults=(False,))
+Forecast.__doc__ = """
+Hourly and daily series (a forecast_series.ForecastSeries) for a Location;
+`stale` as for Weather.
+"""
+
+def make_location(city, location):
+    """
+    Builds a Location from a geocoding result for the query `city`.
+    """
+    country = location.get('country') or ''
+    admin1 = location.get('admin1') or ''
+    name = f"{location.get('name') or city.title()}, {admin1}, {country}".strip(", ")
+    return Location(name, location['latitude'], location['longitude'])
+
+# --- Data Fetching ---
+
+def fetch_location(city):
+    """
+    Queries the Open-Meteo Geocoding API. Returns the best match or None.
+    """
+    params = {'name': city, 'count': 1, 'language': 'en', 'format': 'json'}
+    response = http_client.get(http_client.GEOCODING_URL, params=params)
+    response.raise_for_status()
+    with stage("parse"):
+        results = codec.decode_locations(response.content)
+    return results[0] if results else None
+
+def resolve_location(city):
+    """
+    Converts a city name to a Location, or None if there is no match.
+    The offline gazetteer is consulted first, then the shared geocoding cache.
+    Network errors are raised to the caller.
+    """
+    with stage("geocode"):
+        location = gazetteer.lookup(city)
+        if location is None:
+            location = geocode_cache.lookup(city, fetch_location, flight=geocode_flight)
+    return make_location(city, location) if location is not None else None
+
+def locate(city):
+    """
+    resolve_location() for request handlers.
+    Returns (Location, None) on success, (None, error_message) on failure.
+    """
+    try:
+        location = resolve_location(city)
+    except RateLimitedError:
+        return None, UPSTREAM_BUSY
+    except requests.exceptions.RequestException:
+        return None, LOCATION_FAILED
+    if location is None:
+        return None, LOCATION_NOT_FOUND.format(city=city)
+    return location, None
+
+def fetch_current(latitude, longitude):
+    """
+    Queries the Open-Meteo Forecast API and returns the `current` block,
+    which is also added to the observation history.
+    """
+    params = {
+        'latitude': latitude,
+        'longitude': longitude,
+        'current': CURRENT_VARIABLES,
+        'wind_speed_unit': 'ms'
+    }
+    response = http_client.get(http_client.FORECAST_URL, params=params)
+    response.raise_for_status()
+    with stage("parse"):
+        current = codec.decode_current(response.content)
+    history.record(latitude, longitude, current)
+    return current
+
+def last_known(key, error, cache=forecast_cache):
+    """
+    Degraded mode: the last value stored for `key`, however old, once
+    fetching it failed with `error` (refused, unreachable, offline or
+    garbled); None if nothing is held.
+    """
+    value = cache.peek(key)
+    if value is not None and isinstance(error, RateLimitedError):
+        governor.note_stale_served()
+    return value
+
+def get_or_shed(key, fetch):
+    """
+    forecast_cache.get_or_fetch() under the rate governor: background
+    refreshes of stale entries run at prefetch priority, and if upstream
+    refuses or fails a miss the last known value is served instead.
+    Returns (value, stale), stale being True only for that fallback.
+    """
+    try:
+        return forecast_cache.get_or_fetch(key, fetch, refresh=partial(with_priority, PREFETCH, fetch)), False
+    except (requests.exceptions.RequestException, ValueError) as e:
+        value = last_known(key, e)
+        if value is None:
+            raise
+        return value, True
+
+def get_current(key):
+    """
+    Returns (current, stale): the `current` block for a forecast cache key,
+    shared per grid cell.
+    """
+    with stage("forecast"):
+        return get_or_shed(key, lambda: forecast_flight.do(key, lambda: fetch_current(key[0], key[1])))
+
+def weather_ttl(weather):
+    """
+    Seconds until the cached forecast behind `weather` is due for refresh;
+    used as the max-age of /weather responses.
+    """
+    return forecast_cache.ttl(cache_key(weather.latitude, weather.longitude, CURRENT_VARIABLES))
+
+def get_weather(city):
+    """
+    Fetches current weather for a city.
+    Returns (Weather, None) on success, (None, error_message) on failure.
+    Concurrent requests for the same city share a single lookup.
+    """
+    return weather_flight.do(normalize_name(city), lambda: _get_weather(city))
+
+def _get_weather(city):
+    """
+    Uncoalesced body of get_weather().
+    """
+    location, error = locate(city)
+    if error:
+        return None, error
+
+    key = cache_key(location.latitude, location.longitude, CURRENT_VARIABLES)
+    try:
+        return Weather.from_current(location, *get_current(key)), None
+    except RateLimitedError:
+        return None, UPSTREAM_BUSY
+    except (requests.exceptions.RequestException, KeyError, ValueError):
+        return None, WEATHER_FAILED
+
+# --- Hourly and Daily Forecasts ---
+# forecast_series (and NumPy, if installed) is only imported once a series is
+# actually requested.
+
+def series_key(latitude, longitude, days):
+    return cache_key(latitude, longitude, ("series", days))
+
+def fetch_series(latitude, longitude, days):
+    """
+    Queries the Open-Meteo Forecast API for hourly and daily series and
+    parses them into columns.
+    """
+    import forecast_series
+
+    params = forecast_series.series_params(latitude, longitude, days)
+    response = http_client.get(http_client.FORECAST_URL, params=params)
+    response.raise_for_status()
+    with stage("parse"):
+        return forecast_series.parse_series(codec.decode_series(response.content))
+
+def forecast_ttl(forecast):
+    """
+    Seconds until the cached series behind `forecast` is due for refresh.
+    """
+    return forecast_cache.ttl(series_key(forecast.location.latitude, forecast.location.longitude, forecast.days))
+
+def get_forecast(city, days):
+    """
+    Fetches hourly and daily series for a city.
+    Returns (Forecast, None) on success, (None, error_message) on failure.
+    Series are cached and coalesced per grid cell like `current` blocks.
+    """
+    location, error = locate(city)
+    if error:
+        return None, error
+
+    key = series_key(location.latitude, location.longitude, days)
+    try:
+        with stage("forecast"):
+            series, stale = get_or_shed(
+                key, lambda: forecast_flight.do(key, lambda: fetch_series(key[0], key[1], days)))
+    except RateLimitedError:
+        return None, UPSTREAM_BUSY
+    except (requests.exceptions.RequestException, KeyError, ValueError):
+        return None, FORECAST_FAILED
+    return Forecast(location, days, series, stale), None
+
+# --- Batch Lookups ---
+
+def get_batch_pool():
+    """
+    Worker pool for batch geocoding and forecast chunks, created on first use.
+    """
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _batch_pool = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="weather-batch")
+        return _batch_pool
+
+def fetch_current_many(cells, record=True):
+    """
+    Fetches the `current` block for many (lat, lon) cells with one
+    multi-location Open-Meteo call. Returns the blocks in the same order;
+    with `record`, each is also added to the observation history.
+    """
+    params = {
+        'latitude': ",".join(str(lat) for lat, lon in cells),
+        'longitude': ",".join(str(lon) for lat, lon in cells),
+        'current': CURRENT_VARIABLES,
+        'wind_speed_unit': 'ms'
+    }
+    response = http_client.get(http_client.FORECAST_URL, params=params)
+    response.raise_for_status()
+    with stage("parse"):
+        blocks = codec.decode_current_many(response.content)
+    if len(blocks) != len(cells):
+        raise ValueError("Upstream returned a different number of locations")
+    if record:
+        for (lat, lon), current in zip(cells, blocks):
+            history.record(lat, lon, current)
+    return blocks
+
+def fetch_chunk(keys, cache=forecast_cache, record=True):
+    """
+    Fetches one chunk of forecast keys into `cache`. Returns {key: current}.
+    """
+    blocks = fetch_current_many([(key[0], key[1]) for key in keys], record)
+    cache.store_many(zip(keys, blocks))
+    return dict(zip(keys, blocks))
+
+def refresh_chunk(keys, cache=forecast_cache, record=True):
+    """
+    Background refresh of stale keys that were claimed by a batch request.
+    """
+    started = time.perf_counter()
+    ok = True
+    try:
+        fetch_chunk(keys, cache, record)
+    except (requests.exceptions.RequestException, ValueError):
+        ok = False
+    elapsed = time.perf_counter() - started
+    for key in keys:
+        cache.finish_refresh(key, elapsed, ok)
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _resolve_or_error(city):
+    try:
+        return resolve_location(city), None
+    except RateLimitedError:
+        return None, UPSTREAM_BUSY
+    except requests.exceptions.RequestException:
+        return None, LOCATION_FAILED
+
+def get_currents(keys, cache=forecast_cache, record=True):
+    """
+    `current` blocks for many forecast keys, at batch priority, read from
+    and stored into `cache`; `record` adds fetched blocks to the history.
+    Returns (currents, expired, stale, failed): {key: current} for every key
+    served, the set of those served from expired cache entries, the set of
+    those served as last known values, and {key: error_message} for the rest.
+    The cache is read with one multi-get; expired keys are refreshed in the
+    background at prefetch priority and missing keys are fetched with chunked
+    multi-location calls. When upstream refuses or fails, anything still held
+    for a key is served instead, as stale.
+    """
+    currents = {}
+    expired = set()
+    stale = set()
+    missing = []
+    keys = list(dict.fromkeys(keys))
+    for key, (current, status) in zip(keys, cache.lookup_many(keys)):
+        if status == "miss":
+            missing.append(key)
+            continue
+        currents[key] = current
+        if status == "stale":
+            expired.add(key)
+
+    refresh = [key for key in expired if cache.claim_refresh(key)]
+    for chunk in chunked(refresh, BATCH_CHUNK_SIZE):
+        threading.Thread(target=with_priority, args=(PREFETCH, refresh_chunk, chunk, cache, record),
+                         daemon=True).start()
+
+    pool = get_batch_pool()
+    failed = {}
+    chunks = list(chunked(missing, BATCH_CHUNK_SIZE))
+    futures = [pool.submit(tracing.bind(with_priority), BATCH, fetch_chunk, chunk, cache, record)
+               for chunk in chunks]
+    for chunk, future in zip(chunks, futures):
+        try:
+            currents.update(future.result())
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # Shed load or ride out the outage on anything still held.
+            for key in chunk:
+                current = last_known(key, e, cache)
+                if current is None:
+                    failed[key] = UPSTREAM_BUSY if isinstance(e, RateLimitedError) else WEATHER_FAILED
+                else:
+                    currents[key] = current
+                    stale.add(key)
+    return currents, expired, stale, failed
+
+def parse_batch_cities(cities):
+    """
+    Validates the cities of a /weather/batch request: the comma-separated
+    query value, or what the JSON body holds under "cities" (None if the
+    body is not a JSON object). Returns (cities, None) or (None, error_message).
+    """
+    if isinstance(cities, str):
+        cities = cities.split(',')
+    elif not isinstance(cities, list):
+        return None, "JSON body must contain a 'cities' list"
+    cities = [str(city).strip() for city in cities if str(city).strip()]
+    if not cities:
+        return None, "At least one city is required"
+    if len(cities) > BATCH_MAX_CITIES:
+        return None, f"At most {BATCH_MAX_CITIES} cities per request"
+    return cities, None
+
+def get_weather_batch(cities):
+    """
+    Fetches weather for many cities at once.
+    Returns {city: (Weather, None) or (None, error_message)} in input order.
+    Cities are geocoded in parallel through the geocoding cache, at batch
+    priority, after one multi-get has warmed the cache; forecasts come from
+    get_currents().
+    """
+    pool = get_batch_pool()
+    cities = list(dict.fromkeys(cities))
+    geocode_cache.warm(city for city in cities if gazetteer.lookup(city) is None)
+    locations = dict(zip(cities, pool.map(tracing.bind(partial(with_priority, BATCH, _resolve_or_error)), cities)))
+    currents, expired, stale, failed = get_currents(
+        cache_key(location.latitude, location.longitude, CURRENT_VARIABLES)
+        for location, error in locations.values() if location is not None)
+
+    results = {}
+    for city in cities:
+        location, error = locations[city]
+        if location is None:
+            results[city] = (None, error or LOCATION_NOT_FOUND.format(city=city))
+            continue
+        key = cache_key(location.latitude, location.longitude, CURRENT_VARIABLES)
+        if key in failed:
+            results[city] = (None, failed[key])
+        else:
+            results[city] = (Weather.from_current(location, currents[key], key in stale), None)
+    return results
\ No newline at end of file
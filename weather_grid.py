@@ -0,0 +1,317 @@
+import array
+import base64
+import math
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from cache_backends import make_backend
+from forecast_cache import GRID_RESOLUTION, ForecastCache, cache_key, next_update
+from json_codec import codec
+from weather_core import CURRENT_VARIABLES, get_currents
+
+# --- Weather Grids for Map Overlays ---
+# /weather/grid?bbox=west,south,east,north&res=0.5 returns the current
+# conditions at every point of a regular lat/lon grid covering the box, as
+# dense float32 arrays a map client can upload straight into a texture or
+# typed array. Grid points are multiples of `res`, itself a multiple of the
+# forecast cache's 0.1° cell, so every point is a forecast cache key. They
+# live in a forecast cache of their own, sized for a couple of the largest
+# requests, so that a map sweeping the world cannot evict the cells behind
+# city lookups; points already fetched for other grids are reused, and
+# missing ones are fetched with chunked multi-location calls. Grid points are
+# not added to the observation history.
+#
+# Answered points also go into a spatial index: 1°x1° tiles holding dense
+# columns for their 10x10 cells. Panning or zooming a map sends mostly the
+# same points again, and those are copied out of a handful of tiles without
+# touching the cache, until the next upstream update expires them.
+#
+# Two output formats, rows north to south and columns west to east:
+#   json    {"bbox", "res", "rows", "cols", "variables": {name: {"dtype":
+#           "<f4", "data": base64}}, ...}; NaN marks points without data.
+#   binary  BINARY_MAGIC, uint32 header length, the same JSON header with
+#           each column's offset and length, then the float32 columns.
+
+GRID_VARIABLES = tuple(CURRENT_VARIABLES.split(','))
+UNITS = {'temperature_2m': "°C", 'relative_humidity_2m': "%", 'weather_code': "wmo", 'wind_speed_10m': "m/s"}
+DEFAULT_RES = 0.5
+MAX_STEPS = 50                 # coarsest grid: 50 cells, i.e. 5°
+MAX_POINTS = 4096              # per request, e.g. 64 x 64; the world at 5° is 37 x 73
+TILE_SIZE = 10                 # cells per tile side (1°)
+MAX_TILES = 2048               # 2400 bytes each, about 5 MB
+GRID_CACHE_ENTRIES = 2 * MAX_POINTS
+FORMATS = ("json", "binary")
+BINARY_MAGIC = b"WPGR"
+BINARY_CONTENT_TYPE = "application/vnd.weatherpy.grid"
+NAN = float("nan")
+
+
+def parse_options(bbox, res, fmt):
+    """
+    Validates /weather/grid query values (strings or None).
+    Returns (Grid, fmt, None) or (None, None, error_message).
+    """
+    try:
+        west, south, east, north = (float(part) for part in (bbox or "").split(","))
+    except ValueError:
+        return None, None, "bbox must be west,south,east,north in degrees"
+    if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+        return None, None, "bbox must satisfy -180 <= west <= east <= 180 and -90 <= south <= north <= 90"
+    try:
+        res = DEFAULT_RES if res in (None, "") else float(res)
+    except ValueError:
+        res = 0.0
+    if not math.isfinite(res):   # nan, inf and 1e400 cannot be rounded to cells
+        res = 0.0
+    steps = round(res / GRID_RESOLUTION)
+    if not 1 <= steps <= MAX_STEPS or abs(steps * GRID_RESOLUTION - res) > 1e-9:
+        return None, None, (f"res must be a multiple of {GRID_RESOLUTION} between "
+                            f"{GRID_RESOLUTION} and {MAX_STEPS * GRID_RESOLUTION:g}")
+    grid = Grid.covering(west, south, east, north, steps)
+    if grid.rows * grid.cols > MAX_POINTS:
+        return None, None, f"bbox has {grid.rows * grid.cols} points at this res; at most {MAX_POINTS} allowed"
+    fmt = fmt or "json"
+    if fmt not in FORMATS:
+        return None, None, f"format must be one of {', '.join(FORMATS)}"
+    return grid, fmt, None
+
+
+class Grid:
+    """
+    Points of a regular grid in integer cell units (multiples of
+    GRID_RESOLUTION): rows from `top` down, columns from `left` eastwards,
+    `steps` cells apart.
+    """
+    __slots__ = ("top", "left", "rows", "cols", "steps")
+
+    def __init__(self, top, left, rows, cols, steps):
+        self.top = top
+        self.left = left
+        self.rows = rows
+        self.cols = cols
+        self.steps = steps
+
+    @classmethod
+    def covering(cls, west, south, east, north, steps):
+        """
+        Smallest grid of multiples of `steps` cells that covers the box.
+        """
+        res = steps * GRID_RESOLUTION
+        bottom = max(math.floor(south / res + 1e-9), math.ceil(-90 / res - 1e-9))
+        top = min(math.ceil(north / res - 1e-9), math.floor(90 / res + 1e-9))
+        left = max(math.floor(west / res + 1e-9), math.ceil(-180 / res - 1e-9))
+        right = min(math.ceil(east / res - 1e-9), math.floor(180 / res + 1e-9))
+        return cls(top * steps, left * steps, top - bottom + 1, right - left + 1, steps)
+
+    @property
+    def res(self):
+        return round(self.steps * GRID_RESOLUTION, 4)
+
+    def row_cells(self):
+        return [self.top - row * self.steps for row in range(self.rows)]
+
+    def col_cells(self):
+        return [self.left + col * self.steps for col in range(self.cols)]
+
+    def bbox(self):
+        """
+        [west, south, east, north] of the outermost points.
+        """
+        res = GRID_RESOLUTION
+        bottom = self.top - (self.rows - 1) * self.steps
+        right = self.left + (self.cols - 1) * self.steps
+        return [round(self.left * res, 4), round(bottom * res, 4), round(right * res, 4), round(self.top * res, 4)]
+
+
+def cell_key(row_cell, col_cell):
+    """
+    Forecast cache key of a grid point, the same one a city there would use.
+    """
+    return cache_key(row_cell * GRID_RESOLUTION, col_cell * GRID_RESOLUTION, CURRENT_VARIABLES)
+
+
+class Tile:
+    """
+    Current conditions of the TILE_SIZE x TILE_SIZE cells of one tile.
+    """
+    __slots__ = ("columns", "expires")
+
+    def __init__(self):
+        size = TILE_SIZE * TILE_SIZE
+        self.columns = {name: array.array('f', [NAN]) * size for name in GRID_VARIABLES}
+        self.expires = array.array('d', [0.0]) * size
+
+
+class GridIndex:
+    """
+    Spatial index of answered grid cells: an LRU of tiles keyed by
+    (row_cell // TILE_SIZE, col_cell // TILE_SIZE).
+    """
+
+    def __init__(self, cache, max_tiles=MAX_TILES):
+        self.cache = cache
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "points": 0, "index_hits": 0, "cache_lookups": 0, "failed": 0}
+
+    def fill(self, grid, columns, now=None):
+        """
+        Copies the indexed, unexpired points of `grid` into `columns`
+        ({name: array}, row-major). Returns the (position, row_cell,
+        col_cell) of every point it could not fill.
+        """
+        now = time.time() if now is None else now
+        # Group columns by tile once; each row then visits a few tiles only.
+        col_groups = OrderedDict()
+        for col, col_cell in enumerate(grid.col_cells()):
+            tile_col, offset = divmod(col_cell, TILE_SIZE)
+            col_groups.setdefault(tile_col, []).append((col, col_cell, offset))
+        missing = []
+        with self._lock:
+            for row, row_cell in enumerate(grid.row_cells()):
+                tile_row, row_offset = divmod(row_cell, TILE_SIZE)
+                base = row * grid.cols
+                for tile_col, cols in col_groups.items():
+                    tile = self._tiles.get((tile_row, tile_col))
+                    if tile is not None:
+                        self._tiles.move_to_end((tile_row, tile_col))
+                    for col, col_cell, offset in cols:
+                        slot = row_offset * TILE_SIZE + offset
+                        if tile is None or tile.expires[slot] <= now:
+                            missing.append((base + col, row_cell, col_cell))
+                            continue
+                        for name, column in columns.items():
+                            column[base + col] = tile.columns[name][slot]
+        return missing
+
+    def store(self, cells, expires):
+        """
+        Indexes `current` blocks: [(row_cell, col_cell, current)].
+        """
+        with self._lock:
+            for row_cell, col_cell, current in cells:
+                tile_row, row_offset = divmod(row_cell, TILE_SIZE)
+                tile_col, col_offset = divmod(col_cell, TILE_SIZE)
+                tile = self._tiles.get((tile_row, tile_col))
+                if tile is None:
+                    tile = self._tiles[(tile_row, tile_col)] = Tile()
+                    while len(self._tiles) > self.max_tiles:
+                        self._tiles.popitem(last=False)
+                slot = row_offset * TILE_SIZE + col_offset
+                for name in GRID_VARIABLES:
+                    tile.columns[name][slot] = _float(current.get(name))
+                tile.expires[slot] = expires
+
+    def lookup(self, grid):
+        """
+        Current conditions at every point of `grid`.
+        Returns ({name: array('f')}, points_without_data, seconds_valid).
+        """
+        columns = {name: array.array('f', [NAN]) * (grid.rows * grid.cols) for name in GRID_VARIABLES}
+        now = time.time()
+        missing = self.fill(grid, columns, now)
+        expires = next_update(now, self.cache.interval)
+        expired, stale, failed = set(), set(), {}
+        if missing:
+            keys = [cell_key(row_cell, col_cell) for position, row_cell, col_cell in missing]
+            currents, expired, stale, failed = get_currents(keys, self.cache, record=False)
+            fresh = []
+            for key, (position, row_cell, col_cell) in zip(keys, missing):
+                current = currents.get(key)
+                if current is None:
+                    continue
+                for name, column in columns.items():
+                    column[position] = _float(current.get(name))
+                if key not in expired and key not in stale:
+                    fresh.append((row_cell, col_cell, current))
+            # Fresh blocks all expire at the next upstream update.
+            self.store(fresh, expires)
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["points"] += grid.rows * grid.cols
+            self.stats["index_hits"] += grid.rows * grid.cols - len(missing)
+            self.stats["cache_lookups"] += len(missing)
+            self.stats["failed"] += len(failed)
+        seconds_valid = 0 if expired or stale or failed else expires - now
+        return columns, len(failed), seconds_valid
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["tiles"] = len(self._tiles)
+        stats["cache_entries"] = len(self.cache.backend)
+        stats["index_hit_ratio"] = round(stats["index_hits"] / stats["points"], 4) if stats["points"] else 0.0
+        return stats
+
+
+def _float(value):
+    return NAN if value is None else float(value)
+
+
+def _column_bytes(column):
+    if sys.byteorder != 'little':
+        column = array.array('f', column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _header(grid, missing):
+    return {
+        "bbox": grid.bbox(),
+        "res": grid.res,
+        "rows": grid.rows,
+        "cols": grid.cols,
+        "order": "rows north to south, columns west to east",
+        "units": {name: UNITS[name] for name in GRID_VARIABLES},
+        "missing": missing,
+    }
+
+
+def to_json(grid, columns, missing):
+    """
+    JSON document with base64 little-endian float32 arrays.
+    """
+    document = _header(grid, missing)
+    document["variables"] = {
+        name: {"dtype": "<f4", "data": base64.b64encode(_column_bytes(column)).decode("ascii")}
+        for name, column in columns.items()
+    }
+    return codec.dumps(document)
+
+
+def to_binary(grid, columns, missing):
+    """
+    Binary document: magic, header length, JSON header, float32 columns.
+    """
+    header = _header(grid, missing)
+    header["columns"] = []
+    blobs = []
+    offset = 0
+    for name, column in columns.items():
+        header["columns"].append({"name": name, "dtype": "<f4", "offset": offset, "length": len(column)})
+        blob = _column_bytes(column)
+        blobs.append(blob)
+        offset += len(blob)
+    header_bytes = codec.dumps(header)
+    # Pad the header so the float32 columns start 4-byte aligned.
+    header_bytes += b" " * (-(len(header_bytes) + 8) % 4)
+    return BINARY_MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes + b"".join(blobs)
+
+
+def grid_document(grid, fmt="json"):
+    """
+    Returns (content_type, body, seconds_valid) for a /weather/grid request.
+    """
+    columns, missing, seconds_valid = grid_index.lookup(grid)
+    if fmt == "binary":
+        return BINARY_CONTENT_TYPE, to_binary(grid, columns, missing), seconds_valid
+    return "application/json", to_json(grid, columns, missing), seconds_valid
+
+
+# Shared instances used by the web front-ends.
+grid_cache = ForecastCache(GRID_CACHE_ENTRIES, backend=make_backend("grid", GRID_CACHE_ENTRIES))
+grid_index = GridIndex(grid_cache)
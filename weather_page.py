@@ -0,0 +1,278 @@
+from http_cache import StaticAsset
+
+# --- HTML, CSS, and JavaScript for the Frontend ---
+# This is all embedded in a single string so every server front-end
+# (Flask and ASGI) serves the same page. It uses the system font stack
+# (Poppins only if installed locally), so the page makes no third-party
+# requests.
+
+HTML_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>WeatherPy Web</title>
+    <style>
+        :root {
+            --bg-color: #1a202c;
+            --card-color: #2d3748;
+            --text-color: #e2e8f0;
+            --primary-color: #4299e1;
+            --border-color: #4a5568;
+        }
+
+        * {
+            margin: 0;
+            padding: 0;
+            box-sizing: border-box;
+        }
+
+        body {
+            font-family: 'Poppins', system-ui, -apple-system, 'Segoe UI', Roboto, sans-serif;
+            background: var(--bg-color);
+            color: var(--text-color);
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            min-height: 100vh;
+            padding: 20px;
+        }
+
+        .weather-card {
+            background: var(--card-color);
+            padding: 40px;
+            border-radius: 20px;
+            box-shadow: 0 10px 30px rgba(0, 0, 0, 0.2);
+            width: 100%;
+            max-width: 450px;
+            text-align: center;
+            transition: all 0.3s ease;
+        }
+
+        .weather-card h1 {
+            font-size: 2rem;
+            margin-bottom: 20px;
+            font-weight: 600;
+        }
+
+        .search-form {
+            display: flex;
+            gap: 10px;
+            margin-bottom: 30px;
+        }
+
+        .search-form input {
+            flex-grow: 1;
+            padding: 12px 15px;
+            border: 1px solid var(--border-color);
+            border-radius: 10px;
+            background: #1a202c;
+            color: var(--text-color);
+            font-size: 1rem;
+            outline: none;
+            transition: border-color 0.3s ease;
+        }
+
+        .search-form input:focus {
+            border-color: var(--primary-color);
+        }
+
+        .search-form button {
+            padding: 12px 20px;
+            border: none;
+            border-radius: 10px;
+            background: var(--primary-color);
+            color: white;
+            font-size: 1rem;
+            font-weight: 500;
+            cursor: pointer;
+            transition: background-color 0.3s ease;
+        }
+
+        .search-form button:hover {
+            background: #3182ce;
+        }
+
+        .results-container {
+            opacity: 0;
+            transform: translateY(20px);
+            transition: opacity 0.5s ease, transform 0.5s ease;
+            height: 0;
+            overflow: hidden;
+        }
+        
+        .results-container.visible {
+            opacity: 1;
+            transform: translateY(0);
+            height: auto;
+        }
+
+        #status {
+            margin-bottom: 20px;
+            font-size: 0.9rem;
+            color: #a0aec0;
+        }
+        
+        #location {
+            font-size: 1.5rem;
+            font-weight: 500;
+            margin-bottom: 10px;
+        }
+        
+        #temperature {
+            font-size: 4rem;
+            font-weight: 700;
+            margin: 10px 0;
+        }
+        
+        #description {
+            font-size: 1.2rem;
+            font-weight: 400;
+            text-transform: capitalize;
+            margin-bottom: 20px;
+        }
+        
+        .details {
+            display: flex;
+            justify-content: space-around;
+            text-align: center;
+            margin-top: 20px;
+        }
+        
+        .detail-item p:first-child {
+            font-size: 0.9rem;
+            color: #a0aec0;
+        }
+        
+        .detail-item p:last-child {
+            font-size: 1.1rem;
+            font-weight: 500;
+        }
+
+    </style>
+</head>
+<body>
+    <div class="weather-card">
+        <h1>WeatherPy</h1>
+        <form id="weather-form" class="search-form">
+            <input type="text" id="city-input" placeholder="Enter a city name..." list="city-suggestions" autocomplete="off" required>
+            <datalist id="city-suggestions"></datalist>
+            <button type="submit">Search</button>
+        </form>
+        
+        <div id="status">Enter a city to get the weather forecast.</div>
+        
+        <div id="results" class="results-container">
+            <p id="location"></p>
+            <p id="temperature"></p>
+            <p id="description"></p>
+            <div class="details">
+                <div class="detail-item">
+                    <p>Humidity</p>
+                    <p id="humidity"></p>
+                </div>
+                <div class="detail-item">
+                    <p>Wind Speed</p>
+                    <p id="wind"></p>
+                </div>
+            </div>
+        </div>
+    </div>
+
+    <script>
+        // --- Autocomplete: debounced calls to /suggest ---
+        const cityInput = document.getElementById('city-input');
+        const suggestionsEl = document.getElementById('city-suggestions');
+        let suggestTimer = null;
+        let suggestController = null;
+
+        cityInput.addEventListener('input', function() {
+            clearTimeout(suggestTimer);
+            const query = cityInput.value.trim();
+            if (query.length < 2) {
+                suggestionsEl.innerHTML = '';
+                return;
+            }
+            suggestTimer = setTimeout(async function() {
+                // Only the latest keystroke's request matters.
+                if (suggestController) suggestController.abort();
+                suggestController = new AbortController();
+                try {
+                    const response = await fetch(`/suggest?q=${encodeURIComponent(query)}`, { signal: suggestController.signal });
+                    const data = await response.json();
+                    suggestionsEl.innerHTML = '';
+                    for (const item of data.suggestions || []) {
+                        const option = document.createElement('option');
+                        option.value = item.name;
+                        option.label = item.label;
+                        suggestionsEl.appendChild(option);
+                    }
+                } catch (error) {
+                    // Aborted or failed suggestions are simply not shown.
+                }
+            }, 150);
+        });
+
+        // --- Live updates: /weather/stream pushes new values as they are published ---
+        let liveStream = null;
+
+        function showWeather(data) {
+            document.getElementById('location').textContent = data.city;
+            document.getElementById('temperature').textContent = data.temperature;
+            document.getElementById('description').textContent = data.description;
+            document.getElementById('humidity').textContent = data.humidity;
+            document.getElementById('wind').textContent = data.wind;
+            // Last known values, served while the weather service is unreachable.
+            document.getElementById('status').textContent =
+                data.stale ? `Last known values, observed ${data.observed} GMT` : '';
+        }
+
+        function watchCity(city) {
+            if (!window.EventSource) return;
+            liveStream = new EventSource(`/weather/stream?city=${encodeURIComponent(city)}`);
+            liveStream.addEventListener('weather', function(event) {
+                showWeather(JSON.parse(event.data));
+            });
+        }
+
+        document.getElementById('weather-form').addEventListener('submit', async function(e) {
+            e.preventDefault();
+            const city = document.getElementById('city-input').value;
+            const statusEl = document.getElementById('status');
+            const resultsEl = document.getElementById('results');
+
+            // Reset UI
+            if (liveStream) {
+                liveStream.close();
+                liveStream = null;
+            }
+            statusEl.textContent = `Searching for ${city}...`;
+            resultsEl.classList.remove('visible');
+
+            try {
+                const response = await fetch(`/weather?city=${encodeURIComponent(city)}`);
+                const data = await response.json();
+
+                if (data.error) {
+                    throw new Error(data.error);
+                }
+
+                // Update UI with data
+                statusEl.textContent = '';
+                showWeather(data);
+                resultsEl.classList.add('visible');
+                watchCity(city);
+
+            } catch (error) {
+                statusEl.textContent = `Error: ${error.message}`;
+            }
+        });
+    </script>
+</body>
+</html>
+"""
+
+# The page has no template logic, so it is encoded and compressed once at
+# import time and served as static bytes.
+INDEX_PAGE = StaticAsset(HTML_TEMPLATE, "text/html; charset=utf-8")
\ No newline at end of file
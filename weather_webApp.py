@@ -1,325 +1,301 @@
-import requests
-from flask import Flask, request, jsonify, render_template_string
+import os
+import time
+
+from flask import Flask, Response, g, request
+
+import forecast_series
+import history_store
+import weather_grid
+import http_cache
+import http_client
+import metrics
+import profiler
+import tracing
+from forecast_cache import forecast_cache
+from geocache import geocode_cache
+from governor import governor
+from json_codec import codec
+from live_updates import (BUSY_BODY, BUSY_RETRY, HEARTBEAT, KEEPALIVE, PREAMBLE, STREAM_HEADERS, StreamLimit,
+                          Subscription, stream_hub)
+from metrics import stage
+from prefetch import prefetcher
+from snapshot import snapshotter
+from suggest import suggest_index
+from weather_core import (forecast_flight, forecast_ttl, geocode_flight, get_forecast, get_weather, get_weather_batch,
+                          locate, parse_batch_cities, weather_flight, weather_ttl)
+from weather_page import INDEX_PAGE
 
 # --- Flask App Initialization ---
 app = Flask(__name__)
 
-# --- Data Fetching and Processing Logic (from previous version) ---
-
-def get_weather_description(code):
-    """
-    Converts WMO weather code to a human-readable description.
-    """
-    codes = {
-        0: "Clear sky", 1: "Mainly clear", 2: "Partly cloudy", 3: "Overcast",
-        45: "Fog", 48: "Depositing rime fog",
-        51: "Drizzle: Light", 53: "Drizzle: Moderate", 55: "Drizzle: Dense",
-        56: "Freezing Drizzle: Light", 57: "Freezing Drizzle: Dense",
-        61: "Rain: Slight", 63: "Rain: Moderate", 65: "Rain: Heavy",
-        66: "Freezing Rain: Light", 67: "Freezing Rain: Heavy",
-        71: "Snow fall: Slight", 73: "Snow fall: Moderate", 75: "Snow fall: Heavy",
-        77: "Snow grains",
-        80: "Rain showers: Slight", 81: "Rain showers: Moderate", 82: "Rain showers: Violent",
-        85: "Snow showers: Slight", 86: "Snow showers: Heavy",
-        95: "Thunderstorm", 96: "Thunderstorm with slight hail", 99: "Thunderstorm with heavy hail",
-    }
-    return codes.get(code, "Unknown condition")
-
-def get_location_coords(city):
-    """
-    Converts a city name to latitude and longitude. Returns (lat, lon, full_name) or (None, None, None).
-    """
-    geocoding_url = "https://geocoding-api.open-meteo.com/v1/search"
-    params = {'name': city, 'count': 1, 'language': 'en', 'format': 'json'}
-    try:
-        response = requests.get(geocoding_url, params=params)
-        response.raise_for_status()
-        results = response.json().get('results')
-        if not results:
-            return None, None, None
-        location = results[0]
-        country = location.get('country', '')
-        admin1 = location.get('admin1', '')
-        full_name = f"{location.get('name', city.title())}, {admin1}, {country}".strip(", ")
-        return location['latitude'], location['longitude'], full_name
-    except requests.exceptions.RequestException:
-        return None, None, None
-
-def get_weather(city):
-    """
-    Fetches weather data and returns it as a dictionary.
-    Returns (data, None) on success, (None, error_message) on failure.
-    """
-    latitude, longitude, full_name = get_location_coords(city)
-    if latitude is None:
-        return None, f"Could not find location for '{city}'"
-
-    base_url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        'latitude': latitude,
-        'longitude': longitude,
-        'current': 'temperature_2m,relative_humidity_2m,weather_code,wind_speed_10m',
-        'wind_speed_unit': 'ms'
-    }
-    try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
-        weather_data = response.json()
-        current = weather_data.get('current', {})
-        
-        result = {
-            "city": full_name,
-            "description": get_weather_description(current.get('weather_code')),
-            "temperature": f"{current.get('temperature_2m')}°C",
-            "humidity": f"{current.get('relative_humidity_2m')}%",
-            "wind": f"{current.get('wind_speed_10m')} m/s"
-        }
-        return result, None
-    except (requests.exceptions.RequestException, KeyError) as e:
-        return None, f"Error fetching weather data."
-
-# --- HTML, CSS, and JavaScript for the Frontend ---
-# This is all embedded in a single string to keep it in one file.
-
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>WeatherPy Web</title>
-    <style>
-        @import url('https://fonts.googleapis.com/css2?family=Poppins:wght@300;400;500;600;700&display=swap');
-        
-        :root {
-            --bg-color: #1a202c;
-            --card-color: #2d3748;
-            --text-color: #e2e8f0;
-            --primary-color: #4299e1;
-            --border-color: #4a5568;
-        }
-
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-
-        body {
-            font-family: 'Poppins', sans-serif;
-            background: var(--bg-color);
-            color: var(--text-color);
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            min-height: 100vh;
-            padding: 20px;
-        }
-
-        .weather-card {
-            background: var(--card-color);
-            padding: 40px;
-            border-radius: 20px;
-            box-shadow: 0 10px 30px rgba(0, 0, 0, 0.2);
-            width: 100%;
-            max-width: 450px;
-            text-align: center;
-            transition: all 0.3s ease;
-        }
-
-        .weather-card h1 {
-            font-size: 2rem;
-            margin-bottom: 20px;
-            font-weight: 600;
-        }
-
-        .search-form {
-            display: flex;
-            gap: 10px;
-            margin-bottom: 30px;
-        }
-
-        .search-form input {
-            flex-grow: 1;
-            padding: 12px 15px;
-            border: 1px solid var(--border-color);
-            border-radius: 10px;
-            background: #1a202c;
-            color: var(--text-color);
-            font-size: 1rem;
-            outline: none;
-            transition: border-color 0.3s ease;
-        }
-
-        .search-form input:focus {
-            border-color: var(--primary-color);
-        }
-
-        .search-form button {
-            padding: 12px 20px;
-            border: none;
-            border-radius: 10px;
-            background: var(--primary-color);
-            color: white;
-            font-size: 1rem;
-            font-weight: 500;
-            cursor: pointer;
-            transition: background-color 0.3s ease;
-        }
-
-        .search-form button:hover {
-            background: #3182ce;
-        }
-
-        .results-container {
-            opacity: 0;
-            transform: translateY(20px);
-            transition: opacity 0.5s ease, transform 0.5s ease;
-            height: 0;
-            overflow: hidden;
-        }
-        
-        .results-container.visible {
-            opacity: 1;
-            transform: translateY(0);
-            height: auto;
-        }
-
-        #status {
-            margin-bottom: 20px;
-            font-size: 0.9rem;
-            color: #a0aec0;
-        }
-        
-        #location {
-            font-size: 1.5rem;
-            font-weight: 500;
-            margin-bottom: 10px;
-        }
-        
-        #temperature {
-            font-size: 4rem;
-            font-weight: 700;
-            margin: 10px 0;
-        }
-        
-        #description {
-            font-size: 1.2rem;
-            font-weight: 400;
-            text-transform: capitalize;
-            margin-bottom: 20px;
-        }
-        
-        .details {
-            display: flex;
-            justify-content: space-around;
-            text-align: center;
-            margin-top: 20px;
-        }
-        
-        .detail-item p:first-child {
-            font-size: 0.9rem;
-            color: #a0aec0;
-        }
-        
-        .detail-item p:last-child {
-            font-size: 1.1rem;
-            font-weight: 500;
-        }
-
-    </style>
-</head>
-<body>
-    <div class="weather-card">
-        <h1>WeatherPy</h1>
-        <form id="weather-form" class="search-form">
-            <input type="text" id="city-input" placeholder="Enter a city name..." required>
-            <button type="submit">Search</button>
-        </form>
-        
-        <div id="status">Enter a city to get the weather forecast.</div>
-        
-        <div id="results" class="results-container">
-            <p id="location"></p>
-            <p id="temperature"></p>
-            <p id="description"></p>
-            <div class="details">
-                <div class="detail-item">
-                    <p>Humidity</p>
-                    <p id="humidity"></p>
-                </div>
-                <div class="detail-item">
-                    <p>Wind Speed</p>
-                    <p id="wind"></p>
-                </div>
-            </div>
-        </div>
-    </div>
-
-    <script>
-        document.getElementById('weather-form').addEventListener('submit', async function(e) {
-            e.preventDefault();
-            const city = document.getElementById('city-input').value;
-            const statusEl = document.getElementById('status');
-            const resultsEl = document.getElementById('results');
-
-            // Reset UI
-            statusEl.textContent = `Searching for ${city}...`;
-            resultsEl.classList.remove('visible');
-
-            try {
-                const response = await fetch(`/weather?city=${encodeURIComponent(city)}`);
-                const data = await response.json();
-
-                if (data.error) {
-                    throw new Error(data.error);
-                }
-
-                // Update UI with data
-                statusEl.textContent = '';
-                document.getElementById('location').textContent = data.city;
-                document.getElementById('temperature').textContent = data.temperature;
-                document.getElementById('description').textContent = data.description;
-                document.getElementById('humidity').textContent = data.humidity;
-                document.getElementById('wind').textContent = data.wind;
-                
-                resultsEl.classList.add('visible');
-
-            } catch (error) {
-                statusEl.textContent = `Error: ${error.message}`;
-            }
-        });
-    </script>
-</body>
-</html>
-"""
+# Each open /weather/stream holds a worker thread; see live_updates.
+thread_streams = StreamLimit()
+
+# --- Request Instrumentation ---
+
+for _name, _stats in (("geocode", geocode_cache.get_stats), ("forecast", forecast_cache.get_stats)):
+    metrics.registry.add_collector(metrics.stats_collector("weatherpy_cache", _stats, {"cache": _name}))
+for _name, _flight in (("weather", weather_flight), ("geocode", geocode_flight), ("forecast", forecast_flight)):
+    metrics.registry.add_collector(metrics.stats_collector("weatherpy_coalescing", _flight.get_stats, {"flight": _name}))
+metrics.registry.add_collector(metrics.stats_collector("weatherpy_http_client", http_client.client.get_stats, {}))
+metrics.registry.add_collector(metrics.stats_collector("weatherpy_prefetch", prefetcher.get_stats, {}))
+metrics.registry.add_collector(metrics.stats_collector("weatherpy_governor", governor.get_stats, {}))
+metrics.registry.add_collector(metrics.stats_collector("weatherpy_streams", stream_hub.get_stats, {}))
+metrics.registry.add_collector(metrics.stats_collector("weatherpy_thread_streams", thread_streams.get_stats, {}))
+metrics.registry.add_collector(metrics.stats_collector("weatherpy_history", history_store.history.get_stats, {}))
+metrics.registry.add_collector(metrics.stats_collector("weatherpy_grid", weather_grid.grid_index.get_stats, {}))
+metrics.registry.add_collector(metrics.stats_collector("weatherpy_tracing", tracing.tracer.get_stats, {}))
+metrics.registry.add_collector(metrics.stats_collector("weatherpy_snapshot", snapshotter.get_stats, {}))
+metrics.registry.add_collector(metrics.stats_collector("weatherpy_profiler", profiler.profiler.get_stats, {}))
+metrics.registry.add_collector(metrics.stats_collector("weatherpy_json", codec.get_stats, {}))
+
+@app.before_request
+def start_request_timer():
+    snapshotter.ensure_started()
+    prefetcher.ensure_started()
+    g.request_started = time.perf_counter()
+    g.trace = tracing.tracer.start_request(request.method, request.path)
+    metrics.IN_FLIGHT.inc()
+
+@app.after_request
+def record_request(response):
+    endpoint = request.endpoint or "unknown"
+    metrics.REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, endpoint=endpoint)
+    g.status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request(exc):
+    if 'request_started' in g:
+        metrics.IN_FLIGHT.dec()
+    # Unhandled exceptions skip after_request and end up as a 500.
+    tracing.tracer.end_request(g.pop('trace', None), g.get('status', 500), request.endpoint)
+
+def json_response(payload, status=200):
+    """Encodes a JSON response body with the shared codec."""
+    return Response(codec.dumps(payload), status=status, content_type="application/json")
 
 # --- Flask Routes ---
 
 @app.route('/')
 def index():
-    """Serves the main HTML page."""
-    return render_template_string(HTML_TEMPLATE)
+    """Serves the pre-rendered HTML page, compressed and with validators."""
+    status, headers, body = INDEX_PAGE.respond(request.headers.get('If-None-Match'),
+                                               request.headers.get('Accept-Encoding'))
+    return Response(body, status=status, headers=headers)
 
 @app.route('/weather')
 def weather_endpoint():
     """API endpoint to get weather data."""
     city = request.args.get('city')
     if not city:
-        return jsonify({"error": "City parameter is required"}), 400
+        return json_response({"error": "City parameter is required"}, 400)
     
     weather_data, error = get_weather(city)
     
     if error:
-        return jsonify({"error": error}), 404
-        
-    return jsonify(weather_data)
+        return json_response({"error": error}, 404)
+    prefetcher.record(weather_data)
+
+    with stage("serialize"):
+        body = codec.dumps(weather_data.as_dict())
+    # Cacheable until the forecast behind it is due for refresh.
+    status, headers, body = http_cache.conditional(
+        body, "application/json", http_cache.max_age_header(weather_ttl(weather_data)),
+        request.headers.get('If-None-Match'))
+    return Response(body, status=status, headers=headers)
+
+@app.route('/weather/stream')
+def weather_stream_endpoint():
+    """
+    Server-sent events with live weather: /weather/stream?city=Paris
+    Each open stream holds a worker thread, so past thread_streams' limit
+    new watchers get a 503; the ASGI server scales further.
+    """
+    city = request.args.get('city')
+    if not city:
+        return json_response({"error": "City parameter is required"}, 400)
+    location, error = locate(city)
+    if error:
+        return json_response({"error": error}, 404)
+
+    if not thread_streams.acquire():
+        headers = STREAM_HEADERS + [("Retry-After", str(BUSY_RETRY))]
+        return Response(BUSY_BODY, status=503, headers=headers)
+    subscription = Subscription()
+
+    def events():
+        stream_hub.subscribe(location, subscription)
+        try:
+            yield PREAMBLE
+            while True:
+                yield subscription.next(HEARTBEAT) or KEEPALIVE
+        finally:
+            stream_hub.unsubscribe(location, subscription)
+
+    response = Response(events(), headers=STREAM_HEADERS)
+    # Runs even if the client leaves before the stream has started.
+    response.call_on_close(thread_streams.release)
+    return response
+
+@app.route('/weather/grid')
+def weather_grid_endpoint():
+    """
+    Current conditions on a lat/lon grid, for map overlays:
+    /weather/grid?bbox=west,south,east,north&res=0.5&format=json|binary
+    """
+    grid, fmt, error = weather_grid.parse_options(
+        request.args.get('bbox'), request.args.get('res'), request.args.get('format'))
+    if error:
+        return json_response({"error": error}, 400)
+
+    with stage("grid"):
+        content_type, body, seconds_valid = weather_grid.grid_document(grid, fmt)
+    status, headers, body = http_cache.conditional(
+        body, content_type, http_cache.max_age_header(seconds_valid), request.headers.get('If-None-Match'))
+    return Response(body, status=status, headers=headers)
+
+@app.route('/forecast')
+def forecast_endpoint():
+    """
+    API endpoint for hourly and daily series:
+    /forecast?city=Paris&days=7&units=metric|imperial&format=json|binary
+    """
+    city = request.args.get('city')
+    if not city:
+        return json_response({"error": "City parameter is required"}, 400)
+    days, units, fmt, error = forecast_series.parse_options(
+        request.args.get('days'), request.args.get('units'), request.args.get('format'))
+    if error:
+        return json_response({"error": error}, 400)
+
+    forecast, error = get_forecast(city, days)
+    if error:
+        return json_response({"error": error}, 404)
+
+    with stage("serialize"):
+        content_type, body = forecast_series.serialize(
+            forecast.location, forecast.series, units, fmt, forecast.stale)
+    status, headers, body = http_cache.conditional(
+        body, content_type, http_cache.max_age_header(forecast_ttl(forecast)),
+        request.headers.get('If-None-Match'))
+    return Response(body, status=status, headers=headers)
+
+@app.route('/history')
+def history_endpoint():
+    """
+    Past observations from the local history store:
+    /history?city=Paris&start=2024-01-01&end=2024-02-01&step=1h
+    """
+    city = request.args.get('city')
+    if not city:
+        return json_response({"error": "City parameter is required"}, 400)
+    start, end, step, error = history_store.parse_options(
+        request.args.get('start'), request.args.get('end'), request.args.get('step'))
+    if error:
+        return json_response({"error": error}, 400)
+    location, error = locate(city)
+    if error:
+        return json_response({"error": error}, 404)
+
+    with stage("history"):
+        body = history_store.history_document(location, start, end, step)
+    status, headers, body = http_cache.conditional(
+        body, "application/json", http_cache.max_age_header(history_store.max_age(end)),
+        request.headers.get('If-None-Match'))
+    return Response(body, status=status, headers=headers)
+
+@app.route('/weather/batch', methods=['GET', 'POST'])
+def weather_batch_endpoint():
+    """
+    API endpoint to get weather for many cities: either
+    GET /weather/batch?cities=Paris,Berlin or POST {"cities": [...]}.
+    """
+    if request.method == 'POST':
+        payload = request.get_json(silent=True)
+        cities = payload.get('cities') if isinstance(payload, dict) else None
+    else:
+        cities = request.args.get('cities') or ''
+    cities, error = parse_batch_cities(cities)
+    if error:
+        return json_response({"error": error}, 400)
+
+    results = []
+    for city, (weather_data, error) in get_weather_batch(cities).items():
+        if error:
+            results.append({"query": city, "error": error})
+        else:
+            prefetcher.record(weather_data)
+            results.append({"query": city, "weather": weather_data.as_dict()})
+    with stage("serialize"):
+        return json_response({"results": results})
+
+@app.route('/suggest')
+def suggest_endpoint():
+    """City autocomplete, served from memory."""
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', 8, type=int)
+    return json_response({"suggestions": suggest_index.suggest(query, limit)})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics in text exposition format."""
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/admin/profile')
+def profile_endpoint():
+    """
+    Samples this worker's stacks for a while and returns them collapsed,
+    for flame graphs: /admin/profile?seconds=10&interval_ms=5&idle=0
+    """
+    authorized = profiler.admin_authorized(request.headers.get('Authorization'))
+    if authorized is None:
+        return json_response({"error": "Not found"}, 404)
+    if not authorized:
+        return json_response({"error": "Unauthorized"}, 401)
+    seconds, interval, include_idle, error = profiler.parse_options(
+        request.args.get('seconds'), request.args.get('interval_ms'), request.args.get('idle'))
+    if error:
+        return json_response({"error": error}, 400)
+    try:
+        body = profiler.profiler.collapsed(seconds, interval, include_idle)
+    except profiler.ProfileBusyError as e:
+        return json_response({"error": str(e)}, 409)
+    return Response(body, content_type=profiler.COLLAPSED_CONTENT_TYPE)
+
+@app.route('/stats')
+def stats_endpoint():
+    """Reports cache hit/miss counters."""
+    return json_response({
+        "geocode_cache": geocode_cache.get_stats(),
+        "forecast_cache": forecast_cache.get_stats(),
+        "upstream": http_client.client.get_stats(),
+        "prefetch": prefetcher.get_stats(),
+        "governor": governor.get_stats(),
+        "streams": stream_hub.get_stats(),
+        "thread_streams": thread_streams.get_stats(),
+        "history": history_store.history.get_stats(),
+        "grid": weather_grid.grid_index.get_stats(),
+        "tracing": tracing.tracer.get_stats(),
+        "snapshot": snapshotter.get_stats(),
+        "profiler": profiler.profiler.get_stats(),
+        "json": codec.get_stats(),
+        "coalescing": {
+            "weather": weather_flight.get_stats(),
+            "geocode": geocode_flight.get_stats(),
+            "forecast": forecast_flight.get_stats(),
+        },
+    })
 
 
 # --- Main Execution ---
 
+# Development server only; use `python serve.py` in production.
+DEBUG = os.environ.get("WEATHERPY_DEBUG", "0") == "1"
+
 if __name__ == "__main__":
-    print("Starting Flask server...")
+    print("Starting Flask development server...")
     print("Open your web browser and go to http://127.0.0.1:5000")
-    app.run(debug=True)
+    app.run(debug=DEBUG)
     
\ No newline at end of file